@@ -1,7 +1,7 @@
 import os
 
 from django.core.asgi import get_asgi_application
-from channels.routing import ProtocolTypeRouter, URLRouter
+from channels.routing import ChannelNameRouter, ProtocolTypeRouter, URLRouter
 from channels.auth import AuthMiddlewareStack
 from mail_app import routing
 
@@ -11,5 +11,6 @@ application = ProtocolTypeRouter(
     {
         "http": get_asgi_application(),
         "websocket": AuthMiddlewareStack(URLRouter(routing.websocket_urlpatterns)),
+        "channel": ChannelNameRouter(routing.channel_routes),
     }
 )
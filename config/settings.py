@@ -1,10 +1,11 @@
+import json
 import os
 from dotenv import load_dotenv
 from pathlib import Path
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 MEDIA_URL = "/media/"
-MEDIA_ROOT = os.path.join(BASE_DIR, "media")
+MEDIA_ROOT = os.getenv("MEDIA_ROOT", os.path.join(BASE_DIR, "media"))
 STATIC_URL = "/static/"
 STATICFILES_DIRS = [BASE_DIR / "static"]
 SECRET_KEY = "django-insecure-3=i*5)a@=*1ldroj-$96j8fire8p3ilp5vn51a1z+@*vyb2)+h"
@@ -22,6 +23,7 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
     "mail_app",
     "rest_framework",
     "django_probes",
@@ -92,13 +94,81 @@ USE_TZ = True
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
+REDIS_HOST = os.getenv("REDIS_HOST", "redis")
+REDIS_PORT = int(os.getenv("REDIS_PORT", 6379))
+
 CHANNEL_LAYERS = {
     "default": {
         "BACKEND": "channels_redis.core.RedisChannelLayer",
         "CONFIG": {
-            "hosts": [
-                (os.getenv("REDIS_HOST", "redis"), int(os.getenv("REDIS_PORT", 6379)))
-            ],
+            "hosts": [(REDIS_HOST, REDIS_PORT)],
         },
     },
 }
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": os.getenv(
+            "CACHE_REDIS_URL", f"redis://{REDIS_HOST}:{REDIS_PORT}/1"
+        ),
+    },
+}
+
+EMAIL_FETCH_BATCH_SIZE = int(os.getenv("EMAIL_FETCH_BATCH_SIZE", 100))
+EMAIL_FETCH_HEADERS_FIRST = os.getenv("EMAIL_FETCH_HEADERS_FIRST", "True") == "True"
+IMAP_EXECUTOR_WORKERS = int(os.getenv("IMAP_EXECUTOR_WORKERS", 32))
+IMAP_TIMEOUT = int(os.getenv("IMAP_TIMEOUT", 60))
+IMAP_SERVER_OVERRIDE = os.getenv("IMAP_SERVER_OVERRIDE", "")
+IMAP_POOL_MAX_PER_PROVIDER = int(os.getenv("IMAP_POOL_MAX_PER_PROVIDER", 10))
+IMAP_POOL_KEEPALIVE = int(os.getenv("IMAP_POOL_KEEPALIVE", 60))
+IMAP_POOL_MAX_IDLE = int(os.getenv("IMAP_POOL_MAX_IDLE", 900))
+IMAP_IDLE_TIMEOUT = int(os.getenv("IMAP_IDLE_TIMEOUT", 25 * 60))
+IMAP_IDLE_MAX_BACKOFF = int(os.getenv("IMAP_IDLE_MAX_BACKOFF", 300))
+IMAP_IDLE_ACCOUNT_REFRESH = int(os.getenv("IMAP_IDLE_ACCOUNT_REFRESH", 300))
+EMAIL_PARSE_WORKERS = int(os.getenv("EMAIL_PARSE_WORKERS", os.cpu_count() or 1))
+EMAIL_SYNC_MAX_CONCURRENCY = int(os.getenv("EMAIL_SYNC_MAX_CONCURRENCY", 8))
+EMAIL_SYNC_LEASE_REDIS_URL = os.getenv(
+    "EMAIL_SYNC_LEASE_REDIS_URL", f"redis://{REDIS_HOST}:{REDIS_PORT}/0"
+)
+EMAIL_SYNC_LEASE_TTL = int(os.getenv("EMAIL_SYNC_LEASE_TTL", 60))
+EMAIL_SYNC_LEASE_POLL = float(os.getenv("EMAIL_SYNC_LEASE_POLL", 0.5))
+EMAIL_PROGRESS_INTERVAL = float(os.getenv("EMAIL_PROGRESS_INTERVAL", 0.2))
+EMAIL_PROGRESS_BATCH_SIZE = int(os.getenv("EMAIL_PROGRESS_BATCH_SIZE", 100))
+EMAIL_SEARCH_CONFIG = os.getenv("EMAIL_SEARCH_CONFIG", "simple")
+EMAIL_API_CACHE_TIMEOUT = int(os.getenv("EMAIL_API_CACHE_TIMEOUT", 300))
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "True") == "True"
+METRICS_PORT = int(os.getenv("METRICS_PORT", 0))
+# Bearer token that lets scrapers read /metrics; staff sessions need none
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+EMAIL_SYNC_RETRY_BASE = int(os.getenv("EMAIL_SYNC_RETRY_BASE", 60))
+EMAIL_SYNC_RETRY_MAX_BACKOFF = int(os.getenv("EMAIL_SYNC_RETRY_MAX_BACKOFF", 6 * 3600))
+EMAIL_SYNC_RETRY_MAX_ATTEMPTS = int(os.getenv("EMAIL_SYNC_RETRY_MAX_ATTEMPTS", 5))
+EMAIL_RAW_ARCHIVE_DIR = os.getenv("EMAIL_RAW_ARCHIVE_DIR", "")
+EMAIL_RAW_ARCHIVE_SEGMENT_SIZE = int(
+    os.getenv("EMAIL_RAW_ARCHIVE_SEGMENT_SIZE", 256 * 1024 * 1024)
+)
+EMAIL_STATE_CHECK_INTERVAL = int(os.getenv("EMAIL_STATE_CHECK_INTERVAL", 3600))
+EMAIL_STATE_SYNC_BATCH_SIZE = int(os.getenv("EMAIL_STATE_SYNC_BATCH_SIZE", 1000))
+# Per-process limits of the IMAP commands sent to each provider
+IMAP_LOGIN_RATE = float(os.getenv("IMAP_LOGIN_RATE", 1))
+IMAP_LOGIN_BURST = int(os.getenv("IMAP_LOGIN_BURST", 5))
+IMAP_COMMAND_RATE = float(os.getenv("IMAP_COMMAND_RATE", 20))
+IMAP_COMMAND_BURST = int(os.getenv("IMAP_COMMAND_BURST", 40))
+IMAP_CONCURRENCY_MIN = int(os.getenv("IMAP_CONCURRENCY_MIN", 1))
+IMAP_CONCURRENCY_MAX = int(
+    os.getenv("IMAP_CONCURRENCY_MAX", IMAP_POOL_MAX_PER_PROVIDER)
+)
+IMAP_LATENCY_TARGET = float(os.getenv("IMAP_LATENCY_TARGET", 10))
+IMAP_THROTTLE_COOLDOWN = float(os.getenv("IMAP_THROTTLE_COOLDOWN", 30))
+IMAP_THROTTLE_MAX_COOLDOWN = float(os.getenv("IMAP_THROTTLE_MAX_COOLDOWN", 600))
+IMAP_THROTTLE_RETRIES = int(os.getenv("IMAP_THROTTLE_RETRIES", 2))
+# Overrides of the limits above by provider, e.g. {"gmail": {"IMAP_LOGIN_RATE": 0.5}}
+IMAP_PROVIDER_LIMITS = json.loads(os.getenv("IMAP_PROVIDER_LIMITS", "{}"))
+ATTACHMENT_URL_MAX_AGE = int(os.getenv("ATTACHMENT_URL_MAX_AGE", 24 * 3600))
+# "x-accel-redirect" (nginx) or "x-sendfile" (Apache, lighttpd) to let the front
+# server send attachments; empty to stream them from Django
+ATTACHMENT_SENDFILE = os.getenv("ATTACHMENT_SENDFILE", "")
+ATTACHMENT_ACCEL_PREFIX = os.getenv("ATTACHMENT_ACCEL_PREFIX", "/protected-media/")
+# Files in blob storage without a referenced blob are swept once this many seconds old
+ATTACHMENT_SWEEP_MIN_AGE = int(os.getenv("ATTACHMENT_SWEEP_MIN_AGE", 24 * 3600))
@@ -1,5 +1,12 @@
 from django.contrib import admin
-from .models import EmailAccount, EmailMessage, Attachment
+from .models import (
+    EmailAccount,
+    EmailMessage,
+    Attachment,
+    AttachmentBlob,
+    SyncFailure,
+    Thread,
+)
 
 
 @admin.register(EmailAccount)
@@ -12,9 +19,35 @@ class EmailAccountAdmin(admin.ModelAdmin):
 
 @admin.register(EmailMessage)
 class EmailMessageAdmin(admin.ModelAdmin):
-    list_display = ("subject", "body")
+    list_display = ("subject", "snippet")
+    # Select boxes would load every body and thread
+    raw_id_fields = ("content", "thread")
+
+
+@admin.register(Thread)
+class ThreadAdmin(admin.ModelAdmin):
+    list_display = ("subject", "email_account", "message_count", "last_message_at")
 
 
 @admin.register(Attachment)
 class AttachmentAdmin(admin.ModelAdmin):
-    list_display = ("uuid", "filename")
+    list_display = ("uuid", "filename", "size")
+    raw_id_fields = ("email_message", "blob")
+
+
+@admin.register(AttachmentBlob)
+class AttachmentBlobAdmin(admin.ModelAdmin):
+    list_display = ("sha256", "size", "ref_count")
+
+
+@admin.register(SyncFailure)
+class SyncFailureAdmin(admin.ModelAdmin):
+    list_display = (
+        "email_account",
+        "uid",
+        "stage",
+        "attempts",
+        "next_retry_at",
+        "quarantined",
+    )
+    list_filter = ("stage", "quarantined")
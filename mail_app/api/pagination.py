@@ -0,0 +1,121 @@
+import base64
+import json
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetCursorPagination(BasePagination):
+    """
+    Keyset pagination over ``(<key_field>, id)``, in descending order.
+
+    The cursor is the position of the last row of the previous page, so every page is
+    an index range scan, however deep the client has scrolled. Subclasses set
+    ``key_field`` and convert its values to and from JSON.
+    """
+
+    key_field = None
+    page_size = 50
+    max_page_size = 500
+    cursor_query_param = "cursor"
+    page_size_query_param = "page_size"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        queryset = queryset.order_by(f"-{self.key_field}", "-id")
+
+        cursor = self.decode_cursor(request)
+        if cursor is not None:
+            key, pk = cursor
+            queryset = queryset.filter(
+                Q(**{f"{self.key_field}__lt": key})
+                | Q(**{self.key_field: key, "id__lt": pk})
+            )
+
+        page = list(queryset[: self.page_size + 1])
+        self.next_cursor = None
+        if len(page) > self.page_size:
+            page = page[: self.page_size]
+            self.next_cursor = self.encode_cursor(page[-1])
+        return page
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(page_size, self.max_page_size))
+
+    def decode_cursor(self, request):
+        """Returns the ``(key, id)`` position encoded in the request, if any."""
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            key, pk = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            return self.load_key(key), int(pk)
+        except (TypeError, ValueError):
+            raise NotFound("Invalid cursor")
+
+    def encode_cursor(self, row):
+        """Encodes the position of a row as an opaque cursor."""
+        position = json.dumps([self.dump_key(getattr(row, self.key_field)), row.pk])
+        return base64.urlsafe_b64encode(position.encode()).decode()
+
+    def dump_key(self, value):
+        """Converts a key value to JSON."""
+        return value
+
+    def load_key(self, value):
+        """Converts a key value back from JSON; raises ValueError if it is invalid."""
+        return value
+
+    def get_next_link(self):
+        if self.next_cursor is None:
+            return None
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param,
+            self.next_cursor,
+        )
+
+    def get_paginated_response(self, data, **extra):
+        return Response({"next": self.get_next_link(), **extra, "emails": data})
+
+
+class ReceivedAtCursorPagination(KeysetCursorPagination):
+    """Keyset pagination over ``(received_at, id)``, newest first."""
+
+    key_field = "received_at"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return super().paginate_queryset(
+            queryset.filter(received_at__isnull=False), request, view
+        )
+
+    def dump_key(self, value):
+        return value.isoformat()
+
+    def load_key(self, value):
+        received_at = parse_datetime(value)
+        if received_at is None:
+            raise ValueError
+        return received_at
+
+
+class SearchRankCursorPagination(KeysetCursorPagination):
+    """
+    Keyset pagination over ``(rank, id)``, best match first.
+
+    Expects the queryset to be annotated with a double precision ``rank``, which
+    round-trips through JSON exactly.
+    """
+
+    key_field = "rank"
+
+    def load_key(self, value):
+        return float(value)
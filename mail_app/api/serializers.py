@@ -1,23 +1,87 @@
 from rest_framework import serializers
-from ..models import EmailMessage, Attachment
+from ..models import EmailMessage, Attachment, Thread
+from ..utils.attachment_downloads import download_url
 
 
 class AttachmentSerializer(serializers.ModelSerializer):
+    """
+    Serializes attachments with a signed, expiring download ``url``.
+    """
+
+    url = serializers.SerializerMethodField()
+
     class Meta:
         model = Attachment
-        fields = ["uuid", "file", "filename"]
+        fields = ["uuid", "url", "filename", "size"]
+
+    def get_url(self, attachment):
+        return download_url(attachment)
 
 
 class EmailMessageSerializer(serializers.ModelSerializer):
+    """
+    Serializes email messages.
+    Accepts an optional ``fields`` argument to return only a subset of the fields.
+    """
+
     attachments = AttachmentSerializer(many=True, read_only=True)
 
     class Meta:
         model = EmailMessage
         fields = [
+            "id",
+            "thread",
+            "message_id",
             "subject",
             "from_address",
             "sent_at",
             "received_at",
+            "snippet",
             "body",
+            "size",
+            "body_loaded",
+            "flags",
             "attachments",
         ]
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+
+class EmailSearchResultSerializer(EmailMessageSerializer):
+    """
+    Serializes email search results with their rank and a highlighted body excerpt.
+    """
+
+    rank = serializers.FloatField(read_only=True)
+    headline = serializers.CharField(read_only=True, default=None)
+
+    class Meta(EmailMessageSerializer.Meta):
+        fields = EmailMessageSerializer.Meta.fields + ["rank", "headline"]
+
+
+class ThreadSerializer(serializers.ModelSerializer):
+    """
+    Serializes a conversation with its messages.
+    Takes the ``messages`` queryset to list and the ``fields`` of each message.
+    """
+
+    messages = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Thread
+        fields = ["id", "subject", "message_count", "last_message_at", "messages"]
+
+    def __init__(self, *args, messages=None, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._messages = messages
+        self._message_fields = fields
+
+    def get_messages(self, thread):
+        messages = self._messages if self._messages is not None else thread.messages
+        return EmailMessageSerializer(
+            messages, many=True, fields=self._message_fields
+        ).data
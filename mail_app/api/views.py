@@ -1,26 +1,269 @@
-from ..models import EmailMessage
-from .serializers import EmailMessageSerializer
+from ..models import Attachment, EmailMessage, Thread
+from ..utils.attachment_downloads import attachment_response, is_valid_token
+from ..utils.response_cache import cached_response, get_version
+from ..utils.search import mark_headline, search_headline, search_query
+from ..workers import SYNC_CHANNEL
+from .pagination import ReceivedAtCursorPagination, SearchRankCursorPagination
+from .serializers import (
+    EmailMessageSerializer,
+    EmailSearchResultSerializer,
+    ThreadSerializer,
+)
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.contrib.postgres.search import SearchRank
+from django.db.models import Count, F, FloatField, Q
+from django.db.models.functions import Cast
+from django.http import Http404
+from django.shortcuts import get_object_or_404
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import PermissionDenied, ValidationError
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
 
 class ProcessedEmailListAPIView(APIView):
     """
-    API View to retrieve the list of processed emails.
+    API View to retrieve the list of processed emails, one cursor page at a time.
+
+    Query parameters:
+        cursor: Opaque position returned as ``next`` by the previous page.
+        page_size: Number of emails per page (at most 500).
+        fields: Comma-separated subset of the serializer fields. The full ``body`` is
+            only returned when listed here; listings usually need the ``snippet``.
+        account: Only emails of this email account id.
+        since / until: Only emails received at or after / before this ISO datetime.
+
+    The first page also carries the total and processed counts. Pages are cached until
+    an email of the listed account(s) is ingested, and support conditional requests.
+    """
+
+    pagination_class = ReceivedAtCursorPagination
+    serializer_class = EmailMessageSerializer
+    # Fields left out unless requested, as they are stored outside email_message
+    opt_in_fields = ["body"]
+
+    def get(self, request):
+        account = request.query_params.get("account", "")
+        version = get_version(int(account) if account.isdigit() else None)
+        return cached_response(request, version, lambda: self.list(request))
+
+    def list(self, request):
+        """Builds a page of the email list."""
+        fields = self.get_fields(request)
+        emails = self.filter_queryset(request, EmailMessage.objects.all())
+
+        extra = {}
+        if not request.query_params.get(ReceivedAtCursorPagination.cursor_query_param):
+            extra = emails.aggregate(
+                total_emails=Count("id"),
+                processed_emails=Count("id", filter=Q(received_at__isnull=False)),
+            )
+
+        columns = self.get_columns(fields)
+        emails = emails.only(*columns, "received_at")
+        emails = self.prefetch_related(emails, fields)
+
+        paginator = self.pagination_class()
+        page = paginator.paginate_queryset(emails, request, view=self)
+        serializer = self.serializer_class(page, many=True, fields=fields)
+        return paginator.get_paginated_response(serializer.data, **extra)
+
+    def get_fields(self, request):
+        """Returns the requested serializer fields, defaulting to all of them."""
+        available = self.serializer_class.Meta.fields
+        requested = request.query_params.get("fields")
+        if not requested:
+            return [name for name in available if name not in self.opt_in_fields]
+        fields = [name.strip() for name in requested.split(",") if name.strip()]
+        unknown = set(fields) - set(available)
+        if unknown:
+            raise ValidationError({"fields": f"Unknown fields: {', '.join(unknown)}"})
+        return fields
+
+    @staticmethod
+    def get_columns(fields):
+        """Returns the EmailMessage columns the requested fields are read from."""
+        columns = set(fields) & {field.name for field in EmailMessage._meta.fields}
+        if "body" in fields:
+            # The key of the prefetched body, which would be loaded per row otherwise
+            columns.add("content")
+        return columns
+
+    @staticmethod
+    def prefetch_related(queryset, fields):
+        """Prefetches the related rows the requested fields are read from."""
+        if "attachments" in fields:
+            queryset = queryset.prefetch_related("attachments")
+        if "body" in fields:
+            queryset = queryset.prefetch_related("content")
+        return queryset
+
+    @staticmethod
+    def filter_queryset(request, queryset):
+        """Applies the account and received date range filters."""
+        account = request.query_params.get("account")
+        if account:
+            if not account.isdigit():
+                raise ValidationError({"account": "Expected an email account id."})
+            queryset = queryset.filter(email_account_id=account)
+
+        for param, lookup in (
+            ("since", "received_at__gte"),
+            ("until", "received_at__lt"),
+        ):
+            value = request.query_params.get(param)
+            if value:
+                moment = parse_datetime(value)
+                if moment is None:
+                    raise ValidationError({param: "Expected an ISO 8601 datetime."})
+                queryset = queryset.filter(**{lookup: moment})
+        return queryset
+
+
+class EmailSearchAPIView(ProcessedEmailListAPIView):
+    """
+    API View to search emails by subject, sender and body, best match first.
+
+    Query parameters:
+        q: The search terms, in web search syntax (``"exact phrase"``, ``or``, ``-word``).
+        cursor, page_size, fields, account, since, until: As for the email list.
+
+    Matches are found with the GIN index on ``search_vector``. Results carry their
+    ``rank`` and a ``headline`` excerpt of the body, HTML-escaped, with the matched
+    terms in ``<mark>`` tags; headlines are only computed for the rows of the page.
     """
 
+    pagination_class = SearchRankCursorPagination
+    serializer_class = EmailSearchResultSerializer
+
     def get(self, request):
-        emails = EmailMessage.objects.all()
-        total_emails = emails.count()
-        processed_emails = EmailMessage.objects.filter(
-            received_at__isnull=False
-        ).count()  # Example condition
-
-        serializer = EmailMessageSerializer(emails, many=True)
-        return Response(
-            {
-                "total_emails": total_emails,
-                "processed_emails": processed_emails,
-                "emails": serializer.data,
-            }
+        text = request.query_params.get("q", "").strip()
+        if not text:
+            raise ValidationError({"q": "This parameter is required."})
+        fields = self.get_fields(request)
+        query = search_query(text)
+
+        emails = self.filter_queryset(request, EmailMessage.objects.all())
+        columns = self.get_columns(fields)
+        emails = (
+            emails.filter(search_vector=query)
+            # As float8, so the rank round-trips through the cursor exactly
+            .annotate(
+                rank=Cast(SearchRank(F("search_vector"), query), FloatField())
+            ).only("id", *columns)
+        )
+        emails = self.prefetch_related(emails, fields)
+
+        paginator = self.pagination_class()
+        page = paginator.paginate_queryset(emails, request, view=self)
+        if "headline" in fields and page:
+            headlines = dict(
+                EmailMessage.objects.filter(pk__in=[email.pk for email in page])
+                .annotate(headline=search_headline(query))
+                .values_list("pk", "headline")
+            )
+            for email in page:
+                email.headline = mark_headline(headlines.get(email.pk))
+
+        serializer = self.serializer_class(page, many=True, fields=fields)
+        return paginator.get_paginated_response(serializer.data)
+
+
+class ProcessedEmailDetailAPIView(APIView):
+    """
+    API View to retrieve a single email.
+    Messages stored from their headers only are served with their headers while the
+    sync worker loads their body, so the request never waits on the mail server.
+    Responses are cached until an email of the account is ingested.
+    """
+
+    def get(self, request, pk):
+        account_id = (
+            EmailMessage.objects.filter(pk=pk)
+            .values_list("email_account_id", flat=True)
+            .first()
+        )
+        if account_id is None:
+            raise Http404
+        return cached_response(
+            request, get_version(account_id), lambda: self.retrieve(pk)
+        )
+
+    def retrieve(self, pk):
+        """Builds the response for an email, queueing the load of its body if needed."""
+        email = get_object_or_404(
+            EmailMessage.objects.select_related("email_account", "content").defer(
+                "search_vector"
+            ),
+            pk=pk,
+        )
+        if not email.body_loaded:
+            async_to_sync(get_channel_layer().send)(
+                SYNC_CHANNEL, {"type": "body.request", "message_id": email.pk}
+            )
+
+        serializer = EmailMessageSerializer(email)
+        response = Response(serializer.data)
+        # Retry the body on the next request instead of caching the headers only
+        response.cacheable = email.body_loaded
+        return response
+
+
+class ThreadDetailAPIView(APIView):
+    """
+    API View to retrieve a conversation with its messages, oldest first.
+
+    Messages are listed without their ``body``, like in the email list. Responses are
+    cached until an email of the account is ingested.
+    """
+
+    def get(self, request, pk):
+        account_id = (
+            Thread.objects.filter(pk=pk)
+            .values_list("email_account_id", flat=True)
+            .first()
+        )
+        if account_id is None:
+            raise Http404
+        return cached_response(
+            request, get_version(account_id), lambda: self.retrieve(pk)
+        )
+
+    def retrieve(self, pk):
+        """Builds the response for a thread."""
+        thread = get_object_or_404(Thread, pk=pk)
+        fields = [
+            name
+            for name in EmailMessageSerializer.Meta.fields
+            if name not in ProcessedEmailListAPIView.opt_in_fields
+        ]
+        # Uses the (thread, sent_at) index
+        messages = (
+            thread.messages.order_by("sent_at", "id")
+            .defer("search_vector")
+            .prefetch_related("attachments")
+        )
+        serializer = ThreadSerializer(thread, messages=messages, fields=fields)
+        return Response(serializer.data)
+
+
+class AttachmentDownloadAPIView(APIView):
+    """
+    API View to download an attachment, resumably.
+
+    Access needs the signed ``token`` of the ``url`` listed with the attachment, or a
+    staff session. Supports Range and conditional requests; with
+    ``ATTACHMENT_SENDFILE`` set, the front server sends the file.
+    """
+
+    def get(self, request, pk):
+        attachment = get_object_or_404(
+            Attachment.objects.only("uuid", "file", "filename", "sha256", "size"), pk=pk
         )
+        if not (
+            request.user.is_staff
+            or is_valid_token(attachment.pk, request.query_params.get("token"))
+        ):
+            raise PermissionDenied("Invalid or expired download link.")
+        return attachment_response(request, attachment)
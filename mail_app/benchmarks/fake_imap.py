@@ -0,0 +1,206 @@
+import re
+import socketserver
+import threading
+import time
+
+_SET_RE = re.compile(r"UID (\S+)", re.IGNORECASE)
+_CHANGEDSINCE_RE = re.compile(r"CHANGEDSINCE (\d+)", re.IGNORECASE)
+
+
+class FakeMailbox:
+    """
+    In-memory inbox served by ``FakeIMAPServer``.
+
+    Attributes:
+        messages (dict): Raw messages (bytes) by UID.
+        uid_validity (int): The UIDVALIDITY reported on SELECT.
+        extensions (set): The extensions offered to ENABLE, CONDSTORE and/or QRESYNC.
+        flags (dict): Flag sets by UID.
+        modseqs (dict): The mod-sequence of the last change by UID.
+        expunged (dict): The mod-sequence of the expunge by UID of removed messages.
+        highest_modseq (int): The HIGHESTMODSEQ reported on SELECT.
+        sent_at (dict): ``time.perf_counter()`` at which each ``(user, uid)`` was first
+            sent, in full or as headers, to measure per-message latency.
+    """
+
+    def __init__(self, messages=(), uid_validity=1, extensions=()):
+        self.messages = {uid: raw for uid, raw in enumerate(messages, start=1)}
+        self.uid_validity = uid_validity
+        self.extensions = {name.upper() for name in extensions}
+        self.flags = {uid: set() for uid in self.messages}
+        self.modseqs = dict.fromkeys(self.messages, 1)
+        self.expunged = {}
+        self.highest_modseq = 1
+        self.sent_at = {}
+        self.lock = threading.Lock()
+
+    def add(self, raw_email):
+        """Appends a message and returns its UID."""
+        with self.lock:
+            uid = max([*self.messages, *self.expunged], default=0) + 1
+            self.messages[uid] = raw_email
+            self.flags[uid] = set()
+            self._touch(uid)
+            return uid
+
+    def set_flags(self, uid, *flags):
+        """Replaces the flags of a message."""
+        with self.lock:
+            self.flags[uid] = set(flags)
+            self._touch(uid)
+
+    def expunge(self, uid):
+        """Removes a message."""
+        with self.lock:
+            del self.messages[uid], self.flags[uid], self.modseqs[uid]
+            self.highest_modseq += 1
+            self.expunged[uid] = self.highest_modseq
+
+    def _touch(self, uid):
+        """Gives a changed message the next mod-sequence."""
+        self.highest_modseq += 1
+        self.modseqs[uid] = self.highest_modseq
+
+
+def _parse_uid_set(spec, uids):
+    """Returns the sorted UIDs of ``uids`` matched by an IMAP UID set such as ``1:5,9:*``."""
+    highest = max(uids, default=0)
+    matched = set()
+    for part in spec.split(","):
+        start, _, end = part.partition(":")
+        start = highest if start == "*" else int(start)
+        end = start if not end else highest if end == "*" else int(end)
+        low, high = min(start, end), max(start, end)
+        matched.update(uid for uid in uids if low <= uid <= high)
+    return sorted(matched)
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    """Speaks the subset of IMAP4rev1 used by the email service, one session per connection."""
+
+    def send(self, data):
+        self.wfile.write(data.encode() if isinstance(data, str) else data)
+
+    def handle(self):
+        self.user = None
+        self.enabled = set()
+        self.send("* OK fake IMAP server ready\r\n")
+        while line := self.rfile.readline():
+            tag, _, command = line.decode().rstrip("\r\n").partition(" ")
+            name, _, args = command.partition(" ")
+            handler = getattr(self, f"do_{name.lower()}", None)
+            if handler is None:
+                self.send(f"{tag} BAD unknown command\r\n")
+                continue
+            if handler(args) is False:
+                self.send(f"{tag} OK LOGOUT completed\r\n")
+                return
+            self.send(f"{tag} OK {name.upper()} completed\r\n")
+
+    def do_capability(self, args):
+        extensions = sorted(self.server.mailbox.extensions)
+        if extensions:
+            extensions.insert(0, "ENABLE")
+        self.send(" ".join(["* CAPABILITY IMAP4rev1 UIDPLUS", *extensions]) + "\r\n")
+
+    def do_enable(self, args):
+        self.enabled |= set(args.upper().split()) & self.server.mailbox.extensions
+        self.send(" ".join(["* ENABLED", *sorted(self.enabled)]) + "\r\n")
+
+    def do_login(self, args):
+        self.user = args.split(" ", 1)[0].strip('"')
+
+    def do_select(self, args):
+        mailbox = self.server.mailbox
+        self.send(f"* {len(mailbox.messages)} EXISTS\r\n")
+        self.send(f"* OK [UIDVALIDITY {mailbox.uid_validity}] UIDs valid\r\n")
+        if self.enabled:
+            self.send(f"* OK [HIGHESTMODSEQ {mailbox.highest_modseq}] Highest\r\n")
+
+    def do_noop(self, args):
+        pass
+
+    def do_logout(self, args):
+        self.send("* BYE logging out\r\n")
+        return False
+
+    def do_uid(self, args):
+        command, _, args = args.partition(" ")
+        mailbox = self.server.mailbox
+        with mailbox.lock:
+            messages = dict(mailbox.messages)
+        uids = sorted(messages)
+
+        if command.upper() == "SEARCH":
+            match = _SET_RE.search(args)
+            found = _parse_uid_set(match.group(1), uids) if match else uids
+            self.send("* SEARCH " + " ".join(map(str, found)) + "\r\n")
+            return
+
+        spec, _, items = args.partition(" ")
+        if items.upper().startswith("(FLAGS)"):
+            return self.fetch_flags(_parse_uid_set(spec, uids), items)
+        headers_only = "HEADER.FIELDS" in items.upper()
+        for seq, uid in enumerate(_parse_uid_set(spec, uids), start=1):
+            raw_email = messages[uid]
+            if headers_only:
+                literal = raw_email.split(b"\r\n\r\n", 1)[0] + b"\r\n\r\n"
+                prefix = (
+                    f"* {seq} FETCH (UID {uid} RFC822.SIZE {len(raw_email)} "
+                    "BODY[HEADER.FIELDS (SUBJECT FROM DATE MESSAGE-ID "
+                    "IN-REPLY-TO REFERENCES)]"
+                )
+            else:
+                literal = raw_email
+                if "PEEK" in items.upper():
+                    prefix = f"* {seq} FETCH (UID {uid} BODY[]"
+                else:
+                    # RFC822 and BODY[] mark the message read, as real servers do
+                    prefix = f"* {seq} FETCH (UID {uid} RFC822"
+                    mailbox.set_flags(uid, *(mailbox.flags[uid] | {"\\Seen"}))
+            self.send(f"{prefix} {{{len(literal)}}}\r\n".encode() + literal + b")\r\n")
+            mailbox.sent_at.setdefault((self.user, uid), time.perf_counter())
+
+    def fetch_flags(self, uids, items):
+        """Answers a FLAGS fetch, with the CHANGEDSINCE and VANISHED modifiers."""
+        mailbox = self.server.mailbox
+        with mailbox.lock:
+            flags, modseqs = dict(mailbox.flags), dict(mailbox.modseqs)
+            expunged = dict(mailbox.expunged)
+        match = _CHANGEDSINCE_RE.search(items)
+        changed_since = int(match.group(1)) if match else 0
+        if match and "VANISHED" in items.upper() and "QRESYNC" in self.enabled:
+            vanished = [
+                uid for uid, modseq in expunged.items() if modseq > changed_since
+            ]
+            if vanished:
+                uid_set = ",".join(map(str, sorted(vanished)))
+                self.send(f"* VANISHED (EARLIER) {uid_set}\r\n")
+        for seq, uid in enumerate(uids, start=1):
+            if modseqs[uid] <= changed_since:
+                continue
+            modseq = f" MODSEQ ({modseqs[uid]})" if self.enabled else ""
+            names = " ".join(sorted(flags[uid]))
+            self.send(f"* {seq} FETCH (UID {uid} FLAGS ({names}){modseq})\r\n")
+
+
+class FakeIMAPServer(socketserver.ThreadingTCPServer):
+    """
+    Plaintext IMAP server on localhost serving one ``FakeMailbox`` to every login.
+
+    Used with ``IMAP_SERVER_OVERRIDE = "127.0.0.1:<port>"`` to run syncs without a real
+    provider. Logins are accepted with any password.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, mailbox, port=0):
+        super().__init__(("127.0.0.1", port), _Handler)
+        self.mailbox = mailbox
+
+    def start(self):
+        """Serves in a background thread and returns the ``host:port`` address."""
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        host, port = self.server_address
+        return f"{host}:{port}"
@@ -0,0 +1,242 @@
+import asyncio
+import json
+import multiprocessing
+import os
+import resource
+import shutil
+import subprocess
+import tempfile
+import time
+from channels.layers import get_channel_layer
+from channels.testing import ApplicationCommunicator, WebsocketCommunicator
+from django.conf import settings
+from django.db import connection, connections
+from django.db.backends.signals import connection_created
+from django.test.utils import override_settings
+from mail_app.benchmarks.fake_imap import FakeIMAPServer, FakeMailbox
+from mail_app.benchmarks.mailbox import SUBJECT_PREFIX
+from mail_app.consumers import EmailConsumer
+from mail_app.models import EmailAccount, EmailMessage
+from mail_app.utils.email_service import fetch_emails_for_account
+from mail_app.utils.imap_pool import get_imap_pool
+from mail_app.utils.mime_parser import shutdown_parser_executor
+from mail_app.workers import SYNC_CHANNEL, EmailSyncWorker
+from asgiref.sync import sync_to_async
+
+
+class QueryCounter:
+    """
+    Counts the SQL queries of every database connection, including the ones opened by
+    ``sync_to_async`` threads, while ``active`` is set.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.active = False
+
+    def __call__(self, execute, sql, params, many, context):
+        if self.active:
+            self.count += 1
+        return execute(sql, params, many, context)
+
+    def install(self, sender, connection, **kwargs):
+        """``connection_created`` receiver adding the counter to a new connection."""
+        if self not in connection.execute_wrappers:
+            connection.execute_wrappers.append(self)
+
+
+def run_ingest_benchmark(messages, accounts=1, via="service", keepdb=False):
+    """
+    Ingests a synthetic mailbox from a local fake IMAP server and measures it.
+
+    Runs against a throwaway test database and media directory, with a local-memory
+    cache and channel layer, so neither real data nor Redis is needed.
+
+    Args:
+        messages (list): Raw messages, e.g. from ``generate_messages``.
+        accounts (int): Number of accounts syncing the mailbox concurrently.
+        via (str): ``"service"`` to call ``fetch_emails_for_account`` directly, or
+            ``"consumer"`` to trigger the sync through ``EmailConsumer`` and a sync worker.
+        keepdb (bool): Whether to keep the test database between runs.
+
+    Returns:
+        dict: The measurements.
+    """
+    media_root = tempfile.mkdtemp(prefix="mail-benchmark-")
+    # Read by the spawned parser processes, which write the attachment blobs
+    previous_media_root = os.environ.get("MEDIA_ROOT")
+    os.environ["MEDIA_ROOT"] = media_root
+
+    mailbox = FakeMailbox(messages)
+    server = FakeIMAPServer(mailbox)
+    old_name = connection.creation.create_test_db(
+        verbosity=0, autoclobber=True, keepdb=keepdb
+    )
+    counter = QueryCounter()
+    connection_created.connect(counter.install)
+    counter.install(None, connection)
+    try:
+        with override_settings(
+            IMAP_SERVER_OVERRIDE=server.start(),
+            MEDIA_ROOT=media_root,
+            CACHES={
+                "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}
+            },
+            CHANNEL_LAYERS={
+                "default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}
+            },
+            EMAIL_SYNC_LEASE_REDIS_URL=None,
+        ):
+            EmailAccount.objects.filter(email__startswith="benchmark").delete()
+            account_list = [
+                EmailAccount.objects.create(
+                    email=f"benchmark{number}@example.com", password="benchmark"
+                )
+                for number in range(accounts)
+            ]
+            received_at = {}
+            counter.active = True
+            started = time.perf_counter()
+            asyncio.run(_sync(account_list, via, received_at))
+            elapsed = time.perf_counter() - started
+            counter.active = False
+            parsers_rss = _children_peak_rss()
+            stored = EmailMessage.objects.count()
+    finally:
+        connection_created.disconnect(counter.install)
+        server.shutdown()
+        server.server_close()
+        shutdown_parser_executor()
+        connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=keepdb)
+        shutil.rmtree(media_root, ignore_errors=True)
+        if previous_media_root is None:
+            os.environ.pop("MEDIA_ROOT", None)
+        else:
+            os.environ["MEDIA_ROOT"] = previous_media_root
+
+    latencies = sorted(
+        (received - mailbox.sent_at[key]) * 1000
+        for key, received in received_at.items()
+        if key in mailbox.sent_at
+    )
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "commit": _git_commit(),
+        "via": via,
+        "accounts": accounts,
+        "mailbox_messages": len(messages),
+        "mailbox_bytes": sum(map(len, messages)),
+        "settings": {
+            name: getattr(settings, name)
+            for name in (
+                "EMAIL_FETCH_BATCH_SIZE",
+                "EMAIL_FETCH_HEADERS_FIRST",
+                "EMAIL_PARSE_WORKERS",
+                "IMAP_EXECUTOR_WORKERS",
+            )
+        },
+        "database": connection.vendor,
+        "messages": stored,
+        "seconds": round(elapsed, 3),
+        "messages_per_second": round(stored / elapsed, 1) if elapsed else None,
+        "latency_ms": {
+            "p50": _percentile(latencies, 50),
+            "p99": _percentile(latencies, 99),
+        },
+        "peak_rss_mb": {
+            # ru_maxrss is in kilobytes on Linux
+            "main": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+            "parsers": parsers_rss,
+        },
+        "queries": counter.count,
+        "queries_per_message": round(counter.count / stored, 2) if stored else None,
+    }
+
+
+async def _sync(accounts, via, received_at):
+    """Syncs the accounts and records when each email reached the client."""
+
+    def record(text_data):
+        frame = json.loads(text_data)
+        now = time.perf_counter()
+        for email_data in frame.get("emails", ()):
+            uid = int(email_data["subject"][len(SUBJECT_PREFIX) :])
+            received_at[(frame["account"], uid)] = now
+        return frame
+
+    try:
+        if via == "consumer":
+            await _sync_via_consumer(record)
+        else:
+
+            async def send(text_data):
+                record(text_data)
+
+            await asyncio.gather(
+                *(fetch_emails_for_account(account, send) for account in accounts)
+            )
+    finally:
+        await get_imap_pool().close_all()
+        # Lets the test database be dropped
+        await sync_to_async(connections.close_all)()
+
+
+async def _sync_via_consumer(record):
+    """Runs a sync job the way the page does, through the websocket consumer."""
+    websocket = WebsocketCommunicator(EmailConsumer.as_asgi(), "/ws/emails/")
+    websocket.scope["user"] = None
+    await websocket.connect()
+    worker = ApplicationCommunicator(
+        EmailSyncWorker.as_asgi(), {"type": "channel", "channel": SYNC_CHANNEL}
+    )
+    try:
+        await websocket.send_json_to({"action": "start_fetching"})
+        message = await get_channel_layer().receive(SYNC_CHANNEL)
+        await worker.send_input(message)
+        while True:
+            frame = record(await websocket.receive_from(timeout=3600))
+            # The job announces its end with a "complete" frame without an account
+            if frame.get("status") == "complete" and "account" not in frame:
+                break
+    finally:
+        await websocket.disconnect()
+        worker.stop(exceptions=False)
+
+
+def _children_peak_rss():
+    """
+    Returns the largest peak RSS in MB of the live child processes (the parser pool),
+    read from /proc, or None where it is not available.
+    """
+    peaks = []
+    for child in multiprocessing.active_children():
+        try:
+            with open(f"/proc/{child.pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmHWM:"):
+                        peaks.append(int(line.split()[1]) / 1024)
+        except OSError:
+            pass
+    return round(max(peaks), 1) if peaks else None
+
+
+def _percentile(values, percent):
+    """Returns the nearest-rank percentile of sorted values, rounded to 0.1."""
+    if not values:
+        return None
+    index = max(0, -(-len(values) * percent // 100) - 1)
+    return round(values[int(index)], 1)
+
+
+def _git_commit():
+    """Returns the checked out commit, if the code runs from a git checkout."""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=settings.BASE_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
@@ -0,0 +1,83 @@
+import random
+from datetime import datetime, timedelta, timezone
+from email.message import EmailMessage as MIMEMessage
+from email.utils import format_datetime
+
+_WORDS = (
+    "invoice meeting report project update schedule review budget customer order "
+    "delivery contract proposal quarter results team release deadline support ticket "
+    "account payment request summary agenda notes draft final approval"
+).split()
+
+SUBJECT_PREFIX = "Benchmark message"
+
+
+def _text(rng, size):
+    """Returns about ``size`` characters of random words."""
+    words, length = [], 0
+    while length < size:
+        word = rng.choice(_WORDS)
+        words.append(word)
+        length += len(word) + 1
+    return " ".join(words)
+
+
+def generate_messages(
+    count,
+    body_size=2048,
+    html_ratio=0.5,
+    attachment_ratio=0.1,
+    attachment_size=64 * 1024,
+    seed=0,
+):
+    """
+    Generates a reproducible synthetic mailbox.
+
+    Message ``n`` (starting at 1) has the subject ``"Benchmark message <n>"``, which
+    matches its UID in a ``FakeMailbox`` built from the list.
+
+    Args:
+        count (int): Number of messages.
+        body_size (int): Approximate body length in characters.
+        html_ratio (float): Share of messages with an HTML body instead of plain text.
+        attachment_ratio (float): Share of messages with a binary attachment.
+        attachment_size (int): Size of each attachment in bytes.
+        seed (int): Seed of the random generator.
+
+    Returns:
+        list: The raw messages (bytes).
+    """
+    rng = random.Random(seed)
+    sent_at = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    messages = []
+    for number in range(1, count + 1):
+        message = MIMEMessage()
+        message["Subject"] = f"{SUBJECT_PREFIX} {number}"
+        message["From"] = f"sender{rng.randrange(100)}@example.com"
+        message["To"] = "benchmark@example.com"
+        message["Date"] = format_datetime(sent_at + timedelta(minutes=number))
+        message["Message-ID"] = f"<benchmark-{seed}-{number}@example.com>"
+
+        text = _text(rng, body_size)
+        if rng.random() < html_ratio:
+            paragraphs = "".join(
+                f"<p style='margin:0 0 8px'><b>{text[i:i + 40]}</b>{text[i + 40:i + 200]}</p>"
+                for i in range(0, len(text), 200)
+            )
+            message.set_content(
+                f"<html><body><table><tr><td>{paragraphs}</td></tr></table></body></html>",
+                subtype="html",
+            )
+        else:
+            message.set_content(text)
+
+        if rng.random() < attachment_ratio:
+            message.add_attachment(
+                rng.randbytes(attachment_size),
+                maintype="application",
+                subtype="octet-stream",
+                filename=f"attachment-{number}.bin",
+            )
+            message.set_boundary(f"benchmark-{number}")
+        messages.append(message.as_bytes(policy=message.policy.clone(linesep="\r\n")))
+    return messages
@@ -1,21 +1,38 @@
+import functools
 import json
-import asyncio
+import zlib
+from urllib.parse import parse_qs
 from channels.generic.websocket import AsyncWebsocketConsumer
 from .models import EmailAccount
 from asgiref.sync import sync_to_async
-from mail_app.utils.email_service import fetch_emails_for_account
+from mail_app.utils import metrics
+from mail_app.utils.broadcast import EMAIL_UPDATES_GROUP
+from .workers import SYNC_CHANNEL
 
 
 class EmailConsumer(AsyncWebsocketConsumer):
     """
     WebSocket consumer for handling email fetching actions.
-    Fetches emails for all accounts upon receiving a start command from the client.
+    Queues a sync of all accounts upon receiving a start command from the client, and
+    relays the frames published to the email updates group by the sync workers and the
+    IDLE listener.
+
+    Clients that connect with ``?encoding=deflate`` receive every frame as a binary
+    message holding the zlib-compressed JSON, to be inflated with
+    ``DecompressionStream("deflate")``.
     """
 
     async def connect(self):
         """Accepts the WebSocket connection and sets the user from the request scope."""
+        await self.channel_layer.group_add(EMAIL_UPDATES_GROUP, self.channel_name)
         await self.accept()
         self.user = self.scope["user"]
+        query = parse_qs(self.scope.get("query_string", b"").decode())
+        self.deflate = query.get("encoding") == ["deflate"]
+
+    async def disconnect(self, close_code):
+        """Leaves the email updates group."""
+        await self.channel_layer.group_discard(EMAIL_UPDATES_GROUP, self.channel_name)
 
     async def receive(self, text_data):
         """Handles incoming WebSocket messages and triggers email fetching if requested."""
@@ -23,20 +40,27 @@ class EmailConsumer(AsyncWebsocketConsumer):
         if data.get("action") == "start_fetching":
             await self.fetch_emails()
 
+    async def email_update(self, event):
+        """Forwards a frame broadcast to the email updates group to the client."""
+        with metrics.stage_timer("websocket_send"):
+            if self.deflate:
+                await self.send(bytes_data=_deflate(event["text"]))
+            else:
+                await self.send(event["text"])
+        metrics.WEBSOCKET_FRAMES.inc()
+
     async def fetch_emails(self):
         """
-        Fetches emails for all configured email accounts.
-        Sends progress updates via WebSocket as each account is processed.
+        Queues a sync of all configured email accounts for the sync workers.
+        Progress updates arrive through the email updates group as accounts are processed.
         """
-        email_accounts = await sync_to_async(list)(EmailAccount.objects.all())
-
-        if not email_accounts:
+        if not await sync_to_async(EmailAccount.objects.exists)():
             await self.send(json.dumps({"error": "No email accounts configured."}))
             return
-        await asyncio.gather(
-            *[
-                fetch_emails_for_account(account, self.send)
-                for account in email_accounts
-            ]
-        )
-        await self.send(json.dumps({"status": "complete"}))
+        await self.channel_layer.send(SYNC_CHANNEL, {"type": "sync.request"})
+
+
+@functools.lru_cache(maxsize=16)
+def _deflate(text_data):
+    """Compresses a frame; cached, as every consumer of the process sends the same frames."""
+    return zlib.compress(text_data.encode())
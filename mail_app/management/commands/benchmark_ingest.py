@@ -0,0 +1,115 @@
+import json
+import os
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from mail_app.benchmarks.ingest import run_ingest_benchmark
+from mail_app.benchmarks.mailbox import generate_messages
+
+# Relative change of a metric reported as a regression against the baseline
+REGRESSION_THRESHOLD = 0.1
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmarks email ingest against a local fake IMAP server and a test database, "
+        "and saves the results as JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--messages", type=int, default=1000)
+        parser.add_argument("--accounts", type=int, default=1)
+        parser.add_argument(
+            "--body-size", type=int, default=2048, help="Body length in characters."
+        )
+        parser.add_argument("--html-ratio", type=float, default=0.5)
+        parser.add_argument("--attachment-ratio", type=float, default=0.1)
+        parser.add_argument(
+            "--attachment-size", type=int, default=64 * 1024, help="In bytes."
+        )
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument(
+            "--via",
+            choices=["service", "consumer"],
+            default="service",
+            help="Call fetch_emails_for_account directly or go through EmailConsumer.",
+        )
+        parser.add_argument("--keepdb", action="store_true")
+        parser.add_argument(
+            "--output",
+            help="Result file; defaults to benchmarks/ingest-<timestamp>.json.",
+        )
+        parser.add_argument(
+            "--baseline", help="Earlier result file to compare the results with."
+        )
+
+    def handle(self, *args, **options):
+        messages = generate_messages(
+            options["messages"],
+            body_size=options["body_size"],
+            html_ratio=options["html_ratio"],
+            attachment_ratio=options["attachment_ratio"],
+            attachment_size=options["attachment_size"],
+            seed=options["seed"],
+        )
+        results = run_ingest_benchmark(
+            messages,
+            accounts=options["accounts"],
+            via=options["via"],
+            keepdb=options["keepdb"],
+        )
+        results["generator"] = {
+            name: options[name]
+            for name in (
+                "body_size",
+                "html_ratio",
+                "attachment_ratio",
+                "attachment_size",
+                "seed",
+            )
+        }
+
+        self.stdout.write(
+            f"{results['messages']} messages in {results['seconds']}s: "
+            f"{results['messages_per_second']} msgs/s, "
+            f"p50 {results['latency_ms']['p50']} ms, "
+            f"p99 {results['latency_ms']['p99']} ms, "
+            f"{results['queries_per_message']} queries/msg, "
+            f"peak RSS {results['peak_rss_mb']['main']} MB "
+            f"(parsers {results['peak_rss_mb']['parsers']} MB)"
+        )
+
+        output = options["output"] or os.path.join(
+            settings.BASE_DIR,
+            "benchmarks",
+            f"ingest-{time.strftime('%Y%m%d-%H%M%S')}.json",
+        )
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        with open(output, "w") as f:
+            json.dump(results, f, indent=2)
+        self.stdout.write(f"Results saved to {output}")
+
+        if options["baseline"]:
+            with open(options["baseline"]) as f:
+                self.compare(results, json.load(f))
+
+    def compare(self, results, baseline):
+        """Prints the change of every metric and flags the ones that got worse."""
+        metrics = [
+            ("messages_per_second", lambda r: r["messages_per_second"], True),
+            ("latency p50", lambda r: r["latency_ms"]["p50"], False),
+            ("latency p99", lambda r: r["latency_ms"]["p99"], False),
+            ("queries_per_message", lambda r: r["queries_per_message"], False),
+            ("peak_rss_mb", lambda r: r["peak_rss_mb"]["main"], False),
+        ]
+        for name, value, higher_is_better in metrics:
+            current, previous = value(results), value(baseline)
+            if not current or not previous:
+                continue
+            change = (current - previous) / previous
+            line = f"{name}: {previous} -> {current} ({change:+.1%})"
+            worse = -change if higher_is_better else change
+            if worse > REGRESSION_THRESHOLD:
+                self.stdout.write(self.style.WARNING(f"{line} regression"))
+            else:
+                self.stdout.write(line)
@@ -0,0 +1,23 @@
+import asyncio
+from django.core.management.base import BaseCommand
+from mail_app.utils.idle_listener import run_idle_listeners
+from mail_app.utils.metrics import start_metrics_server
+
+
+class Command(BaseCommand):
+    help = "Listens for new mail with IMAP IDLE and pushes it to connected clients."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--accounts",
+            nargs="+",
+            metavar="EMAIL",
+            help="Only listen on these email accounts.",
+        )
+
+    def handle(self, *args, **options):
+        start_metrics_server()
+        try:
+            asyncio.run(run_idle_listeners(options["accounts"]))
+        except KeyboardInterrupt:
+            pass
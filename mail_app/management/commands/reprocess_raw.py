@@ -0,0 +1,110 @@
+import itertools
+import multiprocessing
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from mail_app.models import EmailMessage
+from mail_app.utils import raw_archive
+from mail_app.utils.email_utils import store_reparsed
+from mail_app.utils.mime_parser import ParseFailure
+from mail_app.utils.parser_worker import init_worker, reparse_archived
+
+
+class Command(BaseCommand):
+    help = (
+        "Parses the archived raw messages again and rewrites what was stored from "
+        "them, without fetching anything from IMAP."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--accounts",
+            nargs="+",
+            metavar="EMAIL",
+            help="Only reprocess the messages of these email accounts.",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=max(settings.EMAIL_PARSE_WORKERS, 1),
+            help="Number of parser processes.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Messages parsed by a process and stored at a time.",
+        )
+
+    def handle(self, *args, **options):
+        if not raw_archive.is_enabled():
+            raise CommandError("EMAIL_RAW_ARCHIVE_DIR is not set.")
+
+        messages = EmailMessage.objects.filter(raw_segment__isnull=False)
+        if options["accounts"]:
+            messages = messages.filter(email_account__email__in=options["accounts"])
+        # In archive order, so every segment is read front to back
+        messages = messages.only(
+            "id",
+            "email_account_id",
+            "uid",
+            "sent_at",
+            "raw_segment",
+            "raw_offset",
+            "raw_length",
+            "content",
+            "thread",
+        ).order_by("raw_segment", "raw_offset")
+
+        workers, batch_size = options["workers"], options["batch_size"]
+        totals = Counter(reprocessed=0, failed=0)
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=init_worker,
+        ) as executor:
+            # Enough batches in flight to keep every process busy while one is stored
+            pending = deque()
+            for batch in _batched(messages.iterator(chunk_size=batch_size), batch_size):
+                items = [
+                    (
+                        email_msg.uid,
+                        email_msg.raw_segment,
+                        email_msg.raw_offset,
+                        email_msg.raw_length,
+                    )
+                    for email_msg in batch
+                ]
+                pending.append((batch, executor.submit(reparse_archived, items)))
+                if len(pending) > workers * 2:
+                    totals.update(self._store(*pending.popleft()))
+            while pending:
+                totals.update(self._store(*pending.popleft()))
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Reprocessed {totals['reprocessed']} messages, "
+                f"{totals['failed']} could not be parsed."
+            )
+        )
+
+    def _store(self, batch, future):
+        """Stores the parse results of a batch and returns the counts."""
+        pairs = []
+        for email_msg, result in zip(batch, future.result()):
+            if isinstance(result, ParseFailure):
+                self.stderr.write(f"Message {email_msg.pk}: {result.error}")
+            else:
+                pairs.append((email_msg, result))
+        if pairs:
+            store_reparsed(pairs)
+        self.stdout.write(f"Reprocessed a batch of {len(pairs)} messages.")
+        return {"reprocessed": len(pairs), "failed": len(batch) - len(pairs)}
+
+
+def _batched(iterable, size):
+    """Yields lists of up to ``size`` consecutive items."""
+    iterator = iter(iterable)
+    while batch := list(itertools.islice(iterator, size)):
+        yield batch
@@ -0,0 +1,25 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from mail_app.utils.attachment_storage import sweep_blobs
+
+
+class Command(BaseCommand):
+    help = (
+        "Deletes the attachment blobs and blob files no attachment uses anymore. "
+        "Meant to run periodically, e.g. from cron."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--min-age",
+            type=int,
+            default=settings.ATTACHMENT_SWEEP_MIN_AGE,
+            help="Seconds since their last change before files without a blob are "
+            "deleted.",
+        )
+
+    def handle(self, *args, **options):
+        deleted_blobs, deleted_files = sweep_blobs(options["min_age"])
+        self.stdout.write(
+            f"Deleted {deleted_blobs} unreferenced blobs and {deleted_files} stray files."
+        )
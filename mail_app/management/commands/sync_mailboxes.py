@@ -0,0 +1,109 @@
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from mail_app.models import EmailAccount
+from mail_app.utils.backfill_worker import init_worker, sync_account
+
+
+class Command(BaseCommand):
+    help = (
+        "Syncs email accounts in parallel processes, e.g. for backfills run from cron, "
+        "and prints a throughput summary."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--accounts",
+            nargs="+",
+            metavar="EMAIL",
+            help="Only sync these email accounts.",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=os.cpu_count() or 1,
+            help="Number of sync processes; each syncs one account at a time.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=settings.EMAIL_FETCH_BATCH_SIZE,
+            help="Messages per UID FETCH.",
+        )
+        parser.add_argument(
+            "--since",
+            type=date.fromisoformat,
+            metavar="YYYY-MM-DD",
+            help="Only ingest messages received on or after this day.",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only count the messages that would be ingested.",
+        )
+
+    def handle(self, *args, **options):
+        accounts = EmailAccount.objects.order_by("pk")
+        if options["accounts"]:
+            accounts = accounts.filter(email__in=options["accounts"])
+        account_ids = list(accounts.values_list("pk", flat=True))
+        if not account_ids:
+            raise CommandError("No email accounts to sync.")
+
+        # The accounts already spread the work over the cores, so every process
+        # parses in a thread instead of starting parser processes of its own
+        overrides = {
+            "EMAIL_FETCH_BATCH_SIZE": options["batch_size"],
+            "EMAIL_PARSE_WORKERS": 0,
+        }
+        results = []
+        started = time.perf_counter()
+        with ProcessPoolExecutor(
+            max_workers=min(options["workers"], len(account_ids)),
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=init_worker,
+            initargs=(overrides,),
+        ) as executor:
+            futures = [
+                executor.submit(
+                    sync_account, account_id, options["since"], options["dry_run"]
+                )
+                for account_id in account_ids
+            ]
+            for future in as_completed(futures):
+                result = future.result()
+                results.append(result)
+                self._report(result, options["dry_run"])
+        elapsed = time.perf_counter() - started
+
+        messages = sum(result["messages"] or 0 for result in results)
+        failed = sum(bool(result["errors"]) for result in results)
+        if options["dry_run"]:
+            summary = f"{messages} new messages in {len(results)} accounts"
+        else:
+            megabytes = sum(result["bytes"] for result in results) / 1024 / 1024
+            summary = (
+                f"Synced {len(results)} accounts in {elapsed:.1f}s: "
+                f"{messages} messages ({messages / elapsed:.1f} msgs/s), "
+                f"{megabytes:.1f} MB ({megabytes / elapsed:.2f} MB/s)"
+            )
+        summary += f", {failed} with errors."
+        style = self.style.WARNING if failed else self.style.SUCCESS
+        self.stdout.write(style(summary))
+
+    def _report(self, result, dry_run):
+        """Prints the outcome of one account."""
+        if dry_run:
+            line = f"{result['account']}: {result['messages']} new messages"
+        else:
+            line = (
+                f"{result['account']}: {result['messages']} messages "
+                f"in {result['seconds']:.1f}s"
+            )
+        self.stdout.write(line)
+        for error in result["errors"]:
+            self.stderr.write(f"{result['account']}: {error}")
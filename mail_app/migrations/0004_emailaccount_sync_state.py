@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mail_app", "0003_remove_emailaccount_highest_uid"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="emailaccount",
+            name="highest_uid",
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="emailaccount",
+            name="uid_validity",
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+    ]
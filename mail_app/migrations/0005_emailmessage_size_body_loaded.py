@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mail_app", "0004_emailaccount_sync_state"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="emailmessage",
+            name="body_loaded",
+            field=models.BooleanField(default=True),
+        ),
+        migrations.AddField(
+            model_name="emailmessage",
+            name="size",
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name="emailmessage",
+            index=models.Index(
+                condition=models.Q(("body_loaded", False)),
+                fields=["email_account", "uid"],
+                name="email_message_pending_body_idx",
+            ),
+        ),
+    ]
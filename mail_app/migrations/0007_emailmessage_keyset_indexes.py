@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mail_app", "0006_attachment_blobs"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="emailmessage",
+            name="email_messa_receive_733b11_idx",
+        ),
+        migrations.AddIndex(
+            model_name="emailmessage",
+            index=models.Index(
+                fields=["received_at", "id"], name="email_messa_receive_6c0a62_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="emailmessage",
+            index=models.Index(
+                fields=["email_account", "received_at", "id"],
+                name="email_messa_email_a_827828_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:45
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.conf import settings
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+from django.db.models.functions import Left
+
+
+def fill_search_vectors(apps, schema_editor):
+    # The document as defined at this point; bodies later moved to email_bodies
+    EmailMessage = apps.get_model("mail_app", "EmailMessage")
+    config = settings.EMAIL_SEARCH_CONFIG
+    EmailMessage.objects.update(
+        search_vector=SearchVector("subject", weight="A", config=config)
+        + SearchVector("from_address", weight="B", config=config)
+        + SearchVector(Left("body", 100_000), weight="C", config=config)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mail_app", "0007_emailmessage_keyset_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="emailmessage",
+            name="search_vector",
+            field=django.contrib.postgres.search.SearchVectorField(
+                editable=False, null=True
+            ),
+        ),
+        migrations.RunPython(fill_search_vectors, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="emailmessage",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["search_vector"], name="email_message_search_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:58
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mail_app", "0008_emailmessage_search_vector"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SyncFailure",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("uid", models.CharField(max_length=255)),
+                (
+                    "stage",
+                    models.CharField(
+                        choices=[("message", "Message"), ("body", "Body")],
+                        max_length=20,
+                    ),
+                ),
+                ("error", models.TextField()),
+                ("attempts", models.PositiveIntegerField(default=1)),
+                ("next_retry_at", models.DateTimeField()),
+                ("quarantined", models.BooleanField(default=False)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "email_account",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="sync_failures",
+                        to="mail_app.emailaccount",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Sync Failure",
+                "verbose_name_plural": "Sync Failures",
+                "db_table": "sync_failures",
+                "unique_together": {("email_account", "uid", "stage")},
+            },
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:03
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mail_app", "0009_sync_failures"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="emailmessage",
+            name="snippet",
+            field=models.CharField(blank=True, default="", max_length=255),
+        ),
+        migrations.CreateModel(
+            name="EmailBody",
+            fields=[
+                (
+                    "email_message",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="body_content",
+                        serialize=False,
+                        to="mail_app.emailmessage",
+                    ),
+                ),
+                ("text", models.TextField()),
+            ],
+            options={
+                "verbose_name": "Email Body",
+                "verbose_name_plural": "Email Bodies",
+                "db_table": "email_bodies",
+            },
+        ),
+        migrations.RunSQL(
+            [
+                "INSERT INTO email_bodies (email_message_id, text) "
+                "SELECT id, body FROM email_message WHERE body IS NOT NULL",
+                "UPDATE email_message SET snippet = left(btrim(regexp_replace("
+                "left(body, 800), '\\s+', ' ', 'g')), 200) WHERE body IS NOT NULL",
+            ],
+            [
+                "UPDATE email_message SET body = email_bodies.text FROM email_bodies "
+                "WHERE email_bodies.email_message_id = email_message.id",
+            ],
+        ),
+        migrations.RemoveField(
+            model_name="emailmessage",
+            name="body",
+        ),
+    ]
@@ -0,0 +1,157 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:10
+
+import django.contrib.postgres.fields
+import django.contrib.postgres.indexes
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mail_app", "0011_emailmessage_raw_location"),
+    ]
+
+    operations = [
+        # Bodies get an id of their own, so several messages can share one
+        migrations.AlterModelTable(name="emailbody", table="email_bodies_old"),
+        migrations.RenameModel(old_name="EmailBody", new_name="OldEmailBody"),
+        migrations.CreateModel(
+            name="EmailBody",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("text", models.TextField()),
+            ],
+            options={
+                "verbose_name": "Email Body",
+                "verbose_name_plural": "Email Bodies",
+                "db_table": "email_bodies",
+            },
+        ),
+        migrations.AddField(
+            model_name="emailmessage",
+            name="content",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="messages",
+                to="mail_app.emailbody",
+            ),
+        ),
+        migrations.RunSQL(
+            [
+                "INSERT INTO email_bodies (id, text) "
+                "SELECT email_message_id, text FROM email_bodies_old",
+                "SELECT setval(pg_get_serial_sequence('email_bodies', 'id'), "
+                "coalesce(max(id), 0) + 1, false) FROM email_bodies",
+                "UPDATE email_message SET content_id = id "
+                "WHERE id IN (SELECT id FROM email_bodies)",
+            ],
+            [
+                "INSERT INTO email_bodies_old (email_message_id, text) "
+                "SELECT email_message.id, email_bodies.text FROM email_message "
+                "JOIN email_bodies ON email_bodies.id = email_message.content_id",
+            ],
+        ),
+        migrations.DeleteModel(name="OldEmailBody"),
+        migrations.AddField(
+            model_name="emailmessage",
+            name="in_reply_to",
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+        migrations.AddField(
+            model_name="emailmessage",
+            name="message_id",
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+        migrations.AddField(
+            model_name="emailmessage",
+            name="references",
+            field=django.contrib.postgres.fields.ArrayField(
+                base_field=models.CharField(max_length=255),
+                blank=True,
+                default=list,
+                size=None,
+            ),
+        ),
+        migrations.CreateModel(
+            name="Thread",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("subject", models.CharField(blank=True, max_length=255, null=True)),
+                ("message_count", models.PositiveIntegerField(default=0)),
+                ("last_message_at", models.DateTimeField(blank=True, null=True)),
+                (
+                    "email_account",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="threads",
+                        to="mail_app.emailaccount",
+                    ),
+                ),
+            ],
+            options={
+                "db_table": "threads",
+            },
+        ),
+        migrations.AddField(
+            model_name="emailmessage",
+            name="thread",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="messages",
+                to="mail_app.thread",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="emailmessage",
+            index=models.Index(
+                fields=["message_id"], name="email_messa_message_3b2a61_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="emailmessage",
+            index=models.Index(
+                fields=["email_account", "in_reply_to"],
+                name="email_messa_email_a_58353d_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="emailmessage",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["references"], name="email_message_references_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="emailmessage",
+            index=models.Index(
+                fields=["thread", "sent_at"], name="email_messa_thread__1df50f_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="thread",
+            index=models.Index(
+                fields=["email_account", "last_message_at"],
+                name="threads_email_a_855676_idx",
+            ),
+        ),
+    ]
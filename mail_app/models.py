@@ -1,3 +1,6 @@
+from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
 import uuid
 
@@ -22,6 +25,12 @@ class EmailAccount(models.Model):
         email (EmailField): The email address for the account.
         password (CharField): The account password (stored securely).
         provider (CharField): The email provider (e.g., Yandex, Mail.ru, Gmail).
+        uid_validity (BigIntegerField): UIDVALIDITY of the inbox at the last sync.
+        highest_uid (BigIntegerField): Highest inbox UID ingested so far.
+        highest_modseq (BigIntegerField): HIGHESTMODSEQ of the inbox when flags and
+            deletions were last synced, for CONDSTORE servers.
+        state_checked_at (DateTimeField): When stored messages were last compared
+            with the whole inbox.
     """
 
     email = models.EmailField(unique=True)
@@ -29,6 +38,10 @@ class EmailAccount(models.Model):
     provider = models.CharField(
         max_length=20, choices=Provider.choices, default=Provider.GMAIL
     )
+    uid_validity = models.BigIntegerField(null=True, blank=True)
+    highest_uid = models.BigIntegerField(default=0)
+    highest_modseq = models.BigIntegerField(null=True, blank=True)
+    state_checked_at = models.DateTimeField(null=True, blank=True)
 
     def __str__(self):
         """Returns a human-readable string representation of the email account."""
@@ -40,6 +53,62 @@ class EmailAccount(models.Model):
         verbose_name_plural = "Email Accounts"
 
 
+class Thread(models.Model):
+    """
+    Model representing a conversation of an email account.
+
+    Messages are grouped by their Message-ID, In-Reply-To and References headers as
+    they are ingested, so a conversation is read with one indexed query.
+
+    Attributes:
+        email_account (ForeignKey): The email account the conversation belongs to.
+        subject (CharField): The subject of the earliest message.
+        message_count (PositiveIntegerField): Number of messages in the thread.
+        last_message_at (DateTimeField): When the latest message was sent.
+    """
+
+    email_account = models.ForeignKey(
+        EmailAccount, related_name="threads", on_delete=models.CASCADE
+    )
+    subject = models.CharField(max_length=255, blank=True, null=True)
+    message_count = models.PositiveIntegerField(default=0)
+    last_message_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = "threads"
+        indexes = [
+            models.Index(fields=["email_account", "last_message_at"]),
+        ]
+
+    def __str__(self):
+        """Returns a human-readable string representation of the thread."""
+        return f"{self.subject} ({self.message_count})"
+
+
+class EmailBody(models.Model):
+    """
+    Model holding the full body of email messages.
+
+    Bodies live in their own table, so listings and scans of ``email_message`` never
+    read them; Postgres compresses large values out of line (TOAST). A message that
+    reaches several accounts shares one body.
+
+    Attributes:
+        text (TextField): The body text.
+    """
+
+    text = models.TextField()
+
+    class Meta:
+        db_table = "email_bodies"
+        verbose_name = "Email Body"
+        verbose_name_plural = "Email Bodies"
+
+    def __str__(self):
+        """Returns a human-readable string representation of the body."""
+        return f"Body {self.pk}"
+
+
 class EmailMessage(models.Model):
     """
     Model representing an email message.
@@ -50,8 +119,25 @@ class EmailMessage(models.Model):
         subject (CharField): The subject of the email.
         sent_at (DateTimeField): The time when the email was sent.
         received_at (DateTimeField): The time when the email was received.
-        body (TextField): The body of the email.
+        snippet (CharField): The start of the body with collapsed whitespace, for
+            listings; the full body is kept in EmailBody.
         from_address (EmailField): The sender's email address.
+        size (PositiveIntegerField): The size of the raw message in bytes (RFC822.SIZE).
+        body_loaded (BooleanField): Whether the body and attachments have been fetched.
+        search_vector (SearchVectorField): Full-text document of the subject, sender
+            and body, maintained on ingest.
+        raw_segment (PositiveIntegerField): The raw archive segment holding the raw
+            message, or None if it is not archived.
+        raw_offset (PositiveBigIntegerField): The offset of the compressed raw message
+            in the segment.
+        raw_length (PositiveIntegerField): The compressed length of the raw message.
+        message_id (CharField): The Message-ID header, without angle brackets.
+        in_reply_to (CharField): The Message-ID of the parent message.
+        references (ArrayField): The Message-IDs of the References header.
+        content (ForeignKey): The body, shared by the copies of a message in several
+            accounts.
+        thread (ForeignKey): The conversation the message belongs to.
+        flags (ArrayField): The IMAP flags of the message, e.g. ``\\Seen``.
     """
 
     email_account = models.ForeignKey(
@@ -61,8 +147,32 @@ class EmailMessage(models.Model):
     subject = models.CharField(max_length=255, blank=True, null=True)
     sent_at = models.DateTimeField(null=True, blank=True)
     received_at = models.DateTimeField(null=True, blank=True)
-    body = models.TextField(blank=True, null=True)
+    snippet = models.CharField(max_length=255, blank=True, default="")
     from_address = models.EmailField(blank=True, null=True)
+    size = models.PositiveIntegerField(null=True, blank=True)
+    body_loaded = models.BooleanField(default=True)
+    search_vector = SearchVectorField(null=True, editable=False)
+    raw_segment = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    raw_offset = models.PositiveBigIntegerField(null=True, blank=True, editable=False)
+    raw_length = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    message_id = models.CharField(max_length=255, blank=True, null=True)
+    in_reply_to = models.CharField(max_length=255, blank=True, null=True)
+    references = ArrayField(models.CharField(max_length=255), blank=True, default=list)
+    content = models.ForeignKey(
+        EmailBody,
+        related_name="messages",
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+    )
+    thread = models.ForeignKey(
+        Thread,
+        related_name="messages",
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+    )
+    flags = ArrayField(models.CharField(max_length=64), blank=True, default=list)
 
     class Meta:
         db_table = "email_message"
@@ -70,13 +180,55 @@ class EmailMessage(models.Model):
         unique_together = ("email_account", "uid")
         indexes = [
             models.Index(fields=["email_account", "uid"]),
-            models.Index(fields=["received_at"]),
+            models.Index(fields=["received_at", "id"]),
+            models.Index(fields=["email_account", "received_at", "id"]),
+            models.Index(
+                fields=["email_account", "uid"],
+                condition=models.Q(body_loaded=False),
+                name="email_message_pending_body_idx",
+            ),
+            GinIndex(fields=["search_vector"], name="email_message_search_idx"),
+            models.Index(fields=["message_id"]),
+            models.Index(fields=["email_account", "in_reply_to"]),
+            GinIndex(fields=["references"], name="email_message_references_idx"),
+            models.Index(fields=["thread", "sent_at"]),
         ]
 
     def __str__(self):
         """Returns a human-readable string representation of the email message."""
         return f"Subject: {self.subject}, Sent at: {self.sent_at}"
 
+    @property
+    def body(self):
+        """The full body text, or None if it is not loaded."""
+        return self.content.text if self.content_id else None
+
+
+class AttachmentBlob(models.Model):
+    """
+    Model representing attachment content stored once per distinct SHA-256 digest.
+
+    Attributes:
+        sha256 (CharField): Hex SHA-256 digest of the content.
+        file (FileField): The stored content.
+        size (PositiveBigIntegerField): The content size in bytes.
+        ref_count (PositiveIntegerField): Number of attachments referencing the blob.
+    """
+
+    sha256 = models.CharField(max_length=64, primary_key=True)
+    file = models.FileField(upload_to="blobs/")
+    size = models.PositiveBigIntegerField()
+    ref_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        db_table = "attachment_blobs"
+        verbose_name = "Attachment Blob"
+        verbose_name_plural = "Attachment Blobs"
+
+    def __str__(self):
+        """Returns a human-readable string representation of the blob."""
+        return self.sha256
+
 
 class Attachment(models.Model):
     """
@@ -87,6 +239,9 @@ class Attachment(models.Model):
         email_message (ForeignKey): The email message to which this attachment belongs.
         file (FileField): The file associated with the attachment.
         filename (CharField): The original name of the file.
+        blob (ForeignKey): The deduplicated content of the attachment.
+        sha256 (CharField): Hex SHA-256 digest of the content.
+        size (PositiveBigIntegerField): The content size in bytes.
     """
 
     uuid = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -95,6 +250,15 @@ class Attachment(models.Model):
     )
     file = models.FileField(upload_to="attachments/")
     filename = models.CharField(max_length=255)
+    blob = models.ForeignKey(
+        AttachmentBlob,
+        related_name="attachments",
+        on_delete=models.PROTECT,
+        null=True,
+        blank=True,
+    )
+    sha256 = models.CharField(max_length=64, blank=True, null=True)
+    size = models.PositiveBigIntegerField(null=True, blank=True)
 
     class Meta:
         db_table = "attachments"
@@ -107,3 +271,51 @@ class Attachment(models.Model):
     def __str__(self):
         """Returns a human-readable string representation of the attachment."""
         return self.filename
+
+
+class SyncStage(models.TextChoices):
+    """
+    Enum-like class for the sync stages a message can fail in.
+    """
+
+    MESSAGE = "message", "Message"
+    BODY = "body", "Body"
+
+
+class SyncFailure(models.Model):
+    """
+    Model representing a message that failed to sync and is retried with backoff.
+
+    Attributes:
+        email_account (ForeignKey): The email account the message belongs to.
+        uid (CharField): UID of the message in the inbox.
+        stage (CharField): Whether storing the message or loading its body failed.
+        error (TextField): The last error.
+        attempts (PositiveIntegerField): Number of failed attempts so far.
+        next_retry_at (DateTimeField): When the message is retried next.
+        quarantined (BooleanField): Whether retries gave up on the message.
+        created_at (DateTimeField): When the message failed first.
+        updated_at (DateTimeField): When the message failed last.
+    """
+
+    email_account = models.ForeignKey(
+        EmailAccount, related_name="sync_failures", on_delete=models.CASCADE
+    )
+    uid = models.CharField(max_length=255)
+    stage = models.CharField(max_length=20, choices=SyncStage.choices)
+    error = models.TextField()
+    attempts = models.PositiveIntegerField(default=1)
+    next_retry_at = models.DateTimeField()
+    quarantined = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = "sync_failures"
+        verbose_name = "Sync Failure"
+        verbose_name_plural = "Sync Failures"
+        unique_together = ("email_account", "uid", "stage")
+
+    def __str__(self):
+        """Returns a human-readable string representation of the failure."""
+        return f"UID {self.uid} of {self.email_account_id} ({self.stage})"
@@ -1,6 +1,10 @@
 from django.urls import re_path
-from . import consumers
+from . import consumers, workers
 
 websocket_urlpatterns = [
     re_path(r"ws/emails/$", consumers.EmailConsumer.as_asgi()),
 ]
+
+channel_routes = {
+    workers.SYNC_CHANNEL: workers.EmailSyncWorker.as_asgi(),
+}
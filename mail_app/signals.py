@@ -0,0 +1,12 @@
+from django.db.models.signals import pre_delete
+from django.dispatch import receiver
+from mail_app.models import Attachment, EmailAccount
+from mail_app.utils.attachment_storage import release_attachments
+
+
+@receiver(pre_delete, sender=EmailAccount)
+def release_account_blobs(sender, instance, **kwargs):
+    """Drops the blob references of the account's attachments, deleted with it."""
+    release_attachments(
+        Attachment.objects.filter(email_message__email_account=instance)
+    )
@@ -0,0 +1,63 @@
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from mail_app.models import EmailAccount, EmailBody, EmailMessage
+from mail_app.utils.search import update_search_vectors
+from mail_app.workers import SYNC_CHANNEL
+
+_LOCAL_CACHE = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+_MEMORY_CHANNELS = {"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}}
+
+
+@override_settings(CACHES=_LOCAL_CACHE)
+class EmailListQueryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        account = EmailAccount.objects.create(email="a@example.com", password="p")
+        for uid in range(10):
+            EmailMessage.objects.create(
+                email_account=account,
+                uid=str(uid),
+                subject=f"invoice {uid}",
+                received_at=timezone.now(),
+                content=EmailBody.objects.create(text=f"body {uid}"),
+            )
+        update_search_vectors(EmailMessage.objects.all())
+
+    def test_list_with_bodies_does_not_query_per_row(self):
+        # Counts, page, bodies
+        with self.assertNumQueries(3):
+            response = self.client.get("/api/processed_emails/?fields=subject,body")
+        self.assertEqual(len(response.json()["emails"]), 10)
+        self.assertTrue(response.json()["emails"][0]["body"].startswith("body"))
+
+    def test_search_with_bodies_does_not_query_per_row(self):
+        # Page, bodies
+        with self.assertNumQueries(2):
+            response = self.client.get("/api/search/?q=invoice&fields=subject,body")
+        self.assertEqual(len(response.json()["emails"]), 10)
+
+
+@override_settings(CACHES=_LOCAL_CACHE, CHANNEL_LAYERS=_MEMORY_CHANNELS)
+class EmailDetailTests(TestCase):
+    def setUp(self):
+        account = EmailAccount.objects.create(email="a@example.com", password="p")
+        self.email = EmailMessage.objects.create(
+            email_account=account, uid="1", subject="hello", body_loaded=False
+        )
+
+    def test_headers_only_message_queues_its_body(self):
+        response = self.client.get(f"/api/processed_emails/{self.email.pk}/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["subject"], "hello")
+        message = async_to_sync(get_channel_layer().receive)(SYNC_CHANNEL)
+        self.assertEqual(message, {"type": "body.request", "message_id": self.email.pk})
+
+    def test_headers_only_response_is_not_cached(self):
+        self.client.get(f"/api/processed_emails/{self.email.pk}/")
+        EmailMessage.objects.filter(pk=self.email.pk).update(
+            content=EmailBody.objects.create(text="loaded"), body_loaded=True
+        )
+        response = self.client.get(f"/api/processed_emails/{self.email.pk}/")
+        self.assertEqual(response.json()["body"], "loaded")
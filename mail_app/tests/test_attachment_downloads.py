@@ -0,0 +1,51 @@
+import uuid
+from django.test import SimpleTestCase
+from mail_app.models import Attachment
+from mail_app.utils.attachment_downloads import (
+    download_url,
+    is_valid_token,
+    parse_range,
+)
+
+
+class ParseRangeTests(SimpleTestCase):
+    def test_closed_range(self):
+        self.assertEqual(parse_range("bytes=0-499", 1000), (0, 499))
+
+    def test_open_range_runs_to_the_end(self):
+        self.assertEqual(parse_range("bytes=500-", 1000), (500, 999))
+
+    def test_last_byte_is_capped_to_the_size(self):
+        self.assertEqual(parse_range("bytes=900-2000", 1000), (900, 999))
+
+    def test_suffix_range(self):
+        self.assertEqual(parse_range("bytes=-200", 1000), (800, 999))
+        self.assertEqual(parse_range("bytes=-2000", 1000), (0, 999))
+
+    def test_malformed_or_multiple_ranges_send_the_whole_file(self):
+        for header in ("bytes=-", "items=0-1", "bytes=0-1,5-6", "bytes=5-2"):
+            self.assertIsNone(parse_range(header, 1000), header)
+
+    def test_unsatisfiable_ranges(self):
+        for header, size in (
+            ("bytes=1000-", 1000),
+            ("bytes=-0", 1000),
+            ("bytes=-5", 0),
+        ):
+            with self.assertRaises(ValueError, msg=header):
+                parse_range(header, size)
+
+
+class DownloadTokenTests(SimpleTestCase):
+    def test_token_is_only_valid_for_its_attachment(self):
+        attachment = Attachment(pk=uuid.uuid4())
+        token = download_url(attachment).split("token=", 1)[1]
+        self.assertTrue(is_valid_token(attachment.pk, token))
+        self.assertFalse(is_valid_token(uuid.uuid4(), token))
+        self.assertFalse(is_valid_token(attachment.pk, ""))
+
+    def test_token_expires(self):
+        attachment = Attachment(pk=uuid.uuid4())
+        token = download_url(attachment).split("token=", 1)[1]
+        with self.settings(ATTACHMENT_URL_MAX_AGE=-1):
+            self.assertFalse(is_valid_token(attachment.pk, token))
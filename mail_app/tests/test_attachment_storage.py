@@ -0,0 +1,46 @@
+import base64
+import quopri
+from email.message import Message
+from unittest import mock
+from django.test import SimpleTestCase
+from mail_app.utils import attachment_storage
+from mail_app.utils.attachment_storage import iter_decoded_payload
+
+
+def make_part(payload, encoding):
+    part = Message()
+    part["Content-Type"] = "application/octet-stream"
+    if encoding:
+        part["Content-Transfer-Encoding"] = encoding
+    part.set_payload(payload)
+    return part
+
+
+# Small chunks, so the content spans many of them
+@mock.patch.object(attachment_storage, "_CHUNK_SIZE", 7)
+class IterDecodedPayloadTests(SimpleTestCase):
+    def setUp(self):
+        self.content = bytes(range(256)) * 4
+
+    def decode(self, part):
+        return b"".join(iter_decoded_payload(part))
+
+    def test_base64_with_line_breaks(self):
+        encoded = base64.encodebytes(self.content).decode()
+        chunks = list(iter_decoded_payload(make_part(encoded, "base64")))
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual(b"".join(chunks), self.content)
+
+    def test_base64_without_padding(self):
+        encoded = base64.b64encode(b"abcde").decode().rstrip("=")
+        self.assertEqual(self.decode(make_part(encoded, "base64")), b"abcde")
+
+    def test_quoted_printable_with_soft_line_breaks(self):
+        text = ("caf\xe9 " * 40).encode("latin-1")
+        encoded = quopri.encodestring(text).decode()
+        self.assertIn("=\n", encoded)
+        self.assertEqual(self.decode(make_part(encoded, "quoted-printable")), text)
+
+    def test_other_encodings_are_decoded_at_once(self):
+        chunks = list(iter_decoded_payload(make_part("plain text", "7bit")))
+        self.assertEqual(chunks, [b"plain text"])
@@ -0,0 +1,157 @@
+import json
+import shutil
+import tempfile
+from asgiref.sync import async_to_sync
+from django.db.models import Count
+from django.test import SimpleTestCase, TransactionTestCase, override_settings
+from mail_app.benchmarks.fake_imap import FakeIMAPServer, FakeMailbox
+from mail_app.benchmarks.mailbox import generate_messages
+from mail_app.models import Attachment, AttachmentBlob, EmailAccount, EmailMessage
+from mail_app.utils.email_service import (
+    _format_uid_set,
+    _iter_fetched_messages,
+    _parse_flags,
+    _vanished_uids,
+    fetch_emails_for_account,
+)
+from mail_app.utils.imap_pool import get_imap_pool
+
+
+class FormatUidSetTests(SimpleTestCase):
+    def test_consecutive_uids_collapse_into_ranges(self):
+        self.assertEqual(_format_uid_set([1, 2, 3, 5, 7, 8]), "1:3,5,7:8")
+
+    def test_bytes_uids(self):
+        self.assertEqual(_format_uid_set([b"9", b"10", b"12"]), "9:10,12")
+
+    def test_single_uid(self):
+        self.assertEqual(_format_uid_set([4]), "4")
+
+
+class IterFetchedMessagesTests(SimpleTestCase):
+    def test_attributes_before_the_literal(self):
+        data = [
+            (b"1 (UID 7 RFC822.SIZE 120 BODY[] {5}", b"hello"),
+            b")",
+            (b"2 (UID 9 RFC822.SIZE 80 BODY[] {3}", b"bye"),
+            b")",
+        ]
+        self.assertEqual(
+            list(_iter_fetched_messages(data)),
+            [("7", b"hello", 120), ("9", b"bye", 80)],
+        )
+
+    def test_attributes_after_the_literal(self):
+        data = [(b"1 (BODY[] {5}", b"hello"), b" UID 7 RFC822.SIZE 120)"]
+        self.assertEqual(list(_iter_fetched_messages(data)), [("7", b"hello", 120)])
+
+    def test_size_is_none_when_not_requested(self):
+        data = [(b"1 (UID 7 BODY[] {5}", b"hello"), b")"]
+        self.assertEqual(list(_iter_fetched_messages(data)), [("7", b"hello", None)])
+
+    def test_responses_without_uid_are_skipped(self):
+        data = [(b"1 (BODY[] {5}", b"hello"), b")", b"1 (FLAGS (\\Seen))"]
+        self.assertEqual(list(_iter_fetched_messages(data)), [])
+
+
+class ParseFlagsTests(SimpleTestCase):
+    def test_flags_by_uid(self):
+        data = [
+            b"1 (UID 3 FLAGS (\\Seen \\Flagged) MODSEQ (12))",
+            b"2 (UID 4 FLAGS ())",
+            None,
+        ]
+        self.assertEqual(_parse_flags(data), {"3": ["\\Seen", "\\Flagged"], "4": []})
+
+
+class VanishedUidsTests(SimpleTestCase):
+    def test_ranges_are_expanded_and_capped(self):
+        data = [b"(EARLIER) 3,5:7", b"12:10", None]
+        self.assertEqual(_vanished_uids(data, 11), ["3", "5", "6", "7", "10", "11"])
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+    EMAIL_SYNC_LEASE_REDIS_URL="",
+    EMAIL_PARSE_WORKERS=0,
+    EMAIL_FETCH_HEADERS_FIRST=False,
+    EMAIL_STATE_CHECK_INTERVAL=0,
+)
+class FetchEmailsForAccountTests(TransactionTestCase):
+    """Syncs against ``FakeIMAPServer``."""
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root))
+        self.mailbox = FakeMailbox(
+            generate_messages(6, attachment_ratio=0.5),
+            extensions=("CONDSTORE", "QRESYNC"),
+        )
+        server = FakeIMAPServer(self.mailbox)
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        self.enterContext(override_settings(IMAP_SERVER_OVERRIDE=server.start()))
+        self.account = EmailAccount.objects.create(email="a@example.com", password="p")
+
+    def sync(self):
+        frames = []
+
+        async def send(frame):
+            frames.append(json.loads(frame))
+
+        async def run():
+            await fetch_emails_for_account(self.account, send)
+            await get_imap_pool().close_all()
+
+        # Runs the ORM calls of the sync in this thread, on the test's connection
+        async_to_sync(run)()
+        self.account.refresh_from_db()
+        return frames
+
+    def stored_uids(self):
+        return sorted(map(int, EmailMessage.objects.values_list("uid", flat=True)))
+
+    def assertBlobCountsMatch(self):
+        references = dict(
+            Attachment.objects.values_list("blob").annotate(count=Count("pk"))
+        )
+        self.assertEqual(
+            dict(AttachmentBlob.objects.values_list("sha256", "ref_count")),
+            references,
+        )
+
+    def test_first_sync_stores_every_message(self):
+        frames = self.sync()
+        self.assertEqual(self.stored_uids(), [1, 2, 3, 4, 5, 6])
+        self.assertEqual(self.account.highest_uid, 6)
+        self.assertNotIn("error", json.dumps(frames))
+        self.assertBlobCountsMatch()
+
+    def test_later_sync_fetches_new_messages_only(self):
+        self.sync()
+        self.mailbox.add(generate_messages(7, seed=1)[-1])
+        self.sync()
+        self.assertEqual(self.stored_uids(), [1, 2, 3, 4, 5, 6, 7])
+        self.assertEqual(self.account.highest_uid, 7)
+
+    def test_sync_leaves_messages_unread(self):
+        self.sync()
+        self.assertEqual(self.mailbox.flags, {uid: set() for uid in range(1, 7)})
+
+    def test_flag_changes_and_expunges_are_applied(self):
+        self.sync()
+        self.mailbox.set_flags(2, "\\Seen")
+        self.mailbox.expunge(3)
+        self.sync()
+        self.assertEqual(self.stored_uids(), [1, 2, 4, 5, 6])
+        self.assertEqual(EmailMessage.objects.get(uid="2").flags, ["\\Seen"])
+        self.assertBlobCountsMatch()
+
+    def test_mailbox_reset_resyncs_and_releases_blobs(self):
+        self.sync()
+        self.mailbox.uid_validity = 2
+        self.sync()
+        self.assertEqual(self.stored_uids(), [1, 2, 3, 4, 5, 6])
+        self.assertEqual(self.account.uid_validity, 2)
+        self.assertBlobCountsMatch()
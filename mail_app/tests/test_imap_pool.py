@@ -0,0 +1,86 @@
+import asyncio
+from types import SimpleNamespace
+from django.test import SimpleTestCase, override_settings
+from mail_app.benchmarks.fake_imap import FakeIMAPServer, FakeMailbox
+from mail_app.utils.imap_pool import IMAPConnectionPool
+
+
+def make_account(pk):
+    return SimpleNamespace(
+        pk=pk, email=f"user{pk}@example.com", password="p", provider="gmail"
+    )
+
+
+@override_settings(IMAP_POOL_MAX_PER_PROVIDER=1, IMAP_LOGIN_RATE=0)
+class IMAPConnectionPoolTests(SimpleTestCase):
+    """Pools sessions of ``FakeIMAPServer``."""
+
+    def setUp(self):
+        server = FakeIMAPServer(FakeMailbox())
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        self.enterContext(override_settings(IMAP_SERVER_OVERRIDE=server.start()))
+
+    def run_with_pool(self, scenario):
+        async def run():
+            pool = IMAPConnectionPool()
+            try:
+                return await scenario(pool)
+            finally:
+                await pool.close_all()
+
+        return asyncio.run(run())
+
+    def test_released_session_is_reused(self):
+        async def scenario(pool):
+            account = make_account(1)
+            async with pool.connection(account) as first:
+                pass
+            async with pool.connection(account) as second:
+                return first, second
+
+        first, second = self.run_with_pool(scenario)
+        self.assertIs(first, second)
+
+    def test_session_is_discarded_when_the_block_raises(self):
+        async def scenario(pool):
+            account = make_account(1)
+            with self.assertRaises(RuntimeError):
+                async with pool.connection(account) as first:
+                    raise RuntimeError
+            async with pool.connection(account) as second:
+                return first, second
+
+        first, second = self.run_with_pool(scenario)
+        self.assertIsNot(first, second)
+
+    def test_expired_session_is_replaced(self):
+        async def scenario(pool):
+            account = make_account(1)
+            async with pool.connection(account) as first:
+                pass
+            with self.settings(IMAP_POOL_MAX_IDLE=-1):
+                async with pool.connection(account) as second:
+                    return first, second
+
+        first, second = self.run_with_pool(scenario)
+        self.assertIsNot(first, second)
+
+    def test_provider_cap_waits_for_a_session_and_evicts_idle_ones(self):
+        async def scenario(pool):
+            events = []
+
+            async def use(account, seconds):
+                async with pool.connection(account):
+                    events.append(("start", account.pk))
+                    await asyncio.sleep(seconds)
+                    events.append(("end", account.pk))
+
+            first = asyncio.ensure_future(use(make_account(1), 0.05))
+            await asyncio.sleep(0.01)
+            await asyncio.gather(first, use(make_account(2), 0))
+            return events, dict(pool._open), sum(map(len, pool._idle.values()))
+
+        events, open_sessions, idle = self.run_with_pool(scenario)
+        self.assertEqual(events, [("start", 1), ("end", 1), ("start", 2), ("end", 2)])
+        self.assertEqual((open_sessions, idle), ({"gmail": 1}, 1))
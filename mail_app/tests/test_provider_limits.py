@@ -0,0 +1,108 @@
+import asyncio
+import time
+from django.test import SimpleTestCase, override_settings
+from mail_app.utils.imap_client import _BODY_FETCH_RE
+from mail_app.utils.provider_limits import ProviderLimiter, TokenBucket, is_throttled
+
+
+class TokenBucketTests(SimpleTestCase):
+    def test_burst_is_free_then_tokens_are_paced(self):
+        bucket = TokenBucket(rate=50, burst=2)
+
+        async def acquire(count):
+            started = time.monotonic()
+            for _ in range(count):
+                await bucket.acquire()
+            return time.monotonic() - started
+
+        self.assertLess(asyncio.run(acquire(2)), 0.02)
+        self.assertGreaterEqual(asyncio.run(acquire(2)), 0.03)
+
+    def test_zero_rate_disables_the_bucket(self):
+        bucket = TokenBucket(rate=0, burst=1)
+
+        async def acquire():
+            for _ in range(100):
+                await bucket.acquire()
+
+        asyncio.run(acquire())
+
+
+class IsThrottledTests(SimpleTestCase):
+    def test_throttling_response_codes(self):
+        self.assertTrue(is_throttled("NO [THROTTLED] Too many commands"))
+        self.assertTrue(is_throttled("NO [limit] Try later"))
+        self.assertFalse(is_throttled("NO [AUTHENTICATIONFAILED] Invalid"))
+
+
+@override_settings(
+    IMAP_COMMAND_RATE=0,
+    IMAP_CONCURRENCY_MIN=1,
+    IMAP_CONCURRENCY_MAX=8,
+    IMAP_LATENCY_TARGET=0.01,
+    IMAP_THROTTLE_COOLDOWN=10,
+    IMAP_THROTTLE_MAX_COOLDOWN=15,
+)
+class ProviderLimiterTests(SimpleTestCase):
+    def run_commands(self, limiter, count=1, seconds=0, timed=True, throttled=False):
+        entered = []
+
+        async def command():
+            async with limiter.slot("command", timed) as slot:
+                entered.append((limiter.in_flight, int(limiter.limit)))
+                await asyncio.sleep(seconds)
+                slot.throttled = throttled
+
+        async def run():
+            await asyncio.gather(*(command() for _ in range(count)))
+
+        asyncio.run(run())
+        return entered
+
+    def test_limit_starts_halfway(self):
+        self.assertEqual(ProviderLimiter("test").limit, 4)
+
+    def test_successful_commands_raise_the_limit_up_to_the_maximum(self):
+        limiter = ProviderLimiter("test")
+        self.run_commands(limiter)
+        self.assertEqual(limiter.limit, 4 + 1 / 4)
+        for _ in range(50):
+            self.run_commands(limiter)
+        self.assertEqual(limiter.limit, 8)
+
+    def test_commands_in_flight_stay_within_the_limit(self):
+        limiter = ProviderLimiter("test")
+        entered = self.run_commands(limiter, count=12, seconds=0.001, timed=False)
+        self.assertTrue(all(in_flight <= limit for in_flight, limit in entered))
+        self.assertEqual(max(in_flight for in_flight, _ in entered), 4)
+
+    def test_slow_timed_command_cuts_the_limit(self):
+        limiter = ProviderLimiter("test")
+        self.run_commands(limiter, seconds=0.05)
+        self.assertEqual(limiter.limit, 4 * 0.8)
+
+    def test_untimed_command_does_not_measure_latency(self):
+        limiter = ProviderLimiter("test")
+        self.run_commands(limiter, seconds=0.05, timed=False)
+        self.assertIsNone(limiter.latency)
+        self.assertEqual(limiter.limit, 4 + 1 / 4)
+
+    def test_throttling_halves_the_limit_and_pauses_the_provider(self):
+        limiter = ProviderLimiter("test")
+        self.run_commands(limiter, throttled=True)
+        self.assertEqual(limiter.limit, 2)
+        self.assertGreater(limiter.paused_until - time.monotonic(), 9)
+        self.assertEqual(limiter.cooldown, 15)
+
+        limiter.paused_until = 0
+        self.run_commands(limiter)
+        self.assertEqual(limiter.cooldown, 10)
+
+    def test_body_fetches_are_recognized(self):
+        for items in ("(UID BODY.PEEK[])", "(UID BODY[])", "(UID RFC822)"):
+            self.assertTrue(_BODY_FETCH_RE.search(items), items)
+        for items in (
+            "(UID RFC822.SIZE BODY.PEEK[HEADER.FIELDS (SUBJECT FROM)])",
+            "(FLAGS)",
+        ):
+            self.assertFalse(_BODY_FETCH_RE.search(items), items)
@@ -0,0 +1,82 @@
+import asyncio
+from types import SimpleNamespace
+from unittest import mock
+from django.test import SimpleTestCase, override_settings
+from mail_app.utils.sync_lock import (
+    LeaseLost,
+    SyncLease,
+    account_sync_lease,
+    wait_for_sync,
+)
+
+ACCOUNT = SimpleNamespace(pk=1)
+
+
+@override_settings(
+    EMAIL_SYNC_LEASE_REDIS_URL="",
+    EMAIL_SYNC_LEASE_TTL=0.3,
+    EMAIL_SYNC_LEASE_POLL=0.01,
+)
+class AccountSyncLeaseTests(SimpleTestCase):
+    def test_second_sync_does_not_get_the_lease(self):
+        async def run():
+            async with account_sync_lease(ACCOUNT) as first:
+                async with account_sync_lease(ACCOUNT) as second:
+                    return first, second
+
+        self.assertEqual(asyncio.run(run()), (True, False))
+
+    def test_lease_is_released_after_the_block(self):
+        async def run():
+            async with account_sync_lease(ACCOUNT):
+                pass
+            async with account_sync_lease(ACCOUNT) as acquired:
+                return acquired
+
+        self.assertTrue(asyncio.run(run()))
+
+    def test_waiting_sync_takes_over_the_lease(self):
+        events = []
+
+        async def sync(name, wait):
+            async with account_sync_lease(ACCOUNT, wait=wait) as acquired:
+                events.append((name, acquired))
+                await asyncio.sleep(0.05)
+
+        async def run():
+            first = asyncio.ensure_future(sync("first", False))
+            await asyncio.sleep(0)
+            await asyncio.gather(first, sync("second", True))
+
+        asyncio.run(run())
+        self.assertEqual(events, [("first", True), ("second", True)])
+
+    def test_wait_for_sync_returns_once_the_lease_is_free(self):
+        async def run():
+            async def sync():
+                async with account_sync_lease(ACCOUNT):
+                    await asyncio.sleep(0.05)
+
+            task = asyncio.ensure_future(sync())
+            await asyncio.sleep(0)
+            await wait_for_sync(ACCOUNT)
+            return task.done()
+
+        self.assertTrue(asyncio.run(run()))
+
+    def lose_lease(self, renew):
+        async def run():
+            async with account_sync_lease(ACCOUNT):
+                await asyncio.sleep(1)
+
+        with mock.patch.object(SyncLease, "renew", renew):
+            with self.assertRaises(LeaseLost), self.assertLogs(
+                "mail_app.utils.sync_lock", "ERROR"
+            ):
+                asyncio.run(run())
+
+    def test_sync_stops_when_the_lease_is_taken_over(self):
+        self.lose_lease(mock.AsyncMock(return_value=False))
+
+    def test_sync_stops_when_renewals_fail_for_a_ttl(self):
+        self.lose_lease(mock.AsyncMock(side_effect=ConnectionError("down")))
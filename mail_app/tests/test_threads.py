@@ -0,0 +1,77 @@
+from django.test import TestCase
+from mail_app.models import EmailAccount, EmailMessage, Thread
+from mail_app.utils.threads import assign_threads
+
+
+class AssignThreadsTests(TestCase):
+    def setUp(self):
+        self.account = EmailAccount.objects.create(email="a@example.com", password="p")
+        self.uid = 0
+
+    def store(self, message_id, in_reply_to=None, references=()):
+        """Stores a message and threads it, as the sync does for every batch."""
+        self.uid += 1
+        email_msg = EmailMessage.objects.create(
+            email_account=self.account,
+            uid=str(self.uid),
+            subject=message_id,
+            message_id=message_id,
+            in_reply_to=in_reply_to,
+            references=list(references),
+        )
+        assign_threads(self.account, [email_msg])
+        email_msg.refresh_from_db()
+        return email_msg
+
+    def test_replies_to_missing_parent_share_a_thread(self):
+        first = self.store("b@x", in_reply_to="m@x", references=["m@x"])
+        second = self.store("c@x", in_reply_to="m@x", references=["m@x"])
+        self.assertEqual(first.thread_id, second.thread_id)
+
+    def test_replies_sharing_only_a_reference_share_a_thread(self):
+        first = self.store("b@x", references=["m@x"])
+        second = self.store("c@x", references=["root@x", "m@x"])
+        self.assertEqual(first.thread_id, second.thread_id)
+
+    def test_reply_before_parent(self):
+        reply = self.store("c@x", in_reply_to="b@x", references=["a@x", "b@x"])
+        root = self.store("a@x")
+        parent = self.store("b@x", in_reply_to="a@x", references=["a@x"])
+        self.assertEqual(
+            {reply.thread_id, root.thread_id, parent.thread_id}, {reply.thread_id}
+        )
+        thread = Thread.objects.get()
+        self.assertEqual(thread.message_count, 3)
+        self.assertEqual(thread.subject, "c@x")
+
+    def test_message_joining_two_threads_merges_them(self):
+        first = self.store("a@x")
+        second = self.store("c@x", in_reply_to="b@x")
+        self.assertNotEqual(first.thread_id, second.thread_id)
+        self.store("b@x", in_reply_to="a@x")
+        self.assertEqual(Thread.objects.count(), 1)
+        self.assertEqual(
+            set(EmailMessage.objects.values_list("thread_id", flat=True)),
+            {first.thread_id},
+        )
+
+    def test_unrelated_messages_get_their_own_threads(self):
+        first = self.store("a@x")
+        second = self.store("b@x", in_reply_to="z@x")
+        self.assertNotEqual(first.thread_id, second.thread_id)
+
+    def test_batch_is_threaded_together(self):
+        messages = [
+            EmailMessage.objects.create(
+                email_account=self.account,
+                uid=str(uid),
+                message_id=message_id,
+                in_reply_to=in_reply_to,
+            )
+            for uid, (message_id, in_reply_to) in enumerate(
+                [("b@x", "m@x"), ("c@x", "m@x"), ("d@x", None)], start=1
+            )
+        ]
+        assign_threads(self.account, messages)
+        self.assertEqual(messages[0].thread_id, messages[1].thread_id)
+        self.assertNotEqual(messages[0].thread_id, messages[2].thread_id)
@@ -1,6 +1,12 @@
 from django.urls import path
 from . import views
-from .api.views import ProcessedEmailListAPIView
+from .api.views import (
+    AttachmentDownloadAPIView,
+    EmailSearchAPIView,
+    ProcessedEmailDetailAPIView,
+    ProcessedEmailListAPIView,
+    ThreadDetailAPIView,
+)
 
 urlpatterns = [
     path("", views.email_list, name="email_list"),
@@ -9,4 +15,16 @@ urlpatterns = [
         ProcessedEmailListAPIView.as_view(),
         name="processed-emails",
     ),
+    path(
+        "api/processed_emails/<int:pk>/",
+        ProcessedEmailDetailAPIView.as_view(),
+        name="processed-email-detail",
+    ),
+    path("api/search/", EmailSearchAPIView.as_view(), name="email-search"),
+    path(
+        "api/attachments/<uuid:pk>/",
+        AttachmentDownloadAPIView.as_view(),
+        name="attachment-download",
+    ),
+    path("api/threads/<int:pk>/", ThreadDetailAPIView.as_view(), name="thread-detail"),
 ]
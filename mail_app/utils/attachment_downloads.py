@@ -0,0 +1,203 @@
+"""
+Authorized, resumable attachment downloads.
+
+Download URLs carry a signed token that expires after ``ATTACHMENT_URL_MAX_AGE``
+seconds, so they can be handed out with API responses and progress frames. The file
+is sent by the front server when ``ATTACHMENT_SENDFILE`` is set (nginx
+``X-Accel-Redirect`` or ``X-Sendfile``), which also handles Range requests. Otherwise
+Django streams it with ``FileResponse``, serving a single byte range itself.
+"""
+
+import mimetypes
+import re
+import time
+from django.conf import settings
+from django.core import signing
+from django.http import FileResponse, HttpResponse
+from django.urls import reverse
+from django.utils.http import content_disposition_header
+
+_SIGNER_SALT = "mail_app.attachment_download"
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def download_url(attachment):
+    """
+    Returns the signed download URL of an attachment.
+
+    Args:
+        attachment (Attachment): The attachment.
+
+    Returns:
+        str: The path of the download view with its ``token`` parameter.
+    """
+    signed = signing.TimestampSigner(salt=_SIGNER_SALT).sign(str(attachment.pk))
+    token = signed.split(":", 1)[1]
+    url = reverse("attachment-download", kwargs={"pk": attachment.pk})
+    return f"{url}?token={token}"
+
+
+def url_window():
+    """
+    Returns the start of the current issue window of download URLs.
+
+    Cached API responses embed download URLs, so they are cached per window of half
+    ``ATTACHMENT_URL_MAX_AGE``: a URL served from the cache stays valid for at least
+    that long.
+
+    Returns:
+        float: The start of the window as a Unix timestamp.
+    """
+    period = settings.ATTACHMENT_URL_MAX_AGE / 2
+    return time.time() // period * period
+
+
+def is_valid_token(attachment_id, token):
+    """
+    Checks the token of a download URL.
+
+    Args:
+        attachment_id (UUID): The primary key of the attachment.
+        token (str): The ``token`` parameter of the URL.
+
+    Returns:
+        bool: Whether the token was issued for the attachment and has not expired.
+    """
+    if not token:
+        return False
+    try:
+        signing.TimestampSigner(salt=_SIGNER_SALT).unsign(
+            f"{attachment_id}:{token}", max_age=settings.ATTACHMENT_URL_MAX_AGE
+        )
+    except signing.BadSignature:
+        return False
+    return True
+
+
+def parse_range(header, size):
+    """
+    Parses a single-range ``Range`` header, e.g. ``bytes=0-499``, ``bytes=500-`` or
+    ``bytes=-500``.
+
+    Args:
+        header (str): The header value.
+        size (int): The file size in bytes.
+
+    Returns:
+        tuple or None: The first and last byte positions, or None if the header is
+            malformed or asks for several ranges, in which case the whole file is sent.
+
+    Raises:
+        ValueError: If the range lies beyond the end of the file.
+    """
+    match = _RANGE_RE.match(header.replace(" ", ""))
+    if match is None or match.group(1) == match.group(2) == "":
+        return None
+    first, last = match.groups()
+    if first == "":
+        # A suffix range: the last N bytes
+        length = int(last)
+        if length == 0 or size == 0:
+            raise ValueError(header)
+        return max(size - length, 0), size - 1
+    first = int(first)
+    last = size - 1 if last == "" else min(int(last), size - 1)
+    if first > last:
+        if first < size:
+            return None
+        raise ValueError(header)
+    return first, last
+
+
+def attachment_response(request, attachment):
+    """
+    Builds the download response of an attachment.
+
+    The ETag is the SHA-256 of the content, so clients revalidate without a
+    transfer, and ``If-Range`` only resumes a download of the same content.
+
+    Args:
+        request (HttpRequest): The download request.
+        attachment (Attachment): The attachment to send.
+
+    Returns:
+        HttpResponse: The file, a byte range of it (206), Not Modified (304) or
+            Range Not Satisfiable (416).
+    """
+    etag = f'"{attachment.sha256}"' if attachment.sha256 else None
+    headers = {"Accept-Ranges": "bytes", "Cache-Control": "private, max-age=86400"}
+    if etag:
+        headers["ETag"] = etag
+        if _etags(request.headers.get("If-None-Match", "")) & {etag, "*"}:
+            return HttpResponse(status=304, headers=headers)
+
+    if settings.ATTACHMENT_SENDFILE:
+        return _offloaded_response(attachment, headers)
+
+    size = attachment.size if attachment.size is not None else attachment.file.size
+    byte_range = None
+    if_range = request.headers.get("If-Range")
+    if "Range" in request.headers and (if_range is None or if_range == etag):
+        try:
+            byte_range = parse_range(request.headers["Range"], size)
+        except ValueError:
+            headers["Content-Range"] = f"bytes */{size}"
+            return HttpResponse(status=416, headers=headers)
+
+    file = attachment.file.open("rb")
+    if byte_range is None:
+        response = FileResponse(file, as_attachment=True, filename=attachment.filename)
+    else:
+        first, last = byte_range
+        file.seek(first)
+        response = FileResponse(
+            _FileRange(file, last - first + 1),
+            status=206,
+            as_attachment=True,
+            filename=attachment.filename,
+        )
+        response["Content-Length"] = last - first + 1
+        response["Content-Range"] = f"bytes {first}-{last}/{size}"
+    for name, value in headers.items():
+        response[name] = value
+    return response
+
+
+def _offloaded_response(attachment, headers):
+    """Returns an empty response telling the front server to send the file."""
+    content_type = (
+        mimetypes.guess_type(attachment.filename)[0] or "application/octet-stream"
+    )
+    headers["Content-Disposition"] = content_disposition_header(
+        True, attachment.filename
+    )
+    if settings.ATTACHMENT_SENDFILE == "x-sendfile":
+        headers["X-Sendfile"] = attachment.file.path
+    else:
+        headers["X-Accel-Redirect"] = (
+            settings.ATTACHMENT_ACCEL_PREFIX.rstrip("/") + "/" + attachment.file.name
+        )
+    return HttpResponse(content_type=content_type, headers=headers)
+
+
+def _etags(header):
+    """Returns the entity tags listed in an If-None-Match header; ``*`` matches any."""
+    return {tag.strip().removeprefix("W/") for tag in header.split(",")}
+
+
+class _FileRange:
+    """Reads at most ``length`` bytes of a file from its current position."""
+
+    def __init__(self, file, length):
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size) if size else b""
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
@@ -0,0 +1,341 @@
+import base64
+import binascii
+import functools
+import hashlib
+import itertools
+import os
+import time
+import uuid
+from collections import Counter
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.db import transaction
+from django.db.models import Case, Count, F, OuterRef, Subquery, When
+from django.db.models.functions import Greatest
+from mail_app.models import Attachment, AttachmentBlob
+
+# Number of encoded characters decoded at a time
+_CHUNK_SIZE = 64 * 1024
+# Parsed attachments wait here until their message is stored
+_STAGING_DIR = "blobs/incoming/"
+
+
+def iter_decoded_payload(part):
+    """
+    Decodes the content-transfer-encoding of a MIME part chunk by chunk.
+
+    Args:
+        part (email.message.Message): The email part representing the attachment.
+
+    Returns:
+        generator: The decoded content as consecutive byte chunks.
+    """
+    encoding = (part.get("Content-Transfer-Encoding") or "").strip().lower()
+    payload = part.get_payload(decode=False)
+    if encoding not in ("base64", "quoted-printable") or not isinstance(payload, str):
+        yield part.get_payload(decode=True) or b""
+        return
+
+    if encoding == "base64":
+        leftover = ""
+        for start in range(0, len(payload), _CHUNK_SIZE):
+            data = leftover + "".join(payload[start : start + _CHUNK_SIZE].split())
+            aligned = len(data) - len(data) % 4
+            leftover = data[aligned:]
+            yield _b64decode(data[:aligned])
+        if leftover:
+            yield _b64decode(leftover + "=" * (-len(leftover) % 4))
+        return
+
+    start = 0
+    while start < len(payload):
+        # Cut at line ends so soft line breaks and =XX escapes are never split
+        end = payload.find("\n", start + _CHUNK_SIZE)
+        end = len(payload) if end == -1 else end + 1
+        yield binascii.a2b_qp(payload[start:end].encode("ascii", "surrogateescape"))
+        start = end
+
+
+def _b64decode(data):
+    """Decodes base64, tolerating the padding errors real-world mailers produce."""
+    try:
+        return base64.b64decode(data)
+    except binascii.Error:
+        return binascii.a2b_base64(data.encode() + b"==")
+
+
+def store_blob(part, filename):
+    """
+    Streams an attachment to a staging file of the blob storage while hashing it.
+
+    The parser runs before, and outside of, the transaction that stores the message,
+    so the content is only moved to its content-addressed name
+    ``blobs/<aa>/<bb>/<sha256><ext>`` by ``save_attachments``, under the blob's row lock.
+
+    Args:
+        part (email.message.Message): The email part representing the attachment.
+        filename (str): The original name of the file, used for the extension.
+
+    Returns:
+        tuple: The hex SHA-256 digest, the size in bytes and the staged storage name.
+    """
+    digest, size = hashlib.sha256(), 0
+    upload = TemporaryUploadedFile(filename or "attachment", None, 0, None)
+    try:
+        for chunk in iter_decoded_payload(part):
+            digest.update(chunk)
+            size += len(chunk)
+            upload.write(chunk)
+        upload.size = size
+        upload.seek(0)
+
+        extension = os.path.splitext(filename or "")[1][:16].lower()
+        name = default_storage.save(
+            f"{_STAGING_DIR}{uuid.uuid4().hex}{extension}", upload
+        )
+        return digest.hexdigest(), size, name
+    finally:
+        upload.close()
+
+
+def _blob_name(sha256, staged_name):
+    """Returns the content-addressed storage name of a blob."""
+    extension = os.path.splitext(staged_name)[1]
+    return f"blobs/{sha256[:2]}/{sha256[2:4]}/{sha256}{extension}"
+
+
+def _publish(staged_name, name):
+    """Moves a staged file to its blob name."""
+    try:
+        source, target = default_storage.path(staged_name), default_storage.path(name)
+    except NotImplementedError:
+        with default_storage.open(staged_name) as staged:
+            default_storage.save(name, staged)
+        default_storage.delete(staged_name)
+        return
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    os.replace(source, target)
+
+
+def save_attachments(attachments):
+    """
+    Inserts attachments built with ``store_blob`` data and counts their blob references.
+
+    Must run inside a transaction, so blob reference counts and attachment rows are
+    committed together. Whether a blob's file is written is decided under its row
+    lock, which ``delete_unreferenced_blobs`` takes as well, so a blob that is
+    referenced again while it is being deleted keeps (or gets back) its file.
+
+    Args:
+        attachments (list): Unsaved Attachment objects with ``blob_id``, ``size`` and
+            ``file`` set, the file being staged or, for copies, the blob's file.
+
+    Returns:
+        list: The inserted attachments.
+
+    Raises:
+        FileNotFoundError: If a blob has no file and no staged content to restore it.
+    """
+    references = Counter(
+        attachment.blob_id for attachment in attachments if attachment.blob_id
+    )
+    if references:
+        staged = {
+            attachment.file.name
+            for attachment in attachments
+            if attachment.blob_id and attachment.file.name.startswith(_STAGING_DIR)
+        }
+        sources = {attachment.blob_id: attachment for attachment in attachments}
+        # Rows are created and locked in digest order, so concurrent batches cannot
+        # deadlock on them
+        AttachmentBlob.objects.bulk_create(
+            [
+                AttachmentBlob(
+                    sha256=sha256,
+                    file=_blob_name(sha256, sources[sha256].file.name),
+                    size=sources[sha256].size,
+                )
+                for sha256 in sorted(references)
+            ],
+            ignore_conflicts=True,
+        )
+        blobs = AttachmentBlob.objects.select_for_update().filter(
+            sha256__in=list(references)
+        )
+        names = {}
+        for blob in blobs.order_by("sha256"):
+            names[blob.sha256] = blob.file.name
+            if default_storage.exists(blob.file.name):
+                continue
+            source = sources[blob.sha256].file.name
+            if source not in staged:
+                raise FileNotFoundError(f"Content of blob {blob.sha256} is missing")
+            _publish(source, blob.file.name)
+            staged.discard(source)
+        AttachmentBlob.objects.filter(sha256__in=list(references)).update(
+            ref_count=F("ref_count")
+            + Case(
+                *(
+                    When(sha256=sha256, then=count)
+                    for sha256, count in references.items()
+                ),
+                default=0,
+            )
+        )
+        # Content that was stored already; on a rollback the staged files are kept
+        # for the retry of the batch, and swept if it never comes
+        for name in staged:
+            transaction.on_commit(functools.partial(default_storage.delete, name))
+        for attachment in attachments:
+            if attachment.blob_id:
+                attachment.file.name = names[attachment.blob_id]
+    return Attachment.objects.bulk_create(attachments)
+
+
+def release_attachments(attachments):
+    """
+    Drops the blob references of attachments that are about to be deleted.
+
+    The counts are decremented in a single UPDATE, and the blobs left without
+    references are deleted once the transaction commits. Must run in the transaction
+    that deletes the attachments.
+
+    Args:
+        attachments (QuerySet): The attachments.
+
+    Returns:
+        None
+    """
+    with transaction.atomic():
+        blob_ids = list(
+            AttachmentBlob.objects.select_for_update()
+            .filter(sha256__in=attachments.values("blob"))
+            .order_by("sha256")
+            .values_list("sha256", flat=True)
+        )
+        if not blob_ids:
+            return
+        counts = (
+            attachments.filter(blob=OuterRef("sha256"))
+            .order_by()
+            .values("blob")
+            .annotate(count=Count("pk"))
+            .values("count")
+        )
+        AttachmentBlob.objects.filter(sha256__in=blob_ids).update(
+            ref_count=Greatest(F("ref_count") - Subquery(counts), 0)
+        )
+        unreferenced = list(
+            AttachmentBlob.objects.filter(sha256__in=blob_ids, ref_count=0).values_list(
+                "sha256", flat=True
+            )
+        )
+        if unreferenced:
+            transaction.on_commit(
+                functools.partial(delete_unreferenced_blobs, unreferenced)
+            )
+
+
+def delete_unreferenced_blobs(sha256s=None):
+    """
+    Deletes blobs without references, and their files.
+
+    The reference counts are checked again under the row locks, so a blob that an
+    ingest referenced in the meantime is kept.
+
+    Args:
+        sha256s (list, optional): Hex SHA-256 digests of the candidates; all blobs
+            without references if omitted.
+
+    Returns:
+        int: The number of deleted blobs.
+    """
+    with transaction.atomic():
+        blobs = AttachmentBlob.objects.select_for_update().filter(ref_count=0)
+        if sha256s is not None:
+            blobs = blobs.filter(sha256__in=sha256s)
+        names = dict(blobs.order_by("sha256").values_list("sha256", "file"))
+        AttachmentBlob.objects.filter(sha256__in=list(names)).delete()
+        for name in names.values():
+            default_storage.delete(name)
+    return len(names)
+
+
+def sweep_blobs(min_age):
+    """
+    Deletes the blobs and blob files no attachment uses, for what reference counting
+    misses: messages deleted without ``release_attachments`` (e.g. in the admin),
+    files of ingests that were rolled back and staged files of interrupted syncs.
+
+    Args:
+        min_age (int): Seconds since their last modification before files without
+            a blob row are deleted, so ingests in progress keep theirs.
+
+    Returns:
+        tuple: The number of deleted blobs and of deleted files without a blob.
+    """
+    with transaction.atomic():
+        orphaned = list(
+            AttachmentBlob.objects.select_for_update(of=("self",))
+            .filter(ref_count__gt=0, attachments=None)
+            .order_by("sha256")
+            .values_list("sha256", flat=True)
+        )
+        AttachmentBlob.objects.filter(sha256__in=orphaned, attachments=None).update(
+            ref_count=0
+        )
+    deleted_blobs = delete_unreferenced_blobs()
+
+    deleted_files = 0
+    cutoff = time.time() - min_age
+    names = _iter_blob_files()
+    while chunk := list(itertools.islice(names, 1000)):
+        referenced = set(
+            AttachmentBlob.objects.filter(file__in=chunk, ref_count__gt=0).values_list(
+                "file", flat=True
+            )
+        )
+        for name in chunk:
+            if name in referenced:
+                continue
+            if default_storage.get_modified_time(name).timestamp() > cutoff:
+                continue
+            if name.startswith(_STAGING_DIR):
+                default_storage.delete(name)
+                deleted_files += 1
+            elif _delete_stray_file(name):
+                deleted_files += 1
+    return deleted_blobs, deleted_files
+
+
+def _iter_blob_files(directory="blobs/"):
+    """Yields the storage names of the files under the blob directory."""
+    try:
+        directories, files = default_storage.listdir(directory)
+    except FileNotFoundError:
+        return
+    for subdirectory in directories:
+        yield from _iter_blob_files(f"{directory}{subdirectory}/")
+    for file in files:
+        yield f"{directory}{file}"
+
+
+def _delete_stray_file(name):
+    """
+    Deletes a blob file unless a referenced blob uses it, under the blob's row lock.
+
+    A row is created for the check if there is none, which waits for an ingest that
+    is about to create it.
+    """
+    sha256 = os.path.basename(name)[:64]
+    with transaction.atomic():
+        AttachmentBlob.objects.bulk_create(
+            [AttachmentBlob(sha256=sha256, file=name, size=0)], ignore_conflicts=True
+        )
+        blob = AttachmentBlob.objects.select_for_update().get(sha256=sha256)
+        if blob.file.name == name:
+            if blob.ref_count:
+                return False
+            blob.delete()
+        default_storage.delete(name)
+    return True
@@ -0,0 +1,86 @@
+"""
+Entry points of the ``sync_mailboxes`` processes.
+
+Spawned processes unpickle these functions before Django is set up, so this module
+must not import models or settings at import time.
+"""
+
+import asyncio
+import json
+import time
+
+
+def init_worker(overrides):
+    """
+    Sets up Django in a freshly spawned sync process.
+
+    Args:
+        overrides (dict): Settings to replace in this process, by name.
+    """
+    import django
+
+    django.setup()
+    from django.conf import settings
+
+    for name, value in overrides.items():
+        setattr(settings, name, value)
+
+
+def sync_account(account_id, since=None, dry_run=False):
+    """
+    Syncs one account in an event loop of its own; the unit of work of a process.
+
+    Args:
+        account_id (int): The primary key of the email account.
+        since (date, optional): Only ingest messages received on or after this day.
+        dry_run (bool): Only count the messages a sync would ingest.
+
+    Returns:
+        dict: The account email, the messages and bytes ingested (or found, for a dry
+            run), the seconds taken and the errors reported by the sync.
+    """
+    return asyncio.run(_sync_account(account_id, since, dry_run))
+
+
+async def _sync_account(account_id, since, dry_run):
+    """Async part of ``sync_account``."""
+    from asgiref.sync import sync_to_async
+    from django.db.models import Count, Sum
+    from mail_app.models import EmailAccount
+    from mail_app.utils.email_service import (
+        count_new_messages,
+        fetch_emails_for_account,
+    )
+    from mail_app.utils.imap_pool import get_imap_pool
+
+    account = await sync_to_async(EmailAccount.objects.get)(pk=account_id)
+    stored = sync_to_async(
+        lambda: account.messages.aggregate(count=Count("id"), size=Sum("size"))
+    )
+    errors = []
+
+    async def collect_errors(text_data):
+        frame = json.loads(text_data)
+        if "error" in frame:
+            errors.append(frame["error"])
+
+    result = {"account": account.email, "messages": 0, "bytes": 0}
+    started = time.perf_counter()
+    try:
+        if dry_run:
+            result["messages"] = await count_new_messages(account, since)
+            if result["messages"] is None:
+                errors.append("Failed to search messages.")
+        else:
+            before = await stored()
+            await fetch_emails_for_account(account, collect_errors, since)
+            after = await stored()
+            result["messages"] = after["count"] - before["count"]
+            result["bytes"] = (after["size"] or 0) - (before["size"] or 0)
+    except Exception as e:
+        errors.append(str(e))
+    finally:
+        await get_imap_pool().close_all()
+    result["seconds"] = time.perf_counter() - started
+    result["errors"] = errors
+    return result
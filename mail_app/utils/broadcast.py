@@ -0,0 +1,21 @@
+from channels.layers import get_channel_layer
+
+EMAIL_UPDATES_GROUP = "email_updates"
+
+
+async def broadcast(text_data):
+    """
+    Sends a WebSocket frame to every connected EmailConsumer through the channel layer.
+
+    Has the same signature as ``AsyncWebsocketConsumer.send`` for text frames, so it can
+    be passed as ``send_callback`` to the email service from outside a consumer.
+
+    Args:
+        text_data (str): The JSON payload to deliver.
+
+    Returns:
+        None
+    """
+    await get_channel_layer().group_send(
+        EMAIL_UPDATES_GROUP, {"type": "email.update", "text": text_data}
+    )
@@ -1,93 +1,928 @@
-import imaplib
-import email
-from mail_app.utils.email_utils import get_imap_server, process_email
+import asyncio
+import logging
+import re
+import time
+from django.conf import settings
+from django.utils import timezone
+from mail_app.utils.email_utils import (
+    delete_all_messages,
+    delete_messages,
+    process_email_bodies,
+    process_emails,
+    update_flags,
+)
+from mail_app.utils.imap_pool import get_imap_pool
+from mail_app.utils import metrics, raw_archive
+from mail_app.utils.mime_parser import ParseFailure, parse_messages
+from mail_app.utils.sync_failures import (
+    clear_failures,
+    due_failure_uids,
+    record_failures,
+    waiting_failure_uids,
+)
+from mail_app.utils.sync_lock import account_sync_lease, wait_for_sync
 import json
-from ..models import EmailMessage
+from ..models import EmailAccount, EmailMessage, SyncStage
 from asgiref.sync import sync_to_async
 
+logger = logging.getLogger(__name__)
 
-async def fetch_emails_for_account(account, send_callback):
+_UID_RE = re.compile(rb"UID (\d+)")
+_SIZE_RE = re.compile(rb"RFC822\.SIZE (\d+)")
+_FLAGS_RE = re.compile(rb"FLAGS \(([^)]*)\)")
+# BODY.PEEK, as RFC822 and BODY[] set \Seen on the server
+_FULL_FETCH_ITEMS = "(UID BODY.PEEK[])"
+_HEADERS_FETCH_ITEMS = (
+    "(UID RFC822.SIZE BODY.PEEK[HEADER.FIELDS "
+    "(SUBJECT FROM DATE MESSAGE-ID IN-REPLY-TO REFERENCES)])"
+)
+# IMAP dates use English month names whatever the locale
+_MONTHS = (
+    "Jan",
+    "Feb",
+    "Mar",
+    "Apr",
+    "May",
+    "Jun",
+    "Jul",
+    "Aug",
+    "Sep",
+    "Oct",
+    "Nov",
+    "Dec",
+)
+
+
+async def fetch_emails_for_account(account, send_callback, since=None):
     """
     Fetches new emails for the specified account and processes them if they are not already in the database.
 
+    Only UIDs above the account's stored watermark are requested. A change of the
+    mailbox UIDVALIDITY invalidates every stored UID, so the account is resynced from scratch.
+    If the account is already being synced anywhere in the cluster, this waits for that
+    sync to finish instead of starting another one.
+
     Args:
         account (EmailAccount): The email account to fetch emails from.
         send_callback (function): Callback to send progress or errors during the fetching process.
+        since (date, optional): Only ingest messages received on or after this day.
 
     Returns:
         None
     """
     try:
-        # Set up IMAP connection
-        mail = imaplib.IMAP4_SSL(get_imap_server(account.provider))
-        mail.login(account.email, account.password)
-        mail.select("inbox")
-
-        # Search for all emails
-        result, data = mail.uid("search", None, "ALL")
-        if result != "OK":
-            return await _send_error(
-                send_callback, account.email, "Failed to search messages."
-            )
+        async with account_sync_lease(account) as acquired:
+            if not acquired:
+                # Another process is syncing the account and publishing its progress
+                await _send_attached(send_callback, account.email)
+                return await wait_for_sync(account)
+            # Pick up the watermark a sync that just finished may have advanced
+            await account.arefresh_from_db()
+            with metrics.ACTIVE_SYNCS.track_inprogress():
+                async with get_imap_pool().connection(account) as mail:
+                    await sync_mailbox(account, mail, send_callback, since)
+    except Exception as e:
+        # Also reports failures of the lease itself, e.g. Redis errors and LeaseLost
+        metrics.ERRORS.labels(account.pk, account.provider).inc()
+        await _send_error(send_callback, account.email, str(e))
+
+
+async def sync_mailbox(account, mail, send_callback, since=None):
+    """
+    Ingests the messages of the inbox that are above the account's watermark.
+
+    The watermark is saved after every batch, so an interrupted sync resumes where it
+    stopped. Messages that fail to fetch, parse or store are recorded as SyncFailure
+    rows and retried with exponential backoff by later syncs instead of failing the
+    whole sync. Finally the flags of stored messages are updated and messages removed
+    from the inbox are deleted, see ``sync_mailbox_state``.
+
+    Args:
+        account (EmailAccount): The email account to fetch emails from.
+        mail (AsyncIMAPClient): An authenticated IMAP session for the account.
+        send_callback (function): Callback to send progress or errors during the fetching process.
+        since (date, optional): Only ingest messages received on or after this day.
+            Older messages below the new watermark are not fetched by later syncs.
+
+    Returns:
+        None
+    """
+    await mail.select("inbox")
+    # Only EXISTS responses received after this point announce unsynced mail
+    mail.response("EXISTS")
+
+    uid_validity = _get_uid_validity(mail)
+    if uid_validity is None:
+        return await _send_error(
+            send_callback, account.email, "Server did not report UIDVALIDITY."
+        )
+    # Read before ingesting, so changes made meanwhile are picked up by the next sync
+    highest_modseq = _get_highest_modseq(mail)
+
+    if account.uid_validity is None:
+        # First sync with watermark tracking: diff against what is already stored
+        new_email_uids, highest_uid = await _search_unknown_uids(account, mail, since)
+    else:
+        if account.uid_validity != uid_validity:
+            # Stored UIDs refer to a previous incarnation of the mailbox
+            await sync_to_async(delete_all_messages)(account)
+            await _save_sync_state(account, uid_validity, 0)
+            await _save_mailbox_state(account, None, None)
+        new_email_uids = await _search_uids_after(mail, account.highest_uid, since)
+        highest_uid = int(new_email_uids[-1]) if new_email_uids else account.highest_uid
+
+    if new_email_uids is None:
+        return await _send_error(
+            send_callback, account.email, "Failed to search messages."
+        )
+
+    if new_email_uids:
+        # Process new emails
+        await _process_emails(
+            account,
+            mail,
+            new_email_uids,
+            send_callback,
+            headers_only=settings.EMAIL_FETCH_HEADERS_FIRST,
+            uid_validity=uid_validity,
+        )
+
+    await _save_sync_state(account, uid_validity, highest_uid)
+    await _retry_failed_messages(account, mail, send_callback)
+
+    # Bodies of header-only messages, including ones left over by earlier syncs
+    await load_email_bodies(account, mail, await _pending_body_uids(account))
+    await sync_mailbox_state(account, mail, highest_modseq)
+
+    if not new_email_uids:
+        return await _send_complete(send_callback, account.email)
+
+
+async def count_new_messages(account, since=None):
+    """
+    Counts the messages the next sync of an account would ingest, without storing.
+
+    Args:
+        account (EmailAccount): The email account.
+        since (date, optional): Only count messages received on or after this day.
+
+    Returns:
+        int or None: The number of new messages, or None if the search failed.
+    """
+    async with get_imap_pool().connection(account) as mail:
+        await mail.select("inbox")
+        if account.uid_validity is None:
+            new_email_uids, _ = await _search_unknown_uids(account, mail, since)
+        elif account.uid_validity != _get_uid_validity(mail):
+            # The mailbox was reset, so everything would be synced again
+            new_email_uids = await _search_uids_after(mail, 0, since)
+        else:
+            new_email_uids = await _search_uids_after(mail, account.highest_uid, since)
+    return None if new_email_uids is None else len(new_email_uids)
+
+
+def _get_uid_validity(mail):
+    """
+    Reads the UIDVALIDITY reported by the server for the selected mailbox.
+
+    Args:
+        mail (AsyncIMAPClient): The IMAP connection object with a selected mailbox.
+
+    Returns:
+        int or None: The UIDVALIDITY value, or None if the server did not send one.
+    """
+    _, data = mail.response("UIDVALIDITY")
+    try:
+        return int(data[-1])
+    except (TypeError, ValueError, IndexError):
+        return None
+
+
+def _get_highest_modseq(mail):
+    """
+    Reads the HIGHESTMODSEQ reported for the selected mailbox (RFC 7162).
+
+    Args:
+        mail (AsyncIMAPClient): The IMAP connection object with a selected mailbox.
+
+    Returns:
+        int or None: The HIGHESTMODSEQ value, or None if CONDSTORE is not enabled or
+            the mailbox does not keep mod-sequences.
+    """
+    _, data = mail.response("HIGHESTMODSEQ")
+    try:
+        return int(data[-1])
+    except (TypeError, ValueError, IndexError):
+        return None
+
+
+async def _search_uids_after(mail, highest_uid, since=None):
+    """
+    Searches for UIDs strictly greater than the given watermark.
+
+    Args:
+        mail (AsyncIMAPClient): The IMAP connection object with a selected mailbox.
+        highest_uid (int): The highest UID already ingested.
+        since (date, optional): Only messages received on or after this day.
+
+    Returns:
+        list or None: Sorted list of new UIDs (bytes), or None if the search failed.
+    """
+    criteria = f"UID {highest_uid + 1}:*"
+    if since:
+        criteria += f" SINCE {_imap_date(since)}"
+    with metrics.stage_timer("imap_search"):
+        result, data = await mail.uid("search", None, criteria)
+    if result != "OK":
+        return None
+    # "n:*" always matches the last message, even when its UID is below n
+    return sorted((uid for uid in data[0].split() if int(uid) > highest_uid), key=int)
 
-        email_uids = data[0].split()
 
-        if not email_uids:
-            return await _send_complete(send_callback, account.email)
+async def _search_unknown_uids(account, mail, since=None):
+    """
+    Searches for all UIDs in the mailbox that are not stored for the account yet.
+
+    Args:
+        account (EmailAccount): The email account being synced.
+        mail (AsyncIMAPClient): The IMAP connection object with a selected mailbox.
+        since (date, optional): Only messages received on or after this day.
 
-        # Fetch UIDs already present in the database for this account
-        existing_uids = await sync_to_async(list)(
+    Returns:
+        tuple: Sorted list of new UIDs (bytes) and the highest UID found, or (None, 0)
+            if the search failed.
+    """
+    criteria = f"SINCE {_imap_date(since)}" if since else "ALL"
+    with metrics.stage_timer("imap_search"):
+        result, data = await mail.uid("search", None, criteria)
+    if result != "OK":
+        return None, 0
+    email_uids = data[0].split()
+
+    existing_uids = set(
+        await sync_to_async(list)(
             EmailMessage.objects.filter(email_account=account).values_list(
                 "uid", flat=True
             )
         )
+    )
+    new_email_uids = sorted(
+        (uid for uid in email_uids if uid.decode() not in existing_uids), key=int
+    )
+    return new_email_uids, max((int(uid) for uid in email_uids), default=0)
 
-        # Filter out emails that have already been fetched
-        new_email_uids = [
-            uid for uid in email_uids if uid.decode() not in existing_uids
-        ]
 
-        if not new_email_uids:
-            return await _send_complete(send_callback, account.email)
+def _imap_date(day):
+    """Formats a date for IMAP SEARCH, e.g. ``1-Feb-2024``."""
+    return f"{day.day}-{_MONTHS[day.month - 1]}-{day.year}"
 
-        # Process new emails
-        await _process_emails(account, mail, new_email_uids, send_callback)
 
-        mail.logout()
+async def _save_sync_state(account, uid_validity, highest_uid):
+    """
+    Persists the UIDVALIDITY and highest-UID watermark for the account.
 
-    except Exception as e:
-        await _send_error(send_callback, account.email, str(e))
+    Args:
+        account (EmailAccount): The email account being synced.
+        uid_validity (int): The current UIDVALIDITY of the mailbox.
+        highest_uid (int): The highest UID ingested so far.
+
+    Returns:
+        None
+    """
+    account.uid_validity = uid_validity
+    account.highest_uid = highest_uid
+    await sync_to_async(EmailAccount.objects.filter(pk=account.pk).update)(
+        uid_validity=uid_validity, highest_uid=highest_uid
+    )
+
+
+async def _save_mailbox_state(account, highest_modseq, state_checked_at):
+    """
+    Persists the HIGHESTMODSEQ and the time of the last full comparison of the inbox.
+
+    Args:
+        account (EmailAccount): The email account being synced.
+        highest_modseq (int): The HIGHESTMODSEQ flags and deletions are synced up to,
+            or None.
+        state_checked_at (datetime): When the stored messages were last compared with
+            the whole inbox, or None.
+
+    Returns:
+        None
+    """
+    account.highest_modseq = highest_modseq
+    account.state_checked_at = state_checked_at
+    await sync_to_async(EmailAccount.objects.filter(pk=account.pk).update)(
+        highest_modseq=highest_modseq, state_checked_at=state_checked_at
+    )
+
+
+async def sync_mailbox_state(account, mail, highest_modseq):
+    """
+    Updates the flags of stored messages and deletes those removed from the inbox.
+
+    With CONDSTORE, only the messages whose flags changed since the HIGHESTMODSEQ of
+    the last sync are fetched, and with QRESYNC the server also reports the UIDs
+    expunged since then (``VANISHED``), so a sync costs one small FETCH. Otherwise
+    every ``EMAIL_STATE_CHECK_INTERVAL`` seconds the stored UIDs are compared with a
+    UID SEARCH of the inbox and the flags are fetched in batches.
+
+    If a command fails, the state is left as it was, so the next sync tries again;
+    the messages ingested by the sync are not affected.
+
+    Args:
+        account (EmailAccount): The email account being synced.
+        mail (AsyncIMAPClient): An IMAP connection with the inbox selected.
+        highest_modseq (int): The HIGHESTMODSEQ reported when the inbox was selected,
+            or None.
+
+    Returns:
+        None
+    """
+    qresync = "QRESYNC" in mail.enabled
+    changed_since = account.highest_modseq
+    if highest_modseq is None or (changed_since or 0) > highest_modseq:
+        # No mod-sequences, or they were reset: nothing to compare against
+        changed_since = None
+    check_due = (
+        account.state_checked_at is None
+        or (timezone.now() - account.state_checked_at).total_seconds()
+        >= settings.EMAIL_STATE_CHECK_INTERVAL
+    )
+
+    if changed_since is not None:
+        if changed_since < highest_modseq and not await _sync_changes_since(
+            account, mail, changed_since, qresync
+        ):
+            logger.warning("Failed to fetch flag changes of %s", account.email)
+            return
+        # Without VANISHED, deletions are only found by comparing UIDs
+        full_check = not qresync and check_due
+        fetch_flags = False
+    else:
+        # A first sync with mod-sequences compares everything once
+        full_check = highest_modseq is not None or check_due
+        fetch_flags = True
+
+    state_checked_at = account.state_checked_at
+    if full_check:
+        if not await _sync_by_uid_diff(account, mail, fetch_flags):
+            logger.warning("Failed to compare the inbox of %s", account.email)
+            return
+        state_checked_at = timezone.now()
+    await _save_mailbox_state(account, highest_modseq, state_checked_at)
+
+
+async def _sync_changes_since(account, mail, changed_since, qresync):
+    """
+    Applies the flag changes and, with QRESYNC, the expunges since a mod-sequence.
 
+    Args:
+        account (EmailAccount): The email account being synced.
+        mail (AsyncIMAPClient): An IMAP connection with the inbox selected.
+        changed_since (int): The HIGHESTMODSEQ of the last sync.
+        qresync (bool): Whether QRESYNC is enabled, so expunged UIDs are reported.
+
+    Returns:
+        bool: Whether the changes were fetched.
+    """
+    modifiers = f"CHANGEDSINCE {changed_since}" + (" VANISHED" if qresync else "")
+    with metrics.stage_timer("imap_state"):
+        result, data = await mail.uid("fetch", "1:*", f"(FLAGS) ({modifiers})")
+    if result != "OK":
+        return False
+    flags = _parse_flags(data)
+    for chunk in _chunked(list(flags), settings.EMAIL_STATE_SYNC_BATCH_SIZE):
+        await sync_to_async(update_flags)(account, {uid: flags[uid] for uid in chunk})
+    if qresync:
+        _, vanished = mail.response("VANISHED")
+        await _delete_messages(account, _vanished_uids(vanished, account.highest_uid))
+    return True
+
+
+async def _sync_by_uid_diff(account, mail, fetch_flags):
+    """
+    Compares the stored UIDs with the inbox, deleting messages that left it.
+
+    Args:
+        account (EmailAccount): The email account being synced.
+        mail (AsyncIMAPClient): An IMAP connection with the inbox selected.
+        fetch_flags (bool): Whether to also fetch the flags of every stored message,
+            in batches of ``EMAIL_STATE_SYNC_BATCH_SIZE``.
+
+    Returns:
+        bool: Whether the inbox could be compared.
+    """
+    with metrics.stage_timer("imap_search"):
+        result, data = await mail.uid("search", None, "ALL")
+    if result != "OK":
+        return False
+    server_uids = set(map(_uid_str, data[0].split()))
+    stored_uids = await sync_to_async(set)(
+        account.messages.values_list("uid", flat=True)
+    )
+    await _delete_messages(account, sorted(stored_uids - server_uids, key=int))
+
+    if fetch_flags:
+        for chunk in _chunked(
+            sorted(stored_uids & server_uids, key=int),
+            settings.EMAIL_STATE_SYNC_BATCH_SIZE,
+        ):
+            with metrics.stage_timer("imap_state"):
+                result, data = await mail.uid(
+                    "fetch", _format_uid_set(chunk), "(FLAGS)"
+                )
+            if result != "OK":
+                return False
+            await sync_to_async(update_flags)(account, _parse_flags(data))
+    return True
+
+
+async def _delete_messages(account, uids):
+    """Deletes removed messages in batches of ``EMAIL_STATE_SYNC_BATCH_SIZE``."""
+    for chunk in _chunked(uids, settings.EMAIL_STATE_SYNC_BATCH_SIZE):
+        await sync_to_async(delete_messages)(account, chunk)
+
+
+def _parse_flags(data):
+    """
+    Extracts the flags per UID from the response data of a FLAGS fetch.
+
+    Args:
+        data (list): The response data returned by ``IMAP4.uid("fetch", ...)``.
+
+    Returns:
+        dict: Flag lists (str) by UID (str).
+    """
+    flags = {}
+    for item in data:
+        if isinstance(item, tuple):
+            item = item[0]
+        if not item:
+            continue
+        uid_match, flags_match = _UID_RE.search(item), _FLAGS_RE.search(item)
+        if uid_match and flags_match:
+            flags[uid_match.group(1).decode()] = flags_match.group(1).decode().split()
+    return flags
+
+
+def _vanished_uids(data, highest_uid):
+    """
+    Expands the UID sets of VANISHED responses, e.g. ``(EARLIER) 41,43:116``.
 
-async def _process_emails(account, mail, email_uids, send_callback):
+    Args:
+        data (list): The VANISHED response data.
+        highest_uid (int): The highest UID stored; higher UIDs are left out.
+
+    Returns:
+        list: The expunged UIDs (str), sorted.
+    """
+    uids = set()
+    for line in data:
+        if not line:
+            continue
+        spec = line.decode().removeprefix("(EARLIER)").strip()
+        for part in filter(None, spec.split(",")):
+            start, _, end = part.partition(":")
+            low, high = sorted((int(start), int(end or start)))
+            uids.update(range(low, min(high, highest_uid) + 1))
+    return [str(uid) for uid in sorted(uids)]
+
+
+async def _process_emails(
+    account, mail, email_uids, send_callback, headers_only=False, uid_validity=None
+):
     """
     Fetches and processes emails by UID.
 
+    UIDs are fetched in batches of ``EMAIL_FETCH_BATCH_SIZE`` with one ``UID FETCH``
+    per batch, and each batch is stored with bulk inserts in a single transaction.
+    Progress is reported in batched frames through ``ProgressThrottle``.
+
+    Messages that fail are recorded for a retry before the batch is checkpointed, so
+    no message is skipped silently.
+
     Args:
         account (EmailAccount): The email account to process emails for.
-        mail (IMAP4_SSL): The IMAP connection object.
+        mail (AsyncIMAPClient): The IMAP connection object.
         email_uids (list): List of UIDs for the emails to be processed.
         send_callback (function): Callback to send progress during the process.
+        headers_only (bool): Whether to fetch only the listing headers and the size,
+            leaving bodies and attachments to ``load_email_bodies``.
+        uid_validity (int, optional): The UIDVALIDITY of the mailbox. When given, the
+            watermark is advanced past every processed batch.
+
+    Returns:
+        set: UIDs (str) of the messages that failed.
+    """
+    progress = ProgressThrottle(send_callback, account.email, len(email_uids))
+    fetch_items = _HEADERS_FETCH_ITEMS if headers_only else _FULL_FETCH_ITEMS
+    failed = set()
+    async for batch_uids, msg_data in _fetch_batches(mail, email_uids, fetch_items):
+        if msg_data is None:
+            errors = dict.fromkeys(map(_uid_str, batch_uids), "UID FETCH failed")
+        else:
+            items = [
+                (email_uid, raw_email, size if headers_only else len(raw_email))
+                for email_uid, raw_email, size in _iter_fetched_messages(msg_data)
+            ]
+            parsed, errors = await _parse(account, items, headers_only)
+            if not headers_only:
+                await _archive_raw(items, parsed)
+            stored = {}
+            for result in await _store_isolated(
+                process_emails, account, parsed, errors, headers_only=headers_only
+            ):
+                stored.update(result)
+            metrics.MESSAGES.labels(account.pk, account.provider).inc(
+                sum(email_data is not None for email_data in stored.values())
+            )
+            for email_data in stored.values():
+                # Messages stored by an earlier attempt come back as None
+                if email_data is not None:
+                    await progress.add(email_data)
+        if errors:
+            failed.update(errors)
+            await _record_failures(account, SyncStage.MESSAGE, errors)
+        if uid_validity is not None:
+            await _save_sync_state(account, uid_validity, int(batch_uids[-1]))
+    await progress.flush()
+    return failed
+
+
+async def _retry_failed_messages(account, mail, send_callback):
+    """
+    Retries the messages of earlier syncs whose retry is due.
+
+    Messages that are stored now, or that have left the mailbox, are forgotten; the
+    others are rescheduled with a longer backoff.
+
+    Args:
+        account (EmailAccount): The email account being synced.
+        mail (AsyncIMAPClient): An IMAP connection with the inbox selected.
+        send_callback (function): Callback to send progress during the process.
+
+    Returns:
+        None
+    """
+    email_uids = await sync_to_async(due_failure_uids)(account, SyncStage.MESSAGE)
+    if not email_uids:
+        return
+    failed = await _process_emails(
+        account,
+        mail,
+        email_uids,
+        send_callback,
+        headers_only=settings.EMAIL_FETCH_HEADERS_FIRST,
+    )
+    await sync_to_async(clear_failures)(
+        account, SyncStage.MESSAGE, set(email_uids) - failed
+    )
+
+
+async def load_email_bodies(account, mail, email_uids):
+    """
+    Fetches the full messages for UIDs that were stored from their headers only.
+
+    Bodies that fail are recorded for a retry with backoff; earlier failures of the
+    bodies loaded now are forgotten.
+
+    Args:
+        account (EmailAccount): The email account the messages belong to.
+        mail (AsyncIMAPClient): An IMAP connection with the inbox selected.
+        email_uids (list): Sorted list of UIDs whose body is missing.
+
+    Returns:
+        None
+    """
+    failed = set()
+    async for batch_uids, msg_data in _fetch_batches(
+        mail, email_uids, _FULL_FETCH_ITEMS
+    ):
+        if msg_data is None:
+            errors = dict.fromkeys(map(_uid_str, batch_uids), "UID FETCH failed")
+        else:
+            items = [
+                (email_uid, raw_email, len(raw_email))
+                for email_uid, raw_email, _ in _iter_fetched_messages(msg_data)
+            ]
+            parsed, errors = await _parse(account, items)
+            await _archive_raw(items, parsed)
+            await _store_isolated(process_email_bodies, account, parsed, errors)
+        if errors:
+            failed.update(errors)
+            await _record_failures(account, SyncStage.BODY, errors)
+    if email_uids:
+        await sync_to_async(clear_failures)(
+            account, SyncStage.BODY, set(map(_uid_str, email_uids)) - failed
+        )
+
+
+async def _parse(account, items, headers_only=False):
+    """
+    Parses fetched messages and records their size and parsing stage durations.
+
+    Args:
+        account (EmailAccount): The email account the messages belong to.
+        items (list): Tuples of the UID, the raw message or header block and the size.
+        headers_only (bool): Whether the raw messages only hold headers.
+
+    Returns:
+        tuple: ParsedMessage records and the errors of the messages that could not
+            be parsed, by UID.
+    """
+    metrics.BYTES.labels(account.pk, account.provider).inc(
+        sum(len(raw_email) for _, raw_email, _ in items)
+    )
+    with metrics.stage_timer("parse_batch"):
+        results = await parse_messages(items, headers_only=headers_only)
+    parsed, errors = [], {}
+    for result in results:
+        if isinstance(result, ParseFailure):
+            errors[result.uid] = result.error
+            continue
+        metrics.observe_stages(result.timings)
+        parsed.append(result)
+    return parsed, errors
+
+
+async def _archive_raw(items, parsed):
+    """
+    Writes full raw messages to the raw archive, if it is enabled, and sets the
+    ``raw_location`` of their parsed records. If the write fails, the messages are
+    stored without a location rather than failing their batch.
+
+    Args:
+        items (list): Tuples of the UID, the raw message and the size.
+        parsed (list): ParsedMessage records of the messages in ``items``.
+
+    Returns:
+        None
+    """
+    if not raw_archive.is_enabled() or not parsed:
+        return
+    raw_emails = {email_uid: raw_email for email_uid, raw_email, _ in items}
+    try:
+        with metrics.stage_timer("raw_archive"):
+            locations = await asyncio.get_running_loop().run_in_executor(
+                None,
+                raw_archive.archive_messages,
+                [raw_emails[message.uid] for message in parsed],
+            )
+    except Exception:
+        logger.warning("Could not archive %d raw messages", len(parsed), exc_info=True)
+        return
+    for message, location in zip(parsed, locations):
+        message.raw_location = location
+
+
+async def _store_isolated(store, account, messages, errors, **kwargs):
+    """
+    Stores a batch of parsed messages, isolating the messages that make it fail.
+
+    If the batch fails, it is rolled back and the messages are stored one at a time,
+    so a single poison message does not block its batch. Any error of a message, e.g.
+    a database error, bad parsed data or a failed blob write, is recorded for a retry;
+    only cancellation stops the batch.
+
+    Args:
+        store (function): ``process_emails`` or ``process_email_bodies``.
+        account (EmailAccount): The email account the messages belong to.
+        messages (list): ParsedMessage records.
+        errors (dict): Error messages by UID, extended with the messages that fail.
+        **kwargs: Further arguments for ``store``.
+
+    Returns:
+        list: The results of the successful ``store`` calls.
+    """
+    if len(messages) > 1:
+        try:
+            return [await store(account, messages, **kwargs)]
+        except Exception:
+            pass
+
+    results = []
+    for message in messages:
+        try:
+            results.append(await store(account, [message], **kwargs))
+        except Exception as e:
+            errors[message.uid] = f"{type(e).__name__}: {e}"
+    return results
+
+
+async def _record_failures(account, stage, errors):
+    """
+    Records failed messages for a retry and reports them to the metrics and the log.
+
+    Args:
+        account (EmailAccount): The email account the messages belong to.
+        stage (str): The SyncStage that failed.
+        errors (dict): Error messages by UID.
 
     Returns:
         None
     """
-    total = len(email_uids)
-    for idx, email_uid in enumerate(email_uids, 1):
-        result, msg_data = mail.uid("fetch", email_uid, "(RFC822)")
-        if result == "OK":
-            email_message = email.message_from_bytes(msg_data[0][1])
-            email_data = await process_email(account, email_message, email_uid.decode())
-            await _send_progress(send_callback, email_data, idx, total, account.email)
+    metrics.MESSAGE_FAILURES.labels(account.pk, account.provider, stage).inc(
+        len(errors)
+    )
+    quarantined = await sync_to_async(record_failures)(account, stage, errors)
+    for uid in quarantined:
+        logger.warning(
+            "Quarantined message %s of %s after repeated %s failures: %s",
+            uid,
+            account.email,
+            stage,
+            errors[uid],
+        )
+
+
+async def fetch_email_body(email_msg):
+    """
+    Loads the body and attachments of a message stored from its headers only.
+
+    Args:
+        email_msg (EmailMessage): The message, with ``email_account`` loaded.
+
+    Returns:
+        EmailMessage: The refreshed message. Its body stays empty if the mailbox
+            was reset (UIDVALIDITY changed) since the message was stored.
+    """
+    account = email_msg.email_account
+    async with get_imap_pool().connection(account) as mail:
+        await mail.select("inbox")
+        if _get_uid_validity(mail) == account.uid_validity:
+            await load_email_bodies(account, mail, [email_msg.uid])
+    await sync_to_async(email_msg.refresh_from_db)()
+    return email_msg
 
 
-async def _send_progress(send_callback, email_data, processed, total, account_email):
+async def _pending_body_uids(account):
+    """
+    Returns the sorted UIDs of the account's messages that still lack a body.
+
+    Bodies that failed to load and are not due for a retry yet are left out.
+    """
+    uids = await sync_to_async(list)(
+        EmailMessage.objects.filter(
+            email_account=account, body_loaded=False
+        ).values_list("uid", flat=True)
+    )
+    waiting = await sync_to_async(waiting_failure_uids)(account, SyncStage.BODY)
+    return sorted((uid for uid in uids if uid not in waiting), key=int)
+
+
+async def _fetch_batches(mail, email_uids, fetch_items):
+    """
+    Fetches UIDs in batches of ``EMAIL_FETCH_BATCH_SIZE``, one ``UID FETCH`` per batch.
+
+    The next batch is already being fetched while the caller processes the current one.
+
+    Args:
+        mail (AsyncIMAPClient): The IMAP connection object.
+        email_uids (list): Sorted list of UIDs to fetch.
+        fetch_items (str): The FETCH data items to request.
+
+    Returns:
+        async generator: Tuples of the UIDs of each batch and the response data, or
+            None if the FETCH of the batch failed.
+    """
+    batches = list(_chunked(email_uids, settings.EMAIL_FETCH_BATCH_SIZE))
+    if not batches:
+        return
+    next_fetch = asyncio.ensure_future(
+        mail.uid("fetch", _format_uid_set(batches[0]), fetch_items)
+    )
+    try:
+        for idx in range(len(batches)):
+            # Only the time the pipeline waits on the server; fetches overlap parsing
+            with metrics.stage_timer("imap_fetch"):
+                result, msg_data = await next_fetch
+            if idx + 1 < len(batches):
+                next_fetch = asyncio.ensure_future(
+                    mail.uid("fetch", _format_uid_set(batches[idx + 1]), fetch_items)
+                )
+            yield batches[idx], msg_data if result == "OK" else None
+    finally:
+        next_fetch.cancel()
+
+
+def _chunked(items, size):
+    """
+    Splits a list into consecutive chunks of at most ``size`` items.
+
+    Args:
+        items (list): The items to split.
+        size (int): The maximum chunk size.
+
+    Returns:
+        generator: Lists of consecutive items.
+    """
+    for start in range(0, len(items), size):
+        yield items[start : start + size]
+
+
+def _uid_str(uid):
+    """Returns a UID from a SEARCH response (bytes) or the database (str) as str."""
+    return uid.decode() if isinstance(uid, bytes) else str(uid)
+
+
+def _format_uid_set(uids):
+    """
+    Builds a compact IMAP UID set, collapsing consecutive UIDs into ranges.
+
+    Args:
+        uids (list): Sorted list of UIDs (bytes or int).
+
+    Returns:
+        str: The UID set, e.g. ``"1:5,7,9:12"``.
+    """
+    ranges = []
+    for uid in map(int, uids):
+        if ranges and uid == ranges[-1][1] + 1:
+            ranges[-1][1] = uid
+        else:
+            ranges.append([uid, uid])
+    return ",".join(
+        str(start) if start == end else f"{start}:{end}" for start, end in ranges
+    )
+
+
+def _iter_fetched_messages(msg_data):
+    """
+    Extracts ``(uid, raw message, size)`` tuples from a multi-message FETCH response.
+
+    Servers may send the UID and RFC822.SIZE items before or after the message literal,
+    so both the prefix and the trailing part of each response are inspected.
+
+    Args:
+        msg_data (list): The response data returned by ``IMAP4.uid("fetch", ...)``.
+
+    Returns:
+        generator: Tuples of the UID (str), the raw message or header block (bytes) and
+            the RFC822.SIZE (int, or None if it was not requested).
+    """
+    pending = None
+    for item in msg_data:
+        if isinstance(item, tuple):
+            pending = item
+        elif pending is not None:
+            attributes = pending[0] + (item or b"")
+            uid, size = _UID_RE.search(attributes), _SIZE_RE.search(attributes)
+            if uid:
+                yield uid.group(1).decode(), pending[1], size and int(size.group(1))
+            pending = None
+
+
+class ProgressThrottle:
+    """
+    Coalesces the progress of a sync into batched frames.
+
+    Stored emails are buffered and sent together once ``EMAIL_PROGRESS_BATCH_SIZE``
+    emails are pending or ``EMAIL_PROGRESS_INTERVAL`` seconds have passed since the
+    last frame, so large syncs send a few frames per second instead of one per email.
+    """
+
+    def __init__(self, send_callback, account_email, total):
+        self.send_callback = send_callback
+        self.account_email = account_email
+        self.total = total
+        self.processed = 0
+        self.pending = []
+        self.sent_at = time.monotonic()
+
+    async def add(self, email_data):
+        """Buffers a stored email and sends the batch if the window is full."""
+        self.processed += 1
+        self.pending.append(email_data)
+        if (
+            len(self.pending) >= settings.EMAIL_PROGRESS_BATCH_SIZE
+            or time.monotonic() - self.sent_at >= settings.EMAIL_PROGRESS_INTERVAL
+        ):
+            await self.flush()
+
+    async def flush(self):
+        """Sends the buffered emails, if any."""
+        if not self.pending:
+            return
+        emails, self.pending = self.pending, []
+        self.sent_at = time.monotonic()
+        with metrics.stage_timer("progress_send"):
+            await _send_progress(
+                self.send_callback,
+                emails,
+                self.processed,
+                self.total,
+                self.account_email,
+            )
+
+
+async def _send_progress(send_callback, emails, processed, total, account_email):
     """
     Sends progress information during email fetching.
 
     Args:
         send_callback (function): Callback to send progress information.
-        email_data (dict): The processed email data.
+        emails (list): The processed email data since the previous progress frame.
         processed (int): The number of processed emails so far.
         total (int): The total number of emails to be processed.
         account_email (str): The email address of the account.
@@ -104,8 +939,9 @@ async def _send_progress(send_callback, email_data, processed, total, account_em
                 "processed_emails": processed,
                 "total_emails": total,
                 "account": account_email,
-                "email": email_data,
-            }
+                "emails": emails,
+            },
+            separators=(",", ":"),
         )
     )
 
@@ -149,3 +985,25 @@ async def _send_complete(send_callback, account_email):
             }
         )
     )
+
+
+async def _send_attached(send_callback, account_email):
+    """
+    Sends a notice that the account is already being synced by another process.
+
+    Args:
+        send_callback (function): Callback to send the notice.
+        account_email (str): The email address of the account.
+
+    Returns:
+        None
+    """
+    await send_callback(
+        json.dumps(
+            {
+                "status": "attached",
+                "message": f"A sync of account {account_email} is already running.",
+                "account": account_email,
+            }
+        )
+    )
@@ -1,11 +1,21 @@
+from collections import defaultdict
 from email.header import decode_header
 from bs4 import BeautifulSoup
 from dateutil.parser import parse
-from datetime import datetime
-from django.core.files.base import ContentFile
-from mail_app.models import EmailMessage, Attachment
+from django.db import transaction
+from django.utils import timezone
+from mail_app.models import EmailAccount, EmailMessage, EmailBody, Attachment
+from mail_app.utils.attachment_downloads import download_url
+from mail_app.utils.attachment_storage import release_attachments, save_attachments
+from mail_app.utils.metrics import stage_timer
+from mail_app.utils.response_cache import invalidate_account
+from mail_app.utils.search import update_search_vectors
+from mail_app.utils.threads import assign_threads, prune_threads
 from asgiref.sync import sync_to_async
 
+# Characters of the body kept in the snippet column
+SNIPPET_LENGTH = 200
+
 
 def get_imap_server(provider):
     """
@@ -19,33 +29,499 @@ def get_imap_server(provider):
     }.get(provider, "imap.gmail.com")
 
 
-async def process_email(account, email_message, uid):
+async def process_emails(account, messages, headers_only=False):
     """
-    Processes an incoming email: extracts body, attachments, and stores in the database.
+    Stores a batch of parsed emails and their attachments.
+
+    Messages are inserted with a single ``bulk_create`` and attachments with another,
+    inside one transaction, so a batch costs a handful of queries instead of several
+    per message. Their search vectors are computed with one UPDATE, and they are added
+    to their threads.
+
+    A message already stored by another account is linked to the body and attachment
+    blobs of that copy instead, and counts as loaded even if only its headers were
+    fetched.
 
     Args:
-        account (EmailAccount): The email account associated with this message.
-        email_message (email.message.EmailMessage): The email message object.
-        uid (str): Unique ID of the email message.
+        account (EmailAccount): The email account associated with the messages.
+        messages (list): ParsedMessage records.
+        headers_only (bool): Whether the messages only contain headers. Their body and
+            attachments are left to ``process_email_bodies``.
 
     Returns:
-        dict: A dictionary with the formatted email data, including subject, body, and attachments.
+        dict: Formatted email data by UID; None for messages that were already stored.
     """
-    if await sync_to_async(
-        EmailMessage.objects.filter(email_account=account, uid=uid).exists
-    )():
-        return None
-    email_msg = await sync_to_async(EmailMessage.objects.create)(
-        email_account=account,
-        uid=uid,
-        subject=decode_header_value(email_message.get("Subject", "")),
-        from_address=decode_header_value(email_message.get("From", "")),
-        sent_at=parse_date(email_message.get("Date", "")) or datetime.now(),
-        received_at=datetime.now(),
-        body=extract_body_content(email_message),
+    with stage_timer("db_store"):
+        return await sync_to_async(_store_emails)(account, messages, headers_only)
+
+
+def _store_emails(account, messages, headers_only):
+    """
+    Synchronous part of ``process_emails``, run in a worker thread.
+    """
+    stored = {parsed.uid: None for parsed in messages}
+    with transaction.atomic():
+        existing_uids = set(
+            EmailMessage.objects.filter(
+                email_account=account, uid__in=list(stored)
+            ).values_list("uid", flat=True)
+        )
+        new_messages = {
+            parsed.uid: parsed for parsed in messages if parsed.uid not in existing_uids
+        }
+        if not new_messages:
+            return stored
+
+        copies = find_copies(new_messages.values())
+        # Rows written by this batch are recognized by their shared received_at, as
+        # ignore_conflicts hides which rows a concurrent sync inserted first.
+        received_at = timezone.now()
+        email_messages = []
+        for parsed in new_messages.values():
+            email_msg = EmailMessage(
+                email_account=account,
+                uid=parsed.uid,
+                subject=parsed.subject,
+                from_address=parsed.from_address,
+                sent_at=parsed.sent_at or received_at,
+                received_at=received_at,
+                snippet=make_snippet(parsed.body),
+                size=parsed.size,
+                body_loaded=not headers_only,
+                **raw_location_fields(parsed),
+                **message_id_fields(parsed),
+            )
+            copy = copies.get(parsed.uid)
+            if copy is not None:
+                email_msg.content_id = copy.content_id
+                email_msg.snippet = copy.snippet
+                email_msg.body_loaded = True
+                if email_msg.raw_segment is None:
+                    # Reprocessing the copy's raw message rewrites the shared body
+                    for name in ("raw_segment", "raw_offset", "raw_length"):
+                        setattr(email_msg, name, getattr(copy, name))
+            email_messages.append(email_msg)
+        EmailMessage.objects.bulk_create(email_messages, ignore_conflicts=True)
+        created_rows = EmailMessage.objects.filter(
+            email_account=account,
+            uid__in=list(new_messages),
+            received_at=received_at,
+        )
+        created = list(created_rows.defer("search_vector"))
+        save_bodies(
+            [
+                (email_msg, new_messages[email_msg.uid])
+                for email_msg in created
+                if email_msg.content_id is None
+            ]
+        )
+        update_search_vectors(created_rows)
+        assign_threads(account, created)
+        if created:
+            transaction.on_commit(lambda: invalidate_account(account.pk))
+
+        attachments = {
+            email_msg.pk: (
+                copy_attachments(email_msg, copies[email_msg.uid])
+                if email_msg.uid in copies
+                else build_attachments(email_msg, new_messages[email_msg.uid])
+            )
+            for email_msg in created
+        }
+        save_attachments(
+            [attachment for items in attachments.values() for attachment in items]
+        )
+        for email_msg in created:
+            stored[email_msg.uid] = format_email_data(
+                email_msg,
+                [
+                    {"filename": attachment.filename, "url": download_url(attachment)}
+                    for attachment in attachments[email_msg.pk]
+                ],
+            )
+    return stored
+
+
+async def process_email_bodies(account, messages):
+    """
+    Completes messages that were stored from their headers only.
+
+    Args:
+        account (EmailAccount): The email account associated with the messages.
+        messages (list): ParsedMessage records of the full messages.
+
+    Returns:
+        list: The EmailMessage objects whose body was filled in.
+    """
+    with stage_timer("db_store_bodies"):
+        return await sync_to_async(_store_bodies)(account, messages)
+
+
+def _store_bodies(account, messages):
+    """
+    Synchronous part of ``process_email_bodies``, run in a worker thread.
+    """
+    parsed_messages = {parsed.uid: parsed for parsed in messages}
+    with transaction.atomic():
+        pending = list(
+            EmailMessage.objects.select_for_update().filter(
+                email_account=account,
+                uid__in=list(parsed_messages),
+                body_loaded=False,
+            )
+        )
+        # Another account may have stored the message since its headers were synced
+        copies = find_copies(parsed_messages[email_msg.uid] for email_msg in pending)
+        attachments = []
+        for email_msg in pending:
+            parsed = parsed_messages[email_msg.uid]
+            email_msg.snippet = make_snippet(parsed.body)
+            email_msg.body_loaded = True
+            for name, value in raw_location_fields(parsed).items():
+                setattr(email_msg, name, value)
+            copy = copies.get(email_msg.uid)
+            if copy is not None:
+                email_msg.content_id = copy.content_id
+                attachments.extend(copy_attachments(email_msg, copy))
+            else:
+                attachments.extend(build_attachments(email_msg, parsed))
+        EmailMessage.objects.bulk_update(
+            pending,
+            [
+                "snippet",
+                "body_loaded",
+                "raw_segment",
+                "raw_offset",
+                "raw_length",
+                "content",
+            ],
+        )
+        save_bodies(
+            [
+                (email_msg, parsed_messages[email_msg.uid])
+                for email_msg in pending
+                if email_msg.content_id is None
+            ]
+        )
+        update_search_vectors(
+            EmailMessage.objects.filter(pk__in=[email_msg.pk for email_msg in pending])
+        )
+        save_attachments(attachments)
+        if pending:
+            transaction.on_commit(lambda: invalidate_account(account.pk))
+    return pending
+
+
+def store_reparsed(pairs):
+    """
+    Replaces what was parsed from stored messages with a new parse of the same data.
+
+    Headers, body, snippet, search vector and attachments are rewritten in one
+    transaction. New attachments are saved before the old ones are deleted and
+    release their blobs, so unchanged content is kept in place. Messages without a
+    thread, e.g. stored before threads existed, are added to their threads.
+
+    Args:
+        pairs (list): Tuples of an EmailMessage, with ``content`` and ``thread`` not
+            deferred, and the ParsedMessage of its full raw message.
+
+    Returns:
+        None
+    """
+    email_messages = [email_msg for email_msg, _ in pairs]
+    with transaction.atomic():
+        for email_msg, parsed in pairs:
+            email_msg.subject = parsed.subject
+            email_msg.from_address = parsed.from_address
+            email_msg.sent_at = parsed.sent_at or email_msg.sent_at
+            email_msg.snippet = make_snippet(parsed.body)
+            email_msg.body_loaded = True
+            for name, value in message_id_fields(parsed).items():
+                setattr(email_msg, name, value)
+        EmailMessage.objects.bulk_update(
+            email_messages,
+            [
+                "subject",
+                "from_address",
+                "sent_at",
+                "snippet",
+                "body_loaded",
+                "message_id",
+                "in_reply_to",
+                "references",
+            ],
+        )
+        # A shared body is rewritten in place for every copy of the message
+        EmailBody.objects.bulk_update(
+            [
+                EmailBody(pk=email_msg.content_id, text=parsed.body)
+                for email_msg, parsed in pairs
+                if email_msg.content_id is not None
+            ],
+            ["text"],
+        )
+        save_bodies(
+            [
+                (email_msg, parsed)
+                for email_msg, parsed in pairs
+                if email_msg.content_id is None
+            ]
+        )
+        update_search_vectors(
+            EmailMessage.objects.filter(
+                content__in=[email_msg.content_id for email_msg in email_messages]
+            )
+        )
+
+        unthreaded = defaultdict(list)
+        for email_msg in email_messages:
+            if email_msg.thread_id is None:
+                unthreaded[email_msg.email_account_id].append(email_msg)
+        for account_id, account_messages in unthreaded.items():
+            assign_threads(EmailAccount(pk=account_id), account_messages)
+
+        old_attachments = list(
+            Attachment.objects.filter(email_message__in=email_messages).values_list(
+                "pk", flat=True
+            )
+        )
+        save_attachments(
+            [
+                attachment
+                for email_msg, parsed in pairs
+                for attachment in build_attachments(email_msg, parsed)
+            ]
+        )
+        old_attachments = Attachment.objects.filter(pk__in=old_attachments)
+        release_attachments(old_attachments)
+        old_attachments.delete()
+
+        for account_id in {email_msg.email_account_id for email_msg in email_messages}:
+            transaction.on_commit(
+                lambda account_id=account_id: invalidate_account(account_id)
+            )
+
+
+def raw_location_fields(parsed):
+    """
+    Returns the EmailMessage fields locating a parsed message in the raw archive.
+
+    Args:
+        parsed (ParsedMessage): The parsed message.
+
+    Returns:
+        dict: ``raw_segment``, ``raw_offset`` and ``raw_length``; None if the message
+            is not archived.
+    """
+    segment, offset, length = parsed.raw_location or (None, None, None)
+    return {"raw_segment": segment, "raw_offset": offset, "raw_length": length}
+
+
+def message_id_fields(parsed):
+    """
+    Returns the EmailMessage fields holding the threading headers of a parsed message.
+
+    Args:
+        parsed (ParsedMessage): The parsed message.
+
+    Returns:
+        dict: ``message_id``, ``in_reply_to`` and ``references``.
+    """
+    return {
+        "message_id": parsed.message_id,
+        "in_reply_to": parsed.in_reply_to,
+        "references": parsed.references,
+    }
+
+
+def find_copies(messages):
+    """
+    Looks up copies of parsed messages already stored with their body, in any account.
+
+    A copy has the same Message-ID, sender, subject and date. Matching more than the
+    Message-ID keeps a forged Message-ID from pulling in the body of another message.
+
+    Args:
+        messages (iterable): ParsedMessage records.
+
+    Returns:
+        dict: A copy (EmailMessage, with its attachments prefetched) by UID of the
+            parsed message.
+    """
+    by_message_id = {
+        parsed.message_id: parsed for parsed in messages if parsed.message_id
+    }
+    if not by_message_id:
+        return {}
+    candidates = (
+        EmailMessage.objects.filter(
+            message_id__in=list(by_message_id), content__isnull=False
+        )
+        .only(
+            "message_id",
+            "subject",
+            "from_address",
+            "sent_at",
+            "snippet",
+            "content",
+            "raw_segment",
+            "raw_offset",
+            "raw_length",
+        )
+        .prefetch_related("attachments")
+    )
+    copies = {}
+    for email_msg in candidates:
+        parsed = by_message_id[email_msg.message_id]
+        if (email_msg.subject, email_msg.from_address, email_msg.sent_at) == (
+            parsed.subject,
+            parsed.from_address,
+            parsed.sent_at,
+        ):
+            copies.setdefault(parsed.uid, email_msg)
+    return copies
+
+
+def save_bodies(pairs):
+    """
+    Inserts the bodies of stored messages into the EmailBody side table and links them.
+
+    Args:
+        pairs (list): Tuples of a saved EmailMessage and its ParsedMessage. Header-only
+            messages, whose body is None, are skipped.
+
+    Returns:
+        list: The inserted EmailBody objects.
+    """
+    pairs = [
+        (email_msg, parsed) for email_msg, parsed in pairs if parsed.body is not None
+    ]
+    bodies = EmailBody.objects.bulk_create(
+        [EmailBody(text=parsed.body) for _, parsed in pairs]
     )
-    attachments = await process_attachments(email_msg, email_message)
-    return format_email_data(email_msg, attachments)
+    for (email_msg, _), body in zip(pairs, bodies):
+        email_msg.content = body
+    EmailMessage.objects.bulk_update([email_msg for email_msg, _ in pairs], ["content"])
+    return bodies
+
+
+def delete_orphaned_bodies(body_ids=None):
+    """
+    Deletes the bodies no message refers to anymore, e.g. after a mailbox reset.
+
+    Args:
+        body_ids (iterable, optional): Only consider these bodies, e.g. those of
+            deleted messages, instead of scanning the whole table.
+
+    Returns:
+        int: The number of deleted bodies.
+    """
+    bodies = EmailBody.objects.filter(messages=None)
+    if body_ids is not None:
+        bodies = bodies.filter(pk__in=list(body_ids))
+    deleted, _ = bodies.delete()
+    return deleted
+
+
+def update_flags(account, flags_by_uid):
+    """
+    Stores the current IMAP flags of messages of an account.
+
+    Args:
+        account (EmailAccount): The email account.
+        flags_by_uid (dict): Flag lists by UID (str). UIDs that are not stored are
+            ignored.
+
+    Returns:
+        int: The number of messages whose flags changed.
+    """
+    changed = []
+    for email_msg in EmailMessage.objects.filter(
+        email_account=account, uid__in=list(flags_by_uid)
+    ).only("id", "uid", "flags"):
+        flags = sorted(flags_by_uid[email_msg.uid])
+        if email_msg.flags != flags:
+            email_msg.flags = flags
+            changed.append(email_msg)
+    if changed:
+        EmailMessage.objects.bulk_update(changed, ["flags"])
+        invalidate_account(account.pk)
+    return len(changed)
+
+
+def delete_messages(account, uids):
+    """
+    Deletes messages of an account that were removed from the mailbox.
+
+    Their threads are updated, and their bodies and attachment blobs are released
+    unless a copy in another account still refers to them.
+
+    Args:
+        account (EmailAccount): The email account.
+        uids (iterable): UIDs (str) of the removed messages. UIDs that are not stored
+            are ignored.
+
+    Returns:
+        int: The number of deleted messages.
+    """
+    uids = list(uids)
+    with transaction.atomic():
+        email_messages = EmailMessage.objects.filter(
+            email_account=account, uid__in=uids
+        )
+        references = list(email_messages.values_list("thread_id", "content_id"))
+        if not references:
+            return 0
+        release_attachments(Attachment.objects.filter(email_message__in=email_messages))
+        email_messages.delete()
+        account.sync_failures.filter(uid__in=uids).delete()
+        prune_threads({thread_id for thread_id, _ in references} - {None})
+        delete_orphaned_bodies({content_id for _, content_id in references} - {None})
+        transaction.on_commit(lambda: invalidate_account(account.pk))
+    return len(references)
+
+
+def delete_all_messages(account):
+    """
+    Deletes every message of an account, e.g. when its mailbox was reset.
+
+    Its threads and sync failures go too, and the bodies and attachment blobs of the
+    messages are released unless a copy in another account still refers to them.
+
+    Args:
+        account (EmailAccount): The email account.
+
+    Returns:
+        None
+    """
+    with transaction.atomic():
+        body_ids = list(
+            account.messages.exclude(content=None).values_list("content_id", flat=True)
+        )
+        release_attachments(
+            Attachment.objects.filter(email_message__email_account=account)
+        )
+        account.messages.all().delete()
+        account.threads.all().delete()
+        account.sync_failures.all().delete()
+        delete_orphaned_bodies(body_ids)
+        transaction.on_commit(lambda: invalidate_account(account.pk))
+
+
+def make_snippet(body):
+    """
+    Returns the start of a body with collapsed whitespace, for the ``snippet`` column.
+
+    Args:
+        body (str): The body text, or None.
+
+    Returns:
+        str: At most ``SNIPPET_LENGTH`` characters.
+    """
+    if not body:
+        return ""
+    # Four times the length leaves room for the whitespace that is collapsed
+    return " ".join(body[: SNIPPET_LENGTH * 4].split())[:SNIPPET_LENGTH]
 
 
 def decode_header_value(value):
@@ -123,47 +599,53 @@ def extract_body_content(msg):
     )
 
 
-async def process_attachments(email_msg, email_message):
+def build_attachments(email_msg, parsed):
     """
-    Processes attachments in an email and saves them to the database.
+    Builds the (unsaved) attachment models of a parsed email.
 
     Args:
         email_msg (EmailMessage): The email message object from the database.
-        email_message (email.message.EmailMessage): The email message object from the IMAP server.
+        parsed (ParsedMessage): The parsed message, with attachments staged in blob storage.
 
     Returns:
-        list: A list of dictionaries containing filenames and URLs of saved attachments.
+        list: Unsaved Attachment objects, ready for ``save_attachments``.
     """
     return [
-        {"filename": attachment.filename, "url": attachment.file.url}
-        for part in email_message.walk()
-        if "attachment" in (part.get("Content-Disposition") or "").lower()
-        if (
-            attachment := await save_attachment(
-                email_msg, part, decode_header_value(part.get_filename())
-            )
+        Attachment(
+            email_message=email_msg,
+            filename=attachment.filename,
+            file=attachment.name,
+            blob_id=attachment.sha256,
+            sha256=attachment.sha256,
+            size=attachment.size,
         )
+        for attachment in parsed.attachments
     ]
 
 
-async def save_attachment(email_msg, part, filename):
+def copy_attachments(email_msg, source):
     """
-    Saves an email attachment to the file system and database.
+    Builds the (unsaved) attachment models of a message from those of a stored copy.
 
     Args:
         email_msg (EmailMessage): The email message object from the database.
-        part (email.message.Message): The email part representing the attachment.
-        filename (str): The name of the file to save.
+        source (EmailMessage): The stored copy, with its attachments prefetched.
 
     Returns:
-        Attachment: The saved attachment object.
+        list: Unsaved Attachment objects sharing the blobs of the copy, ready for
+            ``save_attachments``.
     """
-    attachment = Attachment(email_message=email_msg, filename=filename)
-    await sync_to_async(attachment.file.save)(
-        filename, ContentFile(part.get_payload(decode=True))
-    )
-    await sync_to_async(attachment.save)()
-    return attachment
+    return [
+        Attachment(
+            email_message=email_msg,
+            filename=attachment.filename,
+            file=attachment.file.name,
+            blob_id=attachment.blob_id,
+            sha256=attachment.sha256,
+            size=attachment.size,
+        )
+        for attachment in source.attachments.all()
+    ]
 
 
 def format_email_data(email_msg, attachments):
@@ -175,7 +657,7 @@ def format_email_data(email_msg, attachments):
         attachments (list): A list of attachment data for the email.
 
     Returns:
-        dict: A dictionary containing the email's subject, from address, dates, body, and attachments.
+        dict: A dictionary containing the email's subject, from address, dates, snippet, and attachments.
     """
     return {
         "subject": email_msg.subject,
@@ -184,6 +666,6 @@ def format_email_data(email_msg, attachments):
             email_msg.sent_at.strftime("%Y-%m-%d %H:%M:%S") if email_msg.sent_at else ""
         ),
         "received_at": email_msg.received_at.strftime("%Y-%m-%d %H:%M:%S"),
-        "body": email_msg.body[:50],
+        "snippet": email_msg.snippet,
         "attachments": attachments,
     }
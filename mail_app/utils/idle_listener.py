@@ -0,0 +1,112 @@
+import asyncio
+import json
+import logging
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from mail_app.models import EmailAccount
+from mail_app.utils import metrics
+from mail_app.utils.broadcast import broadcast
+from mail_app.utils.email_service import sync_mailbox
+from mail_app.utils.imap_client import client_for_provider
+from mail_app.utils.sync_lock import account_sync_lease
+
+logger = logging.getLogger(__name__)
+
+
+async def run_idle_listeners(emails=None):
+    """
+    Keeps an IDLE listener running for every configured email account.
+
+    The account list is reloaded every ``IMAP_IDLE_ACCOUNT_REFRESH`` seconds, so
+    accounts added, changed or removed in the admin are picked up without a restart.
+
+    Args:
+        emails (list, optional): Restricts listening to these email addresses.
+
+    Returns:
+        None
+    """
+    listeners = {}
+    try:
+        while True:
+            accounts = EmailAccount.objects.all()
+            if emails:
+                accounts = accounts.filter(email__in=emails)
+            accounts = {
+                (account.pk, account.email, account.password, account.provider): account
+                for account in await sync_to_async(list)(accounts)
+            }
+            for key in set(listeners) - set(accounts):
+                listeners.pop(key).cancel()
+            for key in set(accounts) - set(listeners):
+                listeners[key] = asyncio.ensure_future(
+                    listen_account(accounts[key], broadcast)
+                )
+            await asyncio.sleep(settings.IMAP_IDLE_ACCOUNT_REFRESH)
+    finally:
+        for task in listeners.values():
+            task.cancel()
+
+
+async def listen_account(account, send_callback):
+    """
+    Holds IMAP IDLE on the account's inbox and ingests new messages as they arrive.
+
+    Every wake-up (a new message or the IDLE timeout) runs an incremental sync on the
+    same session, which only fetches UIDs above the account's watermark. The sync waits
+    for the account's sync lease, so it never overlaps a sync run elsewhere, and reloads
+    the watermark that sync may have advanced. Connection errors are retried with
+    exponential backoff.
+
+    Args:
+        account (EmailAccount): The email account to listen on.
+        send_callback (function): Callback that receives the sync progress frames.
+
+    Returns:
+        None
+    """
+    backoff = 1
+    while True:
+        mail = client_for_provider(account.provider)
+        metrics.IMAP_SESSIONS.labels(account.provider).inc()
+        try:
+            await mail.connect()
+            await mail.login(account.email, account.password)
+            await mail.enable_extensions("QRESYNC", "CONDSTORE")
+            logger.info("Listening for new mail on %s", account.email)
+            while True:
+                async with account_sync_lease(account, wait=True):
+                    await account.arefresh_from_db()
+                    with metrics.ACTIVE_SYNCS.track_inprogress():
+                        await sync_mailbox(
+                            account, mail, _drop_idle_complete(send_callback)
+                        )
+                backoff = 1
+                await mail.idle(settings.IMAP_IDLE_TIMEOUT)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            metrics.ERRORS.labels(account.pk, account.provider).inc()
+            logger.exception("IDLE listener for %s failed", account.email)
+        finally:
+            metrics.IMAP_SESSIONS.labels(account.provider).dec()
+            try:
+                await mail.logout()
+            except Exception:
+                pass
+        await asyncio.sleep(backoff)
+        backoff = min(backoff * 2, settings.IMAP_IDLE_MAX_BACKOFF)
+
+
+def _drop_idle_complete(send_callback):
+    """
+    Wraps a send callback so that "No new messages" notices are not broadcast.
+
+    IDLE wake-ups without new mail are frequent and carry no information for clients.
+    """
+
+    async def send(text_data):
+        if json.loads(text_data).get("status") != "complete":
+            await send_callback(text_data)
+
+    return send
@@ -0,0 +1,295 @@
+import asyncio
+import functools
+import imaplib
+import itertools
+import re
+import select
+import socket
+import ssl
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from mail_app.utils.email_utils import get_imap_server
+from mail_app.utils.provider_limits import get_provider_limiter, is_throttled
+
+_executor = None
+# FETCH items transferring whole messages: BODY[], BODY.PEEK[] or RFC822
+_BODY_FETCH_RE = re.compile(r"\bBODY(?:\.PEEK)?\[\]|\bRFC822(?![.\w])", re.IGNORECASE)
+
+
+def get_imap_executor():
+    """
+    Returns the shared, bounded thread pool that runs blocking IMAP calls.
+
+    The pool is created lazily with ``IMAP_EXECUTOR_WORKERS`` threads, which caps the
+    number of IMAP commands in flight across all accounts of the process.
+    """
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.IMAP_EXECUTOR_WORKERS, thread_name_prefix="imap"
+        )
+    return _executor
+
+
+def client_for_provider(provider):
+    """
+    Returns an unconnected client for the IMAP server of an email provider.
+
+    With ``IMAP_SERVER_OVERRIDE`` set to ``host:port``, every provider is served by
+    that plaintext server instead, e.g. the fake server of the benchmarks.
+
+    Args:
+        provider (str): The provider of the account.
+
+    Returns:
+        AsyncIMAPClient: The client.
+    """
+    if settings.IMAP_SERVER_OVERRIDE:
+        host, port = settings.IMAP_SERVER_OVERRIDE.rsplit(":", 1)
+        return AsyncIMAPClient(host, int(port), use_ssl=False, provider=provider)
+    return AsyncIMAPClient(get_imap_server(provider), provider=provider)
+
+
+class AsyncIMAPClient:
+    """
+    Asyncio adapter around ``imaplib.IMAP4_SSL``.
+
+    Every blocking call runs on the shared IMAP executor, so the event loop stays free
+    while a command waits on the network; IDLE runs on a thread of its own. Commands
+    on one connection are serialized with a lock, as an IMAP session handles a single
+    command at a time. Logins and mailbox commands stay within the provider's limits
+    (see ``provider_limits``) and are retried after a cooldown when the server
+    throttles them.
+
+    Attributes:
+        enabled (set): The extensions enabled with ``enable_extensions``, e.g. QRESYNC.
+    """
+
+    def __init__(self, host, port=imaplib.IMAP4_SSL_PORT, use_ssl=True, provider=None):
+        self.host = host
+        self.port = port
+        self.use_ssl = use_ssl
+        self.provider = provider or host
+        self._imap = None
+        self._lock = asyncio.Lock()
+        self.enabled = set()
+
+    async def _run(self, func, *args):
+        """Runs a blocking function on the IMAP executor and awaits its result."""
+        async with self._lock:
+            return await self._execute(func, *args)
+
+    async def _run_limited(self, kind, func, *args, timed=True):
+        """
+        Runs an IMAP command like ``_run``, within the provider's limits.
+
+        A command the server throttles is retried up to ``IMAP_THROTTLE_RETRIES``
+        times, once the provider's cooldown has passed.
+
+        Args:
+            kind (str): The rate limit that applies, "login" or "command".
+            func (function): The blocking imaplib method.
+            *args: Its arguments.
+            timed (bool): Whether the command's duration measures the provider's load.
+
+        Returns:
+            The result of ``func``.
+        """
+        limiter = get_provider_limiter(self.provider)
+        async with self._lock:
+            for attempt in itertools.count():
+                retry = attempt < settings.IMAP_THROTTLE_RETRIES
+                async with limiter.slot(kind, timed) as slot:
+                    try:
+                        result = await self._execute(func, *args)
+                    except imaplib.IMAP4.abort:
+                        raise
+                    except imaplib.IMAP4.error as e:
+                        slot.throttled = is_throttled(str(e))
+                        if not (slot.throttled and retry):
+                            raise
+                        continue
+                    slot.throttled = _is_throttled_result(result)
+                    if not (slot.throttled and retry):
+                        return result
+
+    async def _execute(self, func, *args):
+        """Runs a blocking function on the IMAP executor, holding the session lock."""
+        return await asyncio.get_running_loop().run_in_executor(
+            get_imap_executor(), functools.partial(func, *args)
+        )
+
+    async def connect(self):
+        """Opens the TLS (or, without ``use_ssl``, plaintext) connection to the server."""
+        imap_class = imaplib.IMAP4_SSL if self.use_ssl else imaplib.IMAP4
+        self._imap = await self._run(
+            functools.partial(imap_class, timeout=settings.IMAP_TIMEOUT),
+            self.host,
+            self.port,
+        )
+
+    async def login(self, user, password):
+        """Authenticates the session."""
+        return await self._run_limited("login", self._imap.login, user, password)
+
+    async def enable_extensions(self, *names):
+        """
+        Enables the extensions among ``names`` that the server supports (RFC 5161).
+
+        The capabilities are requested again first, as servers often announce
+        extensions only after login. Must be called before a mailbox is selected.
+
+        Returns:
+            set: The extensions enabled by the server.
+        """
+        self.enabled = await self._run(self._enable_extensions, names)
+        return self.enabled
+
+    def _enable_extensions(self, names):
+        """Blocking CAPABILITY/ENABLE exchange, run on the executor."""
+        imap = self._imap
+        result, data = imap.capability()
+        if result == "OK" and data and data[-1]:
+            imap.capabilities = tuple(data[-1].decode().upper().split())
+        wanted = [name for name in names if name in imap.capabilities]
+        if not wanted or "ENABLE" not in imap.capabilities:
+            return set()
+        result, _ = imap._simple_command("ENABLE", *wanted)
+        _, data = imap.response("ENABLED")
+        if result != "OK":
+            return set()
+        return {name.decode().upper() for line in data if line for name in line.split()}
+
+    async def select(self, mailbox="inbox"):
+        """Selects a mailbox."""
+        return await self._run_limited("command", self._imap.select, mailbox)
+
+    async def uid(self, command, *args):
+        """Runs a UID command (SEARCH, FETCH, ...) and returns ``(typ, data)``."""
+        # Body fetches take as long as their messages are big, whatever the load
+        timed = not (
+            command.upper() == "FETCH"
+            and any(_BODY_FETCH_RE.search(str(arg)) for arg in args[1:])
+        )
+        return await self._run_limited(
+            "command", self._imap.uid, command, *args, timed=timed
+        )
+
+    async def noop(self):
+        """Sends NOOP, e.g. to keep the session alive or poll for updates."""
+        return await self._run(self._imap.noop)
+
+    async def logout(self):
+        """Logs out and closes the connection."""
+        return await self._run(self._imap.logout)
+
+    async def idle(self, timeout):
+        """
+        Waits in IMAP IDLE until the server announces new messages or ``timeout`` expires.
+
+        Returns immediately if an EXISTS response was received since the last
+        ``response("EXISTS")`` call, as that mail may not have been synced yet.
+
+        Returns:
+            list: The untagged response lines (bytes) received while idling.
+        """
+        async with self._lock:
+            return await self._run_in_thread(self._idle, timeout)
+
+    async def _run_in_thread(self, func, *args):
+        """
+        Runs a blocking function on a thread of its own and awaits its result.
+
+        IDLE blocks for up to ``IMAP_IDLE_TIMEOUT``, so it must not hold a worker of
+        the bounded IMAP executor: with as many idling accounts as workers, the
+        connects, logins and syncs that follow a wake-up would queue behind them.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def resolve(result, error):
+            if future.done():
+                return
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+        def target():
+            try:
+                outcome = (func(*args), None)
+            except BaseException as e:
+                outcome = (None, e)
+            try:
+                loop.call_soon_threadsafe(resolve, *outcome)
+            except RuntimeError:
+                # The loop was closed while the session idled
+                pass
+
+        threading.Thread(target=target, name="imap-idle", daemon=True).start()
+        return await future
+
+    def _idle(self, timeout):
+        """Blocking IDLE/DONE exchange, run on the executor."""
+        imap = self._imap
+        # New mail announced during earlier commands needs no IDLE round trip
+        announced = imap.untagged_responses.pop("EXISTS", None)
+        if announced:
+            return [b"* " + announced[-1] + b" EXISTS"]
+
+        tag = imap._new_tag()
+        imap.send(tag + b" IDLE\r\n")
+        line = imap._get_line()
+        if not line.startswith(b"+"):
+            raise imap.error(f"IDLE rejected: {line!r}")
+
+        responses, partial = [], b""
+        deadline = time.monotonic() + timeout
+        imap.sock.setblocking(False)
+        try:
+            while not any(line.endswith(b"EXISTS") for line in responses):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                # Data already decrypted by the TLS layer is not visible to select()
+                pending = getattr(imap.sock, "pending", lambda: 0)()
+                if not pending and not select.select([imap.sock], [], [], remaining)[0]:
+                    break
+                for attempt in itertools.count():
+                    try:
+                        chunk = imap.readline()
+                    except (BlockingIOError, ssl.SSLWantReadError, socket.timeout):
+                        break
+                    if not chunk:
+                        if attempt == 0:
+                            raise imap.abort("connection closed while idling")
+                        break
+                    partial += chunk
+                    if partial.endswith(b"\n"):
+                        responses.append(partial.rstrip(b"\r\n"))
+                        partial = b""
+        finally:
+            imap.sock.settimeout(settings.IMAP_TIMEOUT)
+
+        imap.send(b"DONE\r\n")
+        if partial:
+            responses.append(partial + imap._get_line())
+        while not (line := imap._get_line()).startswith(tag):
+            responses.append(line)
+        return responses
+
+    def response(self, code):
+        """Returns and clears the untagged response data stored for ``code``."""
+        return self._imap.response(code)
+
+
+def _is_throttled_result(result):
+    """Returns whether a ``(typ, data)`` command result is a throttling NO response."""
+    typ, data = result
+    if typ != "NO":
+        return False
+    return any(
+        is_throttled(line.decode("latin-1")) for line in data if isinstance(line, bytes)
+    )
@@ -0,0 +1,217 @@
+import asyncio
+import time
+import weakref
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from django.conf import settings
+from mail_app.utils import metrics
+from mail_app.utils.imap_client import client_for_provider
+
+_pools = weakref.WeakKeyDictionary()
+
+
+def get_imap_pool():
+    """
+    Returns the IMAP connection pool of the running event loop.
+
+    Connections and asyncio primitives cannot be shared between event loops, so each
+    loop (the ASGI server, a management command, ...) gets its own pool.
+    """
+    loop = asyncio.get_running_loop()
+    if loop not in _pools:
+        _pools[loop] = IMAPConnectionPool()
+    return _pools[loop]
+
+
+class IMAPConnectionPool:
+    """
+    Pool of authenticated IMAP sessions keyed by email account.
+
+    Idle sessions are kept alive with NOOP and checked before reuse, sessions that
+    fail while in use are discarded, and the number of open sessions per provider is
+    capped by ``IMAP_POOL_MAX_PER_PROVIDER``.
+    """
+
+    def __init__(self):
+        self._idle = defaultdict(list)
+        self._open = defaultdict(int)
+        self._cond = asyncio.Condition()
+        self._keepalive_task = None
+
+    @staticmethod
+    def _key(account):
+        """Identifies the sessions usable for an account, including its credentials."""
+        return account.pk, account.email, account.password, account.provider
+
+    @asynccontextmanager
+    async def connection(self, account):
+        """
+        Borrows an authenticated session for the account.
+
+        The session goes back to the pool when the block exits normally and is closed
+        when the block raises, since its protocol state is unknown at that point.
+
+        Args:
+            account (EmailAccount): The email account to connect to.
+
+        Yields:
+            AsyncIMAPClient: The authenticated IMAP session.
+        """
+        client = await self.acquire(account)
+        try:
+            yield client
+        except BaseException:
+            await self.discard(account, client)
+            raise
+        await self.release(account, client)
+
+    async def acquire(self, account):
+        """
+        Returns a healthy pooled session for the account or opens a new one.
+
+        Waits while the provider is at its connection cap and no idle session of
+        another account of the same provider can be evicted.
+        """
+        self._start_keepalive()
+        key, provider = self._key(account), account.provider
+        async with self._cond:
+            while True:
+                if self._idle[key]:
+                    client, released_at = self._idle[key].pop()
+                    break
+                if self._open[provider] < settings.IMAP_POOL_MAX_PER_PROVIDER:
+                    self._open[provider] += 1
+                    metrics.IMAP_SESSIONS.labels(provider).inc()
+                    client = None
+                    break
+                victim = self._pop_idle_of_provider(provider)
+                if victim is not None:
+                    # Take over the evicted session's slot
+                    asyncio.ensure_future(_close_quietly(victim))
+                    client = None
+                    break
+                await self._cond.wait()
+
+        if client is not None and await self._is_healthy(client, released_at):
+            return client
+        if client is not None:
+            await _close_quietly(client)
+        try:
+            return await self._open_session(account)
+        except BaseException:
+            await self._forget(provider)
+            raise
+
+    async def release(self, account, client):
+        """Returns a session to the pool for reuse."""
+        async with self._cond:
+            self._idle[self._key(account)].append((client, time.monotonic()))
+            self._cond.notify()
+
+    async def discard(self, account, client):
+        """Closes a session that must not be reused and frees its slot."""
+        await _close_quietly(client)
+        await self._forget(account.provider)
+
+    async def close_all(self):
+        """Logs out every idle session and stops the keepalive task."""
+        if self._keepalive_task is not None:
+            self._keepalive_task.cancel()
+            self._keepalive_task = None
+        async with self._cond:
+            idle = [
+                (key, client)
+                for key, sessions in self._idle.items()
+                for client, _ in sessions
+            ]
+            self._idle.clear()
+            for key, _ in idle:
+                self._open[key[3]] -= 1
+                metrics.IMAP_SESSIONS.labels(key[3]).dec()
+            self._cond.notify_all()
+        await asyncio.gather(*(_close_quietly(client) for _, client in idle))
+
+    async def _open_session(self, account):
+        """Connects and authenticates a new session for the account."""
+        client = client_for_provider(account.provider)
+        await client.connect()
+        try:
+            await client.login(account.email, account.password)
+            # Lets syncs pick up flag changes and deletions incrementally
+            await client.enable_extensions("QRESYNC", "CONDSTORE")
+        except BaseException:
+            await _close_quietly(client)
+            raise
+        return client
+
+    async def _is_healthy(self, client, released_at, probe_after=None):
+        """
+        Checks an idle session, probing it with NOOP if it has been idle for a while.
+
+        Sessions idle for longer than ``IMAP_POOL_MAX_IDLE`` are considered expired.
+        """
+        idle_for = time.monotonic() - released_at
+        if idle_for > settings.IMAP_POOL_MAX_IDLE:
+            return False
+        if idle_for < (
+            settings.IMAP_POOL_KEEPALIVE if probe_after is None else probe_after
+        ):
+            return True
+        try:
+            result, _ = await client.noop()
+        except Exception:
+            return False
+        return result == "OK"
+
+    async def _forget(self, provider):
+        """Frees a provider slot after a session was closed."""
+        async with self._cond:
+            self._open[provider] -= 1
+            metrics.IMAP_SESSIONS.labels(provider).dec()
+            self._cond.notify()
+
+    def _pop_idle_of_provider(self, provider):
+        """Removes and returns the least recently used idle session of a provider."""
+        candidates = [
+            (released_at, key, index)
+            for key, sessions in self._idle.items()
+            for index, (_, released_at) in enumerate(sessions)
+            if key[3] == provider
+        ]
+        if not candidates:
+            return None
+        _, key, index = min(candidates)
+        return self._idle[key].pop(index)[0]
+
+    def _start_keepalive(self):
+        """Starts the background keepalive task once per pool."""
+        if self._keepalive_task is None or self._keepalive_task.done():
+            self._keepalive_task = asyncio.ensure_future(self._keepalive())
+
+    async def _keepalive(self):
+        """Periodically sends NOOP on idle sessions and drops dead or expired ones."""
+        while True:
+            await asyncio.sleep(settings.IMAP_POOL_KEEPALIVE)
+            async with self._cond:
+                idle = [
+                    (key, client, released_at)
+                    for key, sessions in self._idle.items()
+                    for client, released_at in sessions
+                ]
+                self._idle.clear()
+            for key, client, released_at in idle:
+                if await self._is_healthy(client, released_at, probe_after=0):
+                    async with self._cond:
+                        self._idle[key].append((client, released_at))
+                        self._cond.notify()
+                else:
+                    await _close_quietly(client)
+                    await self._forget(key[3])
+
+
+async def _close_quietly(client):
+    """Logs out a session, ignoring errors from an already broken connection."""
+    try:
+        await client.logout()
+    except Exception:
+        pass
@@ -0,0 +1,193 @@
+"""
+Prometheus metrics of the sync pipeline.
+
+Metrics are recorded with ``prometheus_client`` when it is installed and
+``METRICS_ENABLED`` is set. Otherwise every metric is a shared no-op object, so
+instrumented code costs a method call and nothing else.
+"""
+
+import contextlib
+import hmac
+import threading
+from django.conf import settings
+from django.core.exceptions import PermissionDenied
+from django.http import Http404, HttpResponse
+
+try:
+    import prometheus_client
+except ImportError:
+    prometheus_client = None
+
+ENABLED = bool(settings.METRICS_ENABLED and prometheus_client)
+
+# Stage durations range from sub-millisecond parses to minute-long IMAP fetches
+_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+    10,
+    30,
+    60,
+)
+
+
+class _NoopMetric:
+    """Stands in for every metric type when metrics are disabled."""
+
+    def labels(self, *args, **kwargs):
+        return self
+
+    def inc(self, amount=1):
+        pass
+
+    def dec(self, amount=1):
+        pass
+
+    def set(self, value):
+        pass
+
+    def observe(self, value):
+        pass
+
+    def time(self):
+        return contextlib.nullcontext()
+
+    def track_inprogress(self):
+        return contextlib.nullcontext()
+
+
+if ENABLED:
+    STAGE_SECONDS = prometheus_client.Histogram(
+        "mail_sync_stage_seconds",
+        "Duration of a sync pipeline stage for one batch or message.",
+        ["stage"],
+        buckets=_BUCKETS,
+    )
+    MESSAGES = prometheus_client.Counter(
+        "mail_sync_messages_total",
+        "Emails stored by syncs.",
+        ["account_id", "provider"],
+    )
+    BYTES = prometheus_client.Counter(
+        "mail_sync_fetched_bytes_total",
+        "Raw message bytes fetched from IMAP.",
+        ["account_id", "provider"],
+    )
+    ERRORS = prometheus_client.Counter(
+        "mail_sync_errors_total",
+        "Failed syncs.",
+        ["account_id", "provider"],
+    )
+    MESSAGE_FAILURES = prometheus_client.Counter(
+        "mail_sync_message_failures_total",
+        "Messages that failed to sync and were scheduled for a retry.",
+        ["account_id", "provider", "stage"],
+    )
+    ACTIVE_SYNCS = prometheus_client.Gauge(
+        "mail_sync_active", "Syncs currently running in the process."
+    )
+    IMAP_SESSIONS = prometheus_client.Gauge(
+        "mail_imap_sessions_open",
+        "Open or opening IMAP sessions of the process.",
+        ["provider"],
+    )
+    WEBSOCKET_FRAMES = prometheus_client.Counter(
+        "mail_websocket_frames_total", "Frames sent to websocket clients."
+    )
+    IMAP_CONCURRENCY_LIMIT = prometheus_client.Gauge(
+        "mail_imap_concurrency_limit",
+        "IMAP commands allowed in flight per provider, adjusted to its load.",
+        ["provider"],
+    )
+    IMAP_THROTTLED = prometheus_client.Counter(
+        "mail_imap_throttled_total",
+        "IMAP commands the provider throttled.",
+        ["provider"],
+    )
+else:
+    STAGE_SECONDS = MESSAGES = BYTES = ERRORS = MESSAGE_FAILURES = _NoopMetric()
+    ACTIVE_SYNCS = IMAP_SESSIONS = WEBSOCKET_FRAMES = _NoopMetric()
+    IMAP_CONCURRENCY_LIMIT = IMAP_THROTTLED = _NoopMetric()
+
+_server_lock = threading.Lock()
+_server_started = False
+
+
+def stage_timer(stage):
+    """
+    Returns a context manager recording its duration under a pipeline stage.
+
+    Args:
+        stage (str): The stage name, e.g. ``"imap_fetch"`` or ``"db_store"``.
+
+    Returns:
+        contextmanager: The timer.
+    """
+    return STAGE_SECONDS.labels(stage).time()
+
+
+def observe_stages(timings):
+    """
+    Records stage durations measured elsewhere, e.g. in the parser processes.
+
+    Args:
+        timings (dict): Seconds by stage name.
+
+    Returns:
+        None
+    """
+    if ENABLED:
+        for stage, seconds in timings.items():
+            STAGE_SECONDS.labels(stage).observe(seconds)
+
+
+def metrics_view(request):
+    """
+    Serves the metrics of the process in the Prometheus text format.
+
+    Only staff users and scrapers sending ``Authorization: Bearer <METRICS_TOKEN>``
+    get them, as they reveal the accounts and providers being synced.
+    """
+    if not ENABLED:
+        raise Http404("Metrics are disabled.")
+    if not (request.user.is_staff or _has_metrics_token(request)):
+        raise PermissionDenied
+    return HttpResponse(
+        prometheus_client.generate_latest(),
+        content_type=prometheus_client.CONTENT_TYPE_LATEST,
+    )
+
+
+def _has_metrics_token(request):
+    """Returns whether the request carries the configured metrics bearer token."""
+    if not settings.METRICS_TOKEN:
+        return False
+    expected = f"Bearer {settings.METRICS_TOKEN}"
+    return hmac.compare_digest(
+        request.headers.get("Authorization", "").encode(), expected.encode()
+    )
+
+
+def start_metrics_server():
+    """
+    Serves the metrics on ``METRICS_PORT`` from processes without an HTTP server,
+    like sync workers and the IDLE listener. Does nothing if already started,
+    disabled, or no port is set.
+    """
+    global _server_started
+    if not ENABLED or not settings.METRICS_PORT:
+        return
+    with _server_lock:
+        if not _server_started:
+            prometheus_client.start_http_server(settings.METRICS_PORT)
+            _server_started = True
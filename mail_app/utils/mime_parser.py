@@ -0,0 +1,211 @@
+import asyncio
+import email
+import multiprocessing
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime
+from django.conf import settings
+from mail_app.utils.attachment_storage import store_blob
+from mail_app.utils.email_utils import (
+    decode_header_value,
+    extract_body_content,
+    parse_date,
+)
+from mail_app.utils.parser_worker import init_worker, parse_batch
+
+_executor = None
+
+_MESSAGE_ID_RE = re.compile(r"<([^<>\s]+)>")
+# Longest Message-ID that is stored; longer ones are cut to fit the column
+_MAX_MESSAGE_ID_LENGTH = 255
+
+
+@dataclass
+class ParsedAttachment:
+    """
+    An attachment already written to the blob staging area by the parser.
+
+    Attributes:
+        filename (str): The original name of the file.
+        sha256 (str): Hex SHA-256 digest of the content.
+        size (int): The content size in bytes.
+        name (str): The storage name of the staged content.
+    """
+
+    filename: str
+    sha256: str
+    size: int
+    name: str
+
+
+@dataclass
+class ParsedMessage:
+    """
+    Compact, picklable result of parsing a raw message.
+
+    Attributes:
+        uid (str): UID of the message in the mailbox.
+        subject (str): The decoded subject.
+        from_address (str): The decoded sender.
+        sent_at (datetime): The parsed Date header, or None.
+        size (int): The size of the raw message in bytes, or None.
+        body (str): The extracted body text, or None for header-only messages.
+        message_id (str): The Message-ID, without angle brackets, or None.
+        in_reply_to (str): The first Message-ID of In-Reply-To, or None.
+        references (list): The Message-IDs of the References header, oldest first.
+        attachments (list): ParsedAttachment records.
+        timings (dict): Seconds spent per parsing stage, reported to the metrics by
+            the parent process.
+        raw_location (tuple): ``(segment, offset, length)`` of the raw message in the
+            raw archive, or None if it is not archived.
+    """
+
+    uid: str
+    subject: str
+    from_address: str
+    sent_at: datetime = None
+    size: int = None
+    body: str = None
+    message_id: str = None
+    in_reply_to: str = None
+    references: list = field(default_factory=list)
+    attachments: list = field(default_factory=list)
+    timings: dict = field(default_factory=dict)
+    raw_location: tuple = None
+
+
+@dataclass
+class ParseFailure:
+    """
+    A message the parser could not handle.
+
+    Attributes:
+        uid (str): UID of the message in the mailbox.
+        error (str): The exception raised by the parser.
+    """
+
+    uid: str
+    error: str
+
+
+def parse_message(uid, raw_email, size=None, headers_only=False):
+    """
+    Parses a raw message into a ParsedMessage, streaming attachments to storage.
+
+    Args:
+        uid (str): UID of the message in the mailbox.
+        raw_email (bytes): The raw message, or only its header block.
+        size (int, optional): The size of the raw message in bytes.
+        headers_only (bool): Whether ``raw_email`` only holds headers.
+
+    Returns:
+        ParsedMessage: The parsed message.
+    """
+    started = time.perf_counter()
+    email_message = email.message_from_bytes(raw_email)
+    parsed = ParsedMessage(
+        uid=uid,
+        subject=decode_header_value(email_message.get("Subject", "")),
+        from_address=decode_header_value(email_message.get("From", "")),
+        sent_at=parse_date(email_message.get("Date", "")),
+        size=size,
+        message_id=_first(parse_message_ids(email_message.get("Message-ID"))),
+        in_reply_to=_first(parse_message_ids(email_message.get("In-Reply-To"))),
+        references=parse_message_ids(email_message.get("References")),
+    )
+    parsed.timings["mime_parse"] = time.perf_counter() - started
+    if not headers_only:
+        started = time.perf_counter()
+        parsed.body = extract_body_content(email_message)
+        parsed.timings["body_extract"] = time.perf_counter() - started
+        started = time.perf_counter()
+        parsed.attachments = [
+            ParsedAttachment(filename, *store_blob(part, filename))
+            for part in email_message.walk()
+            if "attachment" in (part.get("Content-Disposition") or "").lower()
+            for filename in [decode_header_value(part.get_filename())]
+        ]
+        parsed.timings["attachment_write"] = time.perf_counter() - started
+    return parsed
+
+
+def parse_message_ids(value):
+    """
+    Extracts the ``<id>`` tokens of a Message-ID, In-Reply-To or References header.
+
+    Args:
+        value (str): The header value, or None.
+
+    Returns:
+        list: The Message-IDs without angle brackets, in header order and without
+            duplicates.
+    """
+    if not value:
+        return []
+    ids = _MESSAGE_ID_RE.findall(str(value))
+    return list(dict.fromkeys(id_[:_MAX_MESSAGE_ID_LENGTH] for id_ in ids))
+
+
+def _first(items):
+    """Returns the first item of a list, or None if it is empty."""
+    return items[0] if items else None
+
+
+def get_parser_executor():
+    """
+    Returns the shared process pool for MIME parsing, or None if it is disabled.
+
+    The pool has ``EMAIL_PARSE_WORKERS`` processes and is created lazily. Processes
+    are spawned rather than forked, as the parent runs an event loop and threads.
+    """
+    global _executor
+    if _executor is None and settings.EMAIL_PARSE_WORKERS > 0:
+        _executor = ProcessPoolExecutor(
+            max_workers=settings.EMAIL_PARSE_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=init_worker,
+        )
+    return _executor
+
+
+def shutdown_parser_executor():
+    """Stops the parser processes, if any; the next parse starts a new pool."""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown()
+        _executor = None
+
+
+async def parse_messages(items, headers_only=False):
+    """
+    Parses a batch of raw messages off the event loop.
+
+    The batch is split across the parser processes, so large HTML messages are
+    parsed on every core. With ``EMAIL_PARSE_WORKERS = 0`` parsing runs in a thread.
+
+    Args:
+        items (list): Tuples of the UID (str), the raw message (bytes) and its size.
+        headers_only (bool): Whether the raw messages only hold headers.
+
+    Returns:
+        list: ParsedMessage records, or ParseFailure records for messages that could
+            not be parsed, in the order of ``items``.
+    """
+    loop = asyncio.get_running_loop()
+    executor = get_parser_executor()
+    if executor is None or len(items) < 2:
+        return await loop.run_in_executor(None, parse_batch, items, headers_only)
+
+    workers = settings.EMAIL_PARSE_WORKERS
+    chunk_size = -(-len(items) // workers)
+    chunks = await asyncio.gather(
+        *(
+            loop.run_in_executor(
+                executor, parse_batch, items[start : start + chunk_size], headers_only
+            )
+            for start in range(0, len(items), chunk_size)
+        )
+    )
+    return [parsed for chunk in chunks for parsed in chunk]
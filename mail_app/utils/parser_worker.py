@@ -0,0 +1,49 @@
+"""
+Entry points of the MIME parser processes.
+
+Spawned processes unpickle these functions before Django is set up, so this module
+must not import models or settings at import time.
+"""
+
+
+def init_worker():
+    """Sets up Django in a freshly spawned parser process."""
+    import django
+
+    django.setup()
+
+
+def parse_batch(items, headers_only):
+    """
+    Parses ``(uid, raw, size)`` tuples; the unit of work sent to a pool process.
+
+    A message that cannot be parsed yields a ParseFailure instead of failing the batch.
+    """
+    from mail_app.utils.mime_parser import ParseFailure, parse_message
+
+    results = []
+    for uid, raw_email, size in items:
+        try:
+            results.append(parse_message(uid, raw_email, size, headers_only))
+        except Exception as e:
+            results.append(ParseFailure(uid, f"{type(e).__name__}: {e}"))
+    return results
+
+
+def reparse_archived(items):
+    """
+    Parses messages read from the raw archive, given as ``(uid, segment, offset,
+    length)`` tuples, so only their locations are sent to the pool process.
+    """
+    from mail_app.utils.mime_parser import ParseFailure
+    from mail_app.utils.raw_archive import read_message
+
+    results = []
+    for uid, segment, offset, length in items:
+        try:
+            raw_email = read_message(segment, offset, length)
+        except Exception as e:
+            results.append(ParseFailure(uid, f"{type(e).__name__}: {e}"))
+            continue
+        results.extend(parse_batch([(uid, raw_email, len(raw_email))], False))
+    return results
@@ -0,0 +1,226 @@
+"""
+Rate and concurrency limits of the IMAP commands sent to each email provider.
+
+Logins and mailbox commands (SELECT, SEARCH, FETCH) take a token from a per-provider
+token bucket, so bursts stay within ``IMAP_LOGIN_RATE`` / ``IMAP_COMMAND_RATE``. The
+number of commands in flight per provider is adjusted with AIMD: it grows by one per
+round of successful commands and is cut back when commands get slower than
+``IMAP_LATENCY_TARGET`` or the server throttles (``[THROTTLED]``, ``[UNAVAILABLE]``,
+``[LIMIT]``). A throttled provider is also paused for a cooldown that doubles while
+it keeps throttling. Only small commands (SELECT, SEARCH, flag and header fetches)
+measure latency, as message body fetches take as long as the messages are big.
+
+Limits apply per process; ``IMAP_PROVIDER_LIMITS`` overrides them per provider.
+"""
+
+import asyncio
+import re
+import time
+import weakref
+from collections import deque
+from contextlib import asynccontextmanager
+from django.conf import settings
+from mail_app.utils import metrics
+
+_THROTTLED_RE = re.compile(r"\[(THROTTLED|UNAVAILABLE|LIMIT)\]", re.IGNORECASE)
+# Factors applied to the concurrency limit on throttling and on high latency
+_THROTTLE_DECREASE = 0.5
+_LATENCY_DECREASE = 0.8
+# Weight of the latest command in the smoothed latency
+_LATENCY_SMOOTHING = 0.2
+
+_limiters = weakref.WeakKeyDictionary()
+
+
+def get_provider_limiter(provider):
+    """
+    Returns the limiter of a provider for the running event loop.
+
+    Args:
+        provider (str): The provider of the account.
+
+    Returns:
+        ProviderLimiter: The limiter.
+    """
+    loop = asyncio.get_running_loop()
+    limiters = _limiters.setdefault(loop, {})
+    if provider not in limiters:
+        limiters[provider] = ProviderLimiter(provider)
+    return limiters[provider]
+
+
+def is_throttled(text):
+    """Returns whether a server response or error text reports throttling."""
+    return bool(_THROTTLED_RE.search(text))
+
+
+def _limit(provider, name):
+    """Returns a limit setting, overridden for the provider in IMAP_PROVIDER_LIMITS."""
+    return settings.IMAP_PROVIDER_LIMITS.get(provider, {}).get(
+        name, getattr(settings, name)
+    )
+
+
+class TokenBucket:
+    """
+    Token bucket holding up to ``burst`` tokens, refilled at ``rate`` tokens a second.
+
+    A rate of 0 disables the bucket.
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+
+    async def acquire(self):
+        """Takes a token, waiting until one is available."""
+        if self.rate <= 0:
+            return
+        while True:
+            now = time.monotonic()
+            self.tokens = min(
+                self.burst, self.tokens + (now - self.updated) * self.rate
+            )
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class _Slot:
+    """The outcome of a command run in a limiter slot."""
+
+    throttled = False
+
+
+class ProviderLimiter:
+    """
+    Rate limits and AIMD concurrency limit of the IMAP commands sent to a provider.
+
+    Attributes:
+        provider (str): The provider.
+        limit (float): The current number of commands allowed in flight.
+        in_flight (int): Commands currently running.
+        latency (float): Smoothed duration of the recent commands in seconds, or None.
+    """
+
+    def __init__(self, provider):
+        self.provider = provider
+        self.buckets = {
+            "login": TokenBucket(
+                _limit(provider, "IMAP_LOGIN_RATE"),
+                _limit(provider, "IMAP_LOGIN_BURST"),
+            ),
+            "command": TokenBucket(
+                _limit(provider, "IMAP_COMMAND_RATE"),
+                _limit(provider, "IMAP_COMMAND_BURST"),
+            ),
+        }
+        self.min_limit = max(_limit(provider, "IMAP_CONCURRENCY_MIN"), 1)
+        self.max_limit = max(_limit(provider, "IMAP_CONCURRENCY_MAX"), self.min_limit)
+        self.latency_target = _limit(provider, "IMAP_LATENCY_TARGET")
+        self.base_cooldown = _limit(provider, "IMAP_THROTTLE_COOLDOWN")
+        # Start halfway, as nothing is known about the provider's load yet
+        self.limit = float(max(self.max_limit // 2, self.min_limit))
+        self.in_flight = 0
+        self.latency = None
+        self.cooldown = self.base_cooldown
+        self.paused_until = 0
+        self.decreased_at = 0
+        self._waiters = deque()
+        metrics.IMAP_CONCURRENCY_LIMIT.labels(provider).set(self.limit)
+
+    @asynccontextmanager
+    async def slot(self, kind, timed=True):
+        """
+        Runs a command within the limits: waits out a throttling cooldown, takes a
+        token of the ``kind`` bucket ("login" or "command") and a concurrency slot.
+        The duration of a ``timed`` command updates the smoothed latency.
+
+        Yields:
+            _Slot: Set its ``throttled`` attribute if the server throttled the command.
+        """
+        while (delay := self.paused_until - time.monotonic()) > 0:
+            await asyncio.sleep(delay)
+        await self.buckets[kind].acquire()
+        await self._acquire()
+        slot = _Slot()
+        started = time.monotonic()
+        try:
+            yield slot
+        finally:
+            self.in_flight -= 1
+            seconds = time.monotonic() - started if timed else None
+            self._record(kind, slot.throttled, seconds)
+            self._wake()
+
+    async def _acquire(self):
+        """Waits until a command may start under the concurrency limit."""
+        while self.in_flight >= int(self.limit):
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                # Pass on a wake-up that arrived together with the cancellation
+                if waiter.done() and not waiter.cancelled():
+                    self._wake()
+                raise
+            finally:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+        self.in_flight += 1
+
+    def _wake(self):
+        """Wakes as many waiting commands as the limit leaves room for."""
+        free = int(self.limit) - self.in_flight
+        while free > 0 and self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                free -= 1
+
+    def _record(self, kind, throttled, seconds):
+        """
+        Adjusts the limit and cooldown to the outcome of a command, taking ``None``
+        seconds for a command that does not measure latency.
+        """
+        now = time.monotonic()
+        if throttled:
+            metrics.IMAP_THROTTLED.labels(self.provider).inc()
+            if now >= self.paused_until:
+                self.paused_until = now + self.cooldown
+                self.cooldown = min(
+                    self.cooldown * 2,
+                    _limit(self.provider, "IMAP_THROTTLE_MAX_COOLDOWN"),
+                )
+            self._decrease(_THROTTLE_DECREASE, now)
+            return
+
+        self.cooldown = self.base_cooldown
+        if kind == "command" and seconds is not None:
+            # Logins include the TLS handshake, so only commands measure load
+            self.latency = (
+                seconds
+                if self.latency is None
+                else (1 - _LATENCY_SMOOTHING) * self.latency
+                + _LATENCY_SMOOTHING * seconds
+            )
+        if self.latency is not None and self.latency > self.latency_target:
+            self._decrease(_LATENCY_DECREASE, now)
+        else:
+            # One more slot per round of ``limit`` successful commands
+            self.limit = min(self.limit + 1 / self.limit, self.max_limit)
+            metrics.IMAP_CONCURRENCY_LIMIT.labels(self.provider).set(self.limit)
+
+    def _decrease(self, factor, now):
+        """Cuts the limit back, at most once per latency target."""
+        # Commands that were in flight during a decrease report the same overload
+        if now - self.decreased_at < self.latency_target:
+            return
+        self.decreased_at = now
+        self.limit = max(self.limit * factor, self.min_limit)
+        metrics.IMAP_CONCURRENCY_LIMIT.labels(self.provider).set(self.limit)
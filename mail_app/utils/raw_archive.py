@@ -0,0 +1,108 @@
+"""
+Archive of raw RFC822 messages in append-only segment files.
+
+Every fetched message is compressed on its own with zlib and appended to the current
+segment, ``<EMAIL_RAW_ARCHIVE_DIR>/<segment>.seg``. A segment is closed once it would
+grow beyond ``EMAIL_RAW_ARCHIVE_SEGMENT_SIZE`` and is never written again. The location
+of a message, ``(segment, offset, length)``, is kept on its EmailMessage row, so it can
+be re-parsed without fetching it from IMAP again.
+
+This module must not import models, as parser processes read the archive.
+"""
+
+import fcntl
+import mmap
+import os
+import zlib
+from django.conf import settings
+
+_SUFFIX = ".seg"
+
+# Memory maps of the segments read by this process, by segment number
+_maps = {}
+
+
+def is_enabled():
+    """Returns whether fetched messages are archived."""
+    return bool(settings.EMAIL_RAW_ARCHIVE_DIR)
+
+
+def segment_path(segment):
+    """Returns the path of a segment file by its number."""
+    return os.path.join(settings.EMAIL_RAW_ARCHIVE_DIR, f"{segment:06d}{_SUFFIX}")
+
+
+def _last_segment():
+    """Returns the number of the newest segment, or 1 if the archive is empty."""
+    numbers = [
+        int(name[: -len(_SUFFIX)])
+        for name in os.listdir(settings.EMAIL_RAW_ARCHIVE_DIR)
+        if name.endswith(_SUFFIX) and name[: -len(_SUFFIX)].isdigit()
+    ]
+    return max(numbers, default=1)
+
+
+def archive_messages(raw_emails):
+    """
+    Appends raw messages to the archive, compressing each of them separately.
+
+    A batch is written with a single append under an exclusive lock on the archive, so
+    processes syncing at the same time never interleave their writes. The data is
+    synced to disk before the locations are returned.
+
+    Args:
+        raw_emails (list): The raw messages (bytes).
+
+    Returns:
+        list: ``(segment, offset, length)`` tuples in the order of ``raw_emails``.
+    """
+    records = [zlib.compress(raw_email) for raw_email in raw_emails]
+    batch_size = sum(map(len, records))
+    os.makedirs(settings.EMAIL_RAW_ARCHIVE_DIR, exist_ok=True)
+
+    with open(os.path.join(settings.EMAIL_RAW_ARCHIVE_DIR, "lock"), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        segment = _last_segment()
+        path = segment_path(segment)
+        size = os.path.getsize(path) if os.path.exists(path) else 0
+        if size and size + batch_size > settings.EMAIL_RAW_ARCHIVE_SEGMENT_SIZE:
+            segment += 1
+            path = segment_path(segment)
+        with open(path, "ab") as segment_file:
+            offset = segment_file.tell()
+            segment_file.write(b"".join(records))
+            segment_file.flush()
+            os.fsync(segment_file.fileno())
+
+    locations = []
+    for record in records:
+        locations.append((segment, offset, len(record)))
+        offset += len(record)
+    return locations
+
+
+def read_message(segment, offset, length):
+    """
+    Reads a raw message back from the archive.
+
+    Segments are memory-mapped once per process; the current segment is mapped again
+    when a message beyond the end of the previous mapping is read.
+
+    Args:
+        segment (int): The segment number.
+        offset (int): The offset of the compressed message in the segment.
+        length (int): The compressed length.
+
+    Returns:
+        bytes: The raw message.
+    """
+    mapped = _maps.get(segment)
+    if mapped is None or offset + length > len(mapped):
+        if mapped is not None:
+            mapped.close()
+        with open(segment_path(segment), "rb") as segment_file:
+            mapped = mmap.mmap(segment_file.fileno(), 0, access=mmap.ACCESS_READ)
+        _maps[segment] = mapped
+    if offset + length > len(mapped):
+        raise ValueError(f"Message at {segment}:{offset} is beyond the segment end.")
+    return zlib.decompress(mapped[offset : offset + length])
@@ -0,0 +1,111 @@
+import hashlib
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+from rest_framework.response import Response
+from mail_app.utils.attachment_downloads import url_window
+
+_ALL_ACCOUNTS = "all"
+
+
+def _version_key(account_id):
+    return f"email-api:version:{account_id}"
+
+
+def get_version(account_id=None):
+    """
+    Returns the data version of an account, or of all accounts if none is given.
+
+    A version is the time of the last change, so it doubles as ``Last-Modified``. A
+    version missing from the cache, e.g. after an eviction, restarts at the current time,
+    which invalidates every response cached under the previous one.
+
+    Args:
+        account_id (int, optional): The email account id.
+
+    Returns:
+        float: The version as a Unix timestamp.
+    """
+    key = _version_key(account_id or _ALL_ACCOUNTS)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def invalidate_account(account_id):
+    """
+    Marks the cached API responses of an account, and of all accounts, as stale.
+
+    Args:
+        account_id (int): The email account whose emails changed.
+
+    Returns:
+        None
+    """
+    version = time.time()
+    cache.set_many(
+        {
+            _version_key(account_id): version,
+            _version_key(_ALL_ACCOUNTS): version,
+        },
+        timeout=None,
+    )
+
+
+def cached_response(request, version, build):
+    """
+    Serves a GET from the response cache, answering conditional requests with 304.
+
+    Responses are cached by URL, accepted media type, data version and the issue
+    window of the signed attachment URLs they embed (see ``url_window``), and carry an
+    ``ETag`` and ``Last-Modified`` derived from them. ``Cache-Control: no-cache`` makes
+    browsers revalidate, which costs them a 304 while the data is unchanged and the
+    URLs have not been reissued.
+
+    Args:
+        request (Request): The API request.
+        version (float): The data version the response depends on, from ``get_version``.
+        build (function): Returns the Response to serve on a cache miss. Responses
+            other than 200 and responses with ``cacheable = False`` are not cached.
+
+    Returns:
+        HttpResponse: The cached, fresh or 304 response.
+    """
+    issued = url_window()
+    digest = hashlib.sha1(
+        "|".join(
+            [
+                request.get_full_path(),
+                request.accepted_media_type,
+                repr(version),
+                repr(issued),
+            ]
+        ).encode()
+    ).hexdigest()
+    etag = f'"{digest}"'
+    last_modified = int(max(version, issued))
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        key = f"email-api:response:{digest}"
+        data = cache.get(key)
+        if data is not None:
+            response = Response(data)
+        else:
+            response = build()
+            if response.status_code != 200 or not getattr(response, "cacheable", True):
+                return response
+            # Kept below the lifetime of the download URLs in the payload
+            timeout = min(
+                settings.EMAIL_API_CACHE_TIMEOUT, settings.ATTACHMENT_URL_MAX_AGE // 2
+            )
+            cache.set(key, response.data, timeout)
+
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(last_modified)
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
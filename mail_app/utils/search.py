@@ -0,0 +1,96 @@
+from django.conf import settings
+from django.contrib.postgres.search import SearchHeadline, SearchQuery, SearchVector
+from django.db.models import OuterRef, Subquery
+from django.db.models.functions import Left
+from django.utils.html import escape
+from mail_app.models import EmailBody
+
+# Characters of the body that are indexed; tsvector positions stop at 16383 anyway
+_INDEXED_BODY_LENGTH = 100_000
+# Private-use characters marking the matched terms of a headline until it is escaped
+_MARK_START = "\ue000"
+_MARK_STOP = "\ue001"
+
+
+def search_vector():
+    """
+    Returns the expression of the full-text document of an email.
+
+    The subject weighs most, then the sender, then the body, which affects ranking.
+    """
+    config = settings.EMAIL_SEARCH_CONFIG
+    body = Subquery(
+        EmailBody.objects.filter(pk=OuterRef("content_id")).values(
+            indexed_text=Left("text", _INDEXED_BODY_LENGTH)
+        )
+    )
+    return (
+        SearchVector("subject", weight="A", config=config)
+        + SearchVector("from_address", weight="B", config=config)
+        + SearchVector(body, weight="C", config=config)
+    )
+
+
+def update_search_vectors(queryset):
+    """
+    Recomputes the search vector of the emails in a queryset with a single UPDATE.
+
+    Args:
+        queryset (QuerySet): The EmailMessage rows whose text was written or changed.
+
+    Returns:
+        int: The number of updated rows.
+    """
+    return queryset.update(search_vector=search_vector())
+
+
+def search_query(text):
+    """
+    Parses user input with ``websearch_to_tsquery``, which accepts quoted phrases,
+    ``or`` and ``-word`` and never raises a syntax error.
+    """
+    return SearchQuery(
+        text, search_type="websearch", config=settings.EMAIL_SEARCH_CONFIG
+    )
+
+
+def search_headline(query):
+    """
+    Returns the expression of an email's headline: an excerpt of the body around the
+    matched terms, which are delimited with sentinels for ``mark_headline``.
+
+    Args:
+        query (SearchQuery): The search query.
+
+    Returns:
+        SearchHeadline: The expression, to annotate EmailMessage rows with.
+    """
+    return SearchHeadline(
+        "content__text",
+        query,
+        config=settings.EMAIL_SEARCH_CONFIG,
+        start_sel=_MARK_START,
+        stop_sel=_MARK_STOP,
+        max_words=35,
+        min_words=15,
+    )
+
+
+def mark_headline(headline):
+    """
+    Turns a headline computed by ``search_headline`` into HTML.
+
+    The excerpt is email text, so it is escaped before the matched terms are put in
+    ``<mark>`` tags.
+
+    Args:
+        headline (str): The headline, or None.
+
+    Returns:
+        str: The HTML headline, or None.
+    """
+    if headline is None:
+        return None
+    return (
+        escape(headline).replace(_MARK_START, "<mark>").replace(_MARK_STOP, "</mark>")
+    )
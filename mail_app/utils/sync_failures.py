@@ -0,0 +1,124 @@
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from mail_app.models import SyncFailure
+
+
+def retry_delay(attempts):
+    """
+    Returns the seconds to wait before retrying a message that failed ``attempts`` times.
+
+    The delay doubles with every attempt, from ``EMAIL_SYNC_RETRY_BASE`` up to
+    ``EMAIL_SYNC_RETRY_MAX_BACKOFF``.
+    """
+    return min(
+        settings.EMAIL_SYNC_RETRY_BASE * 2 ** (attempts - 1),
+        settings.EMAIL_SYNC_RETRY_MAX_BACKOFF,
+    )
+
+
+def record_failures(account, stage, errors):
+    """
+    Records failed attempts for messages and schedules their retry.
+
+    A message is quarantined, i.e. no longer retried, once it has failed
+    ``EMAIL_SYNC_RETRY_MAX_ATTEMPTS`` times.
+
+    Args:
+        account (EmailAccount): The email account the messages belong to.
+        stage (str): The SyncStage that failed.
+        errors (dict): Error messages by UID.
+
+    Returns:
+        list: The UIDs that are quarantined now.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        failures = {
+            failure.uid: failure
+            for failure in SyncFailure.objects.select_for_update().filter(
+                email_account=account, stage=stage, uid__in=list(errors)
+            )
+        }
+        new_failures = []
+        for uid, error in errors.items():
+            failure = failures.get(uid)
+            if failure is None:
+                failure = SyncFailure(
+                    email_account=account, uid=uid, stage=stage, attempts=0
+                )
+                new_failures.append(failure)
+            failure.attempts += 1
+            failure.error = error
+            failure.next_retry_at = now + timedelta(
+                seconds=retry_delay(failure.attempts)
+            )
+            failure.quarantined = (
+                failure.attempts >= settings.EMAIL_SYNC_RETRY_MAX_ATTEMPTS
+            )
+            failure.updated_at = now
+
+        SyncFailure.objects.bulk_create(new_failures)
+        SyncFailure.objects.bulk_update(
+            list(failures.values()),
+            ["attempts", "error", "next_retry_at", "quarantined", "updated_at"],
+        )
+        failures.update((failure.uid, failure) for failure in new_failures)
+    return [uid for uid, failure in failures.items() if failure.quarantined]
+
+
+def clear_failures(account, stage, uids):
+    """
+    Forgets the failures of messages that were synced or have left the mailbox.
+
+    Args:
+        account (EmailAccount): The email account the messages belong to.
+        stage (str): The SyncStage the messages failed in.
+        uids (iterable): UIDs of the messages.
+
+    Returns:
+        None
+    """
+    SyncFailure.objects.filter(
+        email_account=account, stage=stage, uid__in=list(uids)
+    ).delete()
+
+
+def due_failure_uids(account, stage):
+    """
+    Returns the sorted UIDs of failed messages whose retry is due.
+
+    Args:
+        account (EmailAccount): The email account.
+        stage (str): The SyncStage to retry.
+
+    Returns:
+        list: UIDs (str), lowest first.
+    """
+    uids = SyncFailure.objects.filter(
+        email_account=account,
+        stage=stage,
+        quarantined=False,
+        next_retry_at__lte=timezone.now(),
+    ).values_list("uid", flat=True)
+    return sorted(uids, key=int)
+
+
+def waiting_failure_uids(account, stage):
+    """
+    Returns the UIDs of failed messages that are quarantined or not due for a retry yet.
+
+    Args:
+        account (EmailAccount): The email account.
+        stage (str): The SyncStage.
+
+    Returns:
+        set: UIDs (str).
+    """
+    now = timezone.now()
+    return set(
+        SyncFailure.objects.filter(email_account=account, stage=stage)
+        .exclude(quarantined=False, next_retry_at__lte=now)
+        .values_list("uid", flat=True)
+    )
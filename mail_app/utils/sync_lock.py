@@ -0,0 +1,172 @@
+import asyncio
+import logging
+import threading
+import time
+import uuid
+import weakref
+from contextlib import asynccontextmanager
+from django.conf import settings
+
+_RENEW_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("pexpire", KEYS[1], ARGV[2])
+end
+return 0
+"""
+_RELEASE_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+logger = logging.getLogger(__name__)
+
+_clients = weakref.WeakKeyDictionary()
+_local_leases = set()
+_local_lock = threading.Lock()
+
+
+def _get_redis():
+    """Returns the lease Redis client of the running event loop, or None if unset."""
+    if not settings.EMAIL_SYNC_LEASE_REDIS_URL:
+        return None
+    loop = asyncio.get_running_loop()
+    if loop not in _clients:
+        import redis.asyncio
+
+        _clients[loop] = redis.asyncio.Redis.from_url(
+            settings.EMAIL_SYNC_LEASE_REDIS_URL
+        )
+    return _clients[loop]
+
+
+class LeaseLost(Exception):
+    """Raised in a sync whose lease expired or was taken over by another process."""
+
+
+class SyncLease:
+    """
+    Expiring lease that allows a single sync of an account across all processes.
+
+    The lease is a Redis key holding a random token, set with NX and a TTL of
+    ``EMAIL_SYNC_LEASE_TTL`` seconds and renewed while the sync runs, so a crashed
+    holder releases it by expiry. Without ``EMAIL_SYNC_LEASE_REDIS_URL`` the lease
+    only covers the current process.
+    """
+
+    def __init__(self, account_id):
+        self.key = f"email-sync:lease:{account_id}"
+        self.token = uuid.uuid4().hex
+        self.ttl_ms = settings.EMAIL_SYNC_LEASE_TTL * 1000
+
+    async def acquire(self):
+        """Takes the lease if it is free and returns whether it was taken."""
+        client = _get_redis()
+        if client is None:
+            with _local_lock:
+                if self.key in _local_leases:
+                    return False
+                _local_leases.add(self.key)
+                return True
+        return bool(await client.set(self.key, self.token, nx=True, px=self.ttl_ms))
+
+    async def renew(self):
+        """Extends the lease; returns False if it was lost in the meantime."""
+        client = _get_redis()
+        if client is None:
+            return True
+        return bool(
+            await client.eval(_RENEW_SCRIPT, 1, self.key, self.token, self.ttl_ms)
+        )
+
+    async def release(self):
+        """Releases the lease if it is still held by this instance."""
+        client = _get_redis()
+        if client is None:
+            with _local_lock:
+                _local_leases.discard(self.key)
+            return
+        await client.eval(_RELEASE_SCRIPT, 1, self.key, self.token)
+
+    async def is_held(self):
+        """Returns whether any process currently holds the lease."""
+        client = _get_redis()
+        if client is None:
+            return self.key in _local_leases
+        return bool(await client.exists(self.key))
+
+    async def keep_renewed(self, task):
+        """
+        Renews the lease at a third of its TTL until cancelled.
+
+        Failed renewals are retried until the TTL has passed. Once the lease is lost,
+        ``task`` is cancelled, so its sync stops before another one takes over.
+
+        Args:
+            task (asyncio.Task): The task running the sync guarded by the lease.
+
+        Returns:
+            bool: False once the lease is lost.
+        """
+        renewed_at = time.monotonic()
+        while True:
+            await asyncio.sleep(self.ttl_ms / 3000)
+            try:
+                if not await self.renew():
+                    break
+                renewed_at = time.monotonic()
+            except Exception:
+                logger.warning("Could not renew %s", self.key, exc_info=True)
+                if time.monotonic() - renewed_at >= self.ttl_ms / 1000:
+                    break
+        logger.error("Lost %s, stopping its sync", self.key)
+        task.cancel()
+        return False
+
+
+@asynccontextmanager
+async def account_sync_lease(account, wait=False):
+    """
+    Holds the sync lease of an account for the duration of the block.
+
+    Args:
+        account (EmailAccount): The account about to be synced.
+        wait (bool): Whether to wait for a running sync to finish and then take the
+            lease, instead of giving up at once.
+
+    Yields:
+        bool: Whether the lease is held. When False, another sync is running.
+
+    Raises:
+        LeaseLost: If the lease could not be renewed, which stops the block.
+    """
+    lease = SyncLease(account.pk)
+    acquired = await lease.acquire()
+    while wait and not acquired:
+        await asyncio.sleep(settings.EMAIL_SYNC_LEASE_POLL)
+        acquired = await lease.acquire()
+    if not acquired:
+        yield False
+        return
+
+    task = asyncio.current_task()
+    renewer = asyncio.ensure_future(lease.keep_renewed(task))
+    try:
+        yield True
+    except asyncio.CancelledError:
+        if renewer.done() and not renewer.cancelled():
+            # Cancelled by the renewer rather than by the caller
+            task.uncancel()
+            raise LeaseLost(f"Lost {lease.key} during the sync") from None
+        raise
+    finally:
+        renewer.cancel()
+        await lease.release()
+
+
+async def wait_for_sync(account):
+    """Waits until no process holds the sync lease of the account."""
+    lease = SyncLease(account.pk)
+    while await lease.is_held():
+        await asyncio.sleep(settings.EMAIL_SYNC_LEASE_POLL)
@@ -0,0 +1,131 @@
+from collections import defaultdict
+from django.db.models import Count, Max, OuterRef, Q, Subquery
+from mail_app.models import EmailMessage, Thread
+
+
+def assign_threads(account, email_messages):
+    """
+    Adds newly stored messages of an account to their conversations.
+
+    Messages are related through their Message-ID, In-Reply-To and References headers,
+    in both directions, so a reply stored before its parent is joined once the parent
+    arrives, and replies to the same missing parent end up together. Conversations
+    that a new message connects are merged into the oldest one. Must run inside a
+    transaction.
+
+    Args:
+        account (EmailAccount): The email account the messages belong to.
+        email_messages (list): Saved EmailMessage objects without a thread.
+
+    Returns:
+        None
+    """
+    if not email_messages:
+        return
+    linked_ids = set().union(*map(_linked_ids, email_messages))
+    # Replies to a parent that is not stored, e.g. one in Sent, only share its ID
+    related = list(
+        EmailMessage.objects.filter(email_account=account, thread__isnull=False)
+        .filter(
+            Q(message_id__in=linked_ids)
+            | Q(in_reply_to__in=linked_ids)
+            | Q(references__overlap=list(linked_ids))
+        )
+        .only("message_id", "in_reply_to", "references", "thread_id")
+    )
+
+    # Union-find over the messages, the Message-IDs they mention and their threads
+    parents = {}
+
+    def find(node):
+        while parents.setdefault(node, node) != node:
+            parents[node] = parents[parents[node]]
+            node = parents[node]
+        return node
+
+    def union(first, *others):
+        for other in others:
+            parents[find(other)] = find(first)
+
+    for email_msg in email_messages:
+        union(
+            ("message", email_msg.pk), *(("id", id_) for id_ in _linked_ids(email_msg))
+        )
+    threads_of_group = defaultdict(set)
+    for email_msg in related:
+        union(
+            ("thread", email_msg.thread_id),
+            *(("id", id_) for id_ in _linked_ids(email_msg))
+        )
+    for email_msg in related:
+        threads_of_group[find(("thread", email_msg.thread_id))].add(email_msg.thread_id)
+
+    thread_of_group, merged, new_threads = {}, defaultdict(list), []
+    for email_msg in email_messages:
+        group = find(("message", email_msg.pk))
+        if group in thread_of_group:
+            continue
+        existing = sorted(threads_of_group.get(group, ()))
+        if existing:
+            thread_of_group[group] = existing[0]
+            merged[existing[0]].extend(existing[1:])
+        else:
+            thread = Thread(email_account=account)
+            new_threads.append(thread)
+            thread_of_group[group] = thread
+    Thread.objects.bulk_create(new_threads)
+
+    for email_msg in email_messages:
+        thread = thread_of_group[find(("message", email_msg.pk))]
+        email_msg.thread_id = getattr(thread, "pk", thread)
+    EmailMessage.objects.bulk_update(email_messages, ["thread"])
+    for target, sources in merged.items():
+        if sources:
+            EmailMessage.objects.filter(thread__in=sources).update(thread=target)
+            Thread.objects.filter(pk__in=sources).delete()
+    refresh_threads({email_msg.thread_id for email_msg in email_messages})
+
+
+def refresh_threads(thread_ids):
+    """
+    Recomputes the subject, message count and latest message of threads with one UPDATE.
+
+    Args:
+        thread_ids (iterable): Primary keys of the threads.
+
+    Returns:
+        int: The number of updated threads.
+    """
+    messages = EmailMessage.objects.filter(thread=OuterRef("pk")).order_by()
+    return Thread.objects.filter(pk__in=list(thread_ids)).update(
+        subject=Subquery(messages.order_by("sent_at", "id").values("subject")[:1]),
+        message_count=Subquery(
+            messages.values("thread").annotate(count=Count("id")).values("count")
+        ),
+        last_message_at=Subquery(
+            messages.values("thread").annotate(last=Max("sent_at")).values("last")
+        ),
+    )
+
+
+def prune_threads(thread_ids):
+    """
+    Updates threads after messages were removed from them, deleting the empty ones.
+
+    A thread is not split when a message linking two parts of it is removed.
+
+    Args:
+        thread_ids (iterable): Primary keys of the threads.
+
+    Returns:
+        None
+    """
+    thread_ids = list(thread_ids)
+    Thread.objects.filter(pk__in=thread_ids, messages=None).delete()
+    refresh_threads(thread_ids)
+
+
+def _linked_ids(email_msg):
+    """Returns the Message-IDs a message has or refers to."""
+    ids = {email_msg.message_id, email_msg.in_reply_to, *email_msg.references}
+    return ids - {None, ""}
@@ -0,0 +1,108 @@
+import asyncio
+import json
+import logging
+from asgiref.sync import sync_to_async
+from channels.consumer import AsyncConsumer
+from django.conf import settings
+from .models import EmailAccount, EmailMessage
+from mail_app.utils.broadcast import broadcast
+from mail_app.utils.email_service import fetch_email_body, fetch_emails_for_account
+from mail_app.utils.metrics import start_metrics_server
+
+SYNC_CHANNEL = "email-sync"
+
+logger = logging.getLogger(__name__)
+
+
+class EmailSyncWorker(AsyncConsumer):
+    """
+    Channels worker that runs email sync jobs taken from the ``email-sync`` channel.
+
+    Started with ``manage.py runworker email-sync``; several worker processes share
+    the channel. Each job syncs the requested accounts in the background, at most one
+    sync per account and ``EMAIL_SYNC_MAX_CONCURRENCY`` syncs overall per worker, and
+    publishes progress to the email updates group. It also loads the bodies of messages
+    stored from their headers only when the API asks for them.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.running = {}
+        self.loading = {}
+        self.jobs = set()
+        self.slots = asyncio.Semaphore(settings.EMAIL_SYNC_MAX_CONCURRENCY)
+        start_metrics_server()
+
+    async def sync_request(self, message):
+        """
+        Schedules a sync job and returns at once, so the next job can be received.
+
+        Args:
+            message (dict): ``{"type": "sync.request"}``, optionally with
+                ``account_ids`` to restrict the job to some accounts.
+        """
+        accounts = EmailAccount.objects.all()
+        if message.get("account_ids"):
+            accounts = accounts.filter(pk__in=message["account_ids"])
+        accounts = await sync_to_async(list)(accounts)
+
+        if not accounts:
+            await broadcast(json.dumps({"error": "No email accounts configured."}))
+            return
+        job = asyncio.ensure_future(
+            self.run_job([self.sync_account(account) for account in accounts])
+        )
+        self.jobs.add(job)
+        job.add_done_callback(self.jobs.discard)
+
+    async def body_request(self, message):
+        """
+        Schedules loading the body of a message and returns at once.
+
+        Args:
+            message (dict): ``{"type": "body.request", "message_id": <pk>}``.
+        """
+        message_id = message["message_id"]
+        if message_id in self.loading:
+            return
+        task = asyncio.ensure_future(self.load_body(message_id))
+        self.loading[message_id] = task
+        task.add_done_callback(lambda _: self.loading.pop(message_id, None))
+
+    async def load_body(self, message_id):
+        """Loads the body of a message once a concurrency slot is free."""
+        email_msg = await (
+            EmailMessage.objects.select_related("email_account")
+            .filter(pk=message_id, body_loaded=False)
+            .afirst()
+        )
+        if email_msg is None:
+            return
+        async with self.slots:
+            try:
+                await fetch_email_body(email_msg)
+            except Exception:
+                # The next sync retries the body
+                logger.exception("Could not load the body of message %s", message_id)
+
+    def sync_account(self, account):
+        """Returns the task syncing the account, joining it if one is already running."""
+        task = self.running.get(account.pk)
+        if task is None:
+            task = asyncio.ensure_future(self.run_sync(account))
+            self.running[account.pk] = task
+            task.add_done_callback(lambda _: self.running.pop(account.pk, None))
+        return task
+
+    async def run_sync(self, account):
+        """Syncs one account once a concurrency slot is free."""
+        async with self.slots:
+            await fetch_emails_for_account(account, broadcast)
+
+    async def run_job(self, tasks):
+        """Waits for the syncs of a job and announces its completion."""
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                logger.error("Email sync failed", exc_info=result)
+        await broadcast(json.dumps({"status": "complete"}))
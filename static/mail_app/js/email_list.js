@@ -13,76 +13,157 @@ $(document).ready(function () {
         $('#progress-bar').css('width', progress + '%').text(progress + '%').attr('aria-valuenow', progress);
     }
 
-    // Add email to the table
-    function addEmailToTable(email) {
+    // Escape email text before it is put in the table markup
+    function escapeHtml(text) {
+        return $('<div>').text(text == null ? '' : text).html().replace(/"/g, '&quot;');
+    }
+
+    // Build the table row of an email; the search headline comes escaped, with the
+    // matched terms in <mark> tags
+    function emailRow(email) {
         let attachments = '';
         if (email.attachments) {
             email.attachments.forEach(att => {
-                attachments += `<a href="${att.url}" target="_blank">${att.filename}</a><br>`;
+                attachments += `<a href="${escapeHtml(att.url)}" target="_blank">${escapeHtml(att.filename)}</a><br>`;
             });
         }
 
-        const row = `
+        return `
                 <tr>
-                    <td>${email.subject}</td>
-                    <td>${email.from_address}</td>
-                    <td>${email.sent_at}</td>
-                    <td>${email.received_at}</td>
+                    <td>${escapeHtml(email.subject)}</td>
+                    <td>${escapeHtml(email.from_address)}</td>
+                    <td>${escapeHtml(email.sent_at)}</td>
+                    <td>${escapeHtml(email.received_at)}</td>
                     <td>${attachments}</td>
-                    <td>${email.body.substring(0, 50)}...</td>
+                    <td>${email.headline || escapeHtml((email.snippet || '').substring(0, 50)) + '...'}</td>
                 </tr>`;
-        $('#email-table tbody').append(row);
     }
 
-    // Fetch already processed emails on page load
+    // Add emails to the table with a single DOM update
+    function addEmailsToTable(emails) {
+        $('#email-table tbody').append(emails.filter(Boolean).map(emailRow).join(''));
+    }
+
+    // Fetch already processed emails page by page
+    const listFields = 'subject,from_address,sent_at,received_at,snippet,attachments';
+    let nextPage = `/api/processed_emails/?fields=${listFields}`;
+    let pageRequest = null;
+
     function loadProcessedEmails() {
-        $.getJSON('/api/processed_emails/', function (data) {
-            data.emails.forEach(email => {
-                addEmailToTable(email);
-            });
-            totalEmails = data.total_emails || 0;
-            processedEmails = data.processed_emails || 0;
-            updateProgressInfo();
+        if (!nextPage || pageRequest) {
+            return;
+        }
+        pageRequest = $.getJSON(nextPage, function (data) {
+            addEmailsToTable(data.emails);
+            if (data.total_emails !== undefined) {
+                totalEmails = data.total_emails || 0;
+                processedEmails = data.processed_emails || 0;
+                updateProgressInfo();
+            }
+            nextPage = data.next;
+            $('#load-more').toggle(Boolean(nextPage));
+        }).always(() => {
+            pageRequest = null;
         });
     }
 
-    // Call function to load already processed emails when page loads
+    // Search replaces the table with the matches, best first; an empty query lists all emails
+    $('#search-form').submit(function (e) {
+        e.preventDefault();
+        const query = $('#search-query').val().trim();
+        if (pageRequest) {
+            pageRequest.abort();
+        }
+        $('#email-table tbody').empty();
+        nextPage = query
+            ? `/api/search/?q=${encodeURIComponent(query)}&fields=${listFields},headline`
+            : `/api/processed_emails/?fields=${listFields}`;
+        loadProcessedEmails();
+    });
+
+    // Load the first page when the page loads, and the next ones on demand
     loadProcessedEmails();
+    $('#load-more').click(loadProcessedEmails);
+    $(window).scroll(function () {
+        if ($(window).scrollTop() + $(window).height() > $(document).height() - 200) {
+            loadProcessedEmails();
+        }
+    });
 
-    $('#fetch-mails').click(function () {
-        $(this).prop('disabled', true);
-        processedEmails = 0;
-        totalEmails = 0;
-        updateProgressInfo();
-        updateProgressBar(0);
+    // Inflates a binary frame; text frames are passed through
+    function frameText(frame) {
+        if (typeof frame === 'string') {
+            return Promise.resolve(frame);
+        }
+        return new Response(frame.stream().pipeThrough(new DecompressionStream('deflate'))).text();
+    }
 
-        // Open WebSocket connection
-        socket = new WebSocket((window.location.protocol === 'https:' ? 'wss://' : 'ws://') + window.location.host + '/ws/emails/');
+    function handleFrame(data) {
+        if (data.total_emails !== undefined) {
+            totalEmails = data.total_emails;
+        }
+        if (data.processed_emails !== undefined) {
+            processedEmails = data.processed_emails;
+            const progress = Math.min((processedEmails / totalEmails) * 100, 100);
+            updateProgressInfo();
+            updateProgressBar(progress);
+        }
 
-        socket.onmessage = function (e) {
-            const data = JSON.parse(e.data);
+        if (data.emails) {
+            addEmailsToTable(data.emails);
+        }
 
-            if (data.total_emails !== undefined) {
-                totalEmails = data.total_emails;
-            }
-            if (data.processed_emails !== undefined) {
-                processedEmails = data.processed_emails;
-                const progress = Math.min((processedEmails / totalEmails) * 100, 100);
-                updateProgressInfo();
-                updateProgressBar(progress);
-            }
+        if (data.status === 'complete') {
+            $('#fetch-mails').prop('disabled', false);
+            updateProgressBar(100);
+        }
+    }
 
-            if (data.email) {
-                addEmailToTable(data.email);
-            }
+    // Open the WebSocket connection with the page, so mail pushed by the IDLE listener
+    // arrives without a fetch; compressed frames are asked for if they can be inflated.
+    // The page keeps this one socket, as every open socket receives every broadcast
+    // frame, and reconnects it when it closes.
+    const deflate = 'DecompressionStream' in window;
+    const socketUrl = (window.location.protocol === 'https:' ? 'wss://' : 'ws://') + window.location.host + '/ws/emails/' + (deflate ? '?encoding=deflate' : '');
+    let reconnectDelay = 1000;
 
-            if (data.status === 'complete') {
-                $('#fetch-mails').prop('disabled', false);
-                updateProgressBar(100);
-            }
+    function connectSocket() {
+        socket = new WebSocket(socketUrl);
+        socket.binaryType = 'blob';
+
+        // Frames are inflated asynchronously, so they are chained to keep their order
+        let frames = Promise.resolve();
+        socket.onmessage = function (e) {
+            frames = frames
+                .then(() => frameText(e.data))
+                .then(text => handleFrame(JSON.parse(text)))
+                .catch(error => console.error(error));
         };
 
-        socket.onopen = () => socket.send(JSON.stringify({'action': 'start_fetching'}));
-        socket.onclose = () => $('#fetch-mails').prop('disabled', false);
+        socket.onopen = function () {
+            reconnectDelay = 1000;
+            $('#fetch-mails').prop('disabled', false);
+        };
+        socket.onclose = function () {
+            $('#fetch-mails').prop('disabled', true);
+            setTimeout(connectSocket, reconnectDelay);
+            reconnectDelay = Math.min(reconnectDelay * 2, 30000);
+        };
+    }
+
+    $('#fetch-mails').prop('disabled', true);
+    connectSocket();
+
+    // Fetches are requested over the open connection instead of a new one per click
+    $('#fetch-mails').click(function () {
+        if (socket.readyState !== WebSocket.OPEN) {
+            return;
+        }
+        $(this).prop('disabled', true);
+        processedEmails = 0;
+        totalEmails = 0;
+        updateProgressInfo();
+        updateProgressBar(0);
+        socket.send(JSON.stringify({'action': 'start_fetching'}));
     });
 });
\ No newline at end of file